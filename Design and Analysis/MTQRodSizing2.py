@@ -1,5 +1,17 @@
-from math import pi, sqrt
-from scipy.optimize import minimize, differential_evolution
+import argparse
+import csv
+import sys
+from functools import partial
+import numpy as np
+
+import instrument
+from evalcache import EvalCache, total_stats
+from gradcheck import check_jac
+from mtq_bnb import branch_and_bound
+from mtq_model import CORE_MATERIALS, PACKING_EFFICIENCY, copper_density, mu_0, rod
+from mtq_pareto import non_dominated
+from mtq_sweep import CachedSolver, sweep_cases, run_sweep
+from resultcache import add_cache_arguments, cache_from_args, code_version
 
 # Magnetorquer Rod Envelope Size
 H = 20            # Rod height [mm]
@@ -14,17 +26,8 @@ Lmax = L
 Rmin = 2.0      # Minimum core radius [mm]
 Rmax = H / 2      # Max winding radius [mm]
 
-# Core specifications
-mu_0 = 4 * pi * 1e-7  # Permeability of free space [H/m]
-
-mu_r = 2000           # Relative permeability
-B_saturation = 1.2    # Saturation flux density [T]
-core_density = 7500  # Density of core material [kg/m^3]
-
-# # Mu-metal
-# mu_r = 500000           # Relative permeability
-# B_saturation = 0.75    # Saturation flux density [T]
-# core_density = 7500  # Density of core material [kg/m^3]
+# Core specifications (mu_0 and the CORE_MATERIALS catalog are in mtq_model.py)
+CORE_MATERIAL = 'ferrite'   # Core material used unless one is passed explicitly
 
 # Electrical specifications
 Pmax = 1.5/0.8        # Max power [W]
@@ -43,11 +46,9 @@ AWG_TABLE = [
     (0.287, 0.268),  # AWG 29
     (0.320, 0.212),  # AWG 28
 ]
-PACKING_EFFICIENCY = 0.8    # Packing efficiency for winding
 N_LAYERS_MAX = 5            # Max number of layers for winding
-copper_density = 8960       # Density of copper [kg/m^3]
 
-def sizing(Lcore, Rcore, dwire, rho, nlayers):
+def sizing(Lcore, Rcore, dwire, rho, nlayers, relaxed=False, material=None):
     """
     Calculate the magnetorquer design parameters.
     Parameters:
@@ -56,169 +57,424 @@ def sizing(Lcore, Rcore, dwire, rho, nlayers):
         dwire (float): Wire diameter [mm]
         rho (float): Resistance per meter of wire [ohm/m]
         nlayers (int): Number of winding layers
+        relaxed (bool): Use a continuous turns per layer instead of rounding (see sizing_jac())
+        material (str): Key of CORE_MATERIALS, default CORE_MATERIAL
     Returns:
         dict: Design parameters including magnetic moment, number of turns, wire length, resistance, voltage, and power.
     """
 
-    # Convert to SI units
-    Lcore = Lcore * 1e-3  
-    Rcore = Rcore * 1e-3  
-    dwire = dwire * 1e-3  
-
-    # Winding calculations
-    nturns_per_layer = round(PACKING_EFFICIENCY * (Lcore / dwire))  # Turns per layer
-    N = nlayers * nturns_per_layer                                  # Total number of turns  
-    R_avg = Rcore + (nlayers * dwire) / 2                           # Average radius of winding [m]
-    wire_len = 2 * pi * R_avg * N                                   # Wire length [m]
-    
-    # Power calculations
-    Resistance = rho * wire_len # [ohm]
-    I = Vbus / Resistance  # Current [A]
-    Power = I**2 * Resistance   # [W]
-
-    # Magnetic moment calculations
-    Acore = pi * Rcore**2                                           # Core Area [m^2]
-    Nd = 1/((2*(Lcore/Rcore)/sqrt(pi))+1)                           # Demagnetization factor
-
-    M = N * I * Acore * (1 + ((mu_r - 1) / (1 + (mu_r - 1) * Nd)))  # Magnetic moment [A*m^2]
-
-    H = N * I / Lcore                                               # Applied Magnetic field strength by coil [A/m]
-    mu_eff = mu_0*(1 + ((mu_r - 1) / (1 + (mu_r - 1) * Nd)))        # Effective permeability
-    B = mu_eff*H           # Magnetic flux density [T] in core
-
-    
-    # Mass calculations
-    core_volume = Acore * Lcore  # Core volume [m^3]
-    core_mass = core_volume * core_density  # Core mass [kg]
-    wire_mass = wire_len * (pi*dwire**2 / 4) * copper_density  # Wire mass [kg]
-    mass = core_mass + wire_mass  # Total mass [kg]
-    Inductance = mu_eff * N**2 * (pi * (Rcore)**2)/Lcore  # Inductance [H]
+    result = rod(Lcore, Rcore, dwire, rho, nlayers, Vbus=Vbus, material=material or CORE_MATERIAL,
+                 relaxed=relaxed)
+    del result['Voltage [V]']  # Always Vbus
+    return result
 
-    return {
-        'Lcore [mm]': Lcore * 1e3,  
-        'Rcore [mm]': Rcore * 1e3,  
-        'dwire [mm]': dwire * 1e3,  
-        'nlayers': nlayers,
-        'I [A]': I,
-        'Turns per Layer': nturns_per_layer,
-        'Total Turns': N,
-        'Wire Length [m]': wire_len,
-        'M [A*m^2]': M,
-        'B [T]': B,
-        'Resistance [ohm]': Resistance,
-        'Power [W]': Power,
-        'Mass [kg]': mass,
-        'Inductance [H]': Inductance,
-        'Time Constant [ms]': Inductance/Resistance*1e3  # Time constant [ms]
-    }
+def sizing_batch(Lcore, Rcore, dwire, rho, nlayers, material=None):
+    """
+    Vectorised version of sizing() for evaluating many designs at once.
+    Inputs are broadcast against each other, so a scalar can be mixed with arrays.
+    Same model as sizing() (mtq_model.rod()), evaluated on the arrays.
+    Parameters:
+        Lcore (array_like): Length of the core [mm]
+        Rcore (array_like): Radius of the core [mm]
+        dwire (array_like): Wire diameter [mm]
+        rho (array_like): Resistance per meter of wire [ohm/m]
+        nlayers (array_like): Number of winding layers
+        material (str): Key of CORE_MATERIALS, default CORE_MATERIAL
+    Returns:
+        dict: Same keys as sizing(), each holding an array of the broadcast shape.
+    """
+
+    Lcore, Rcore, dwire, rho, nlayers = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (Lcore, Rcore, dwire, rho, nlayers)))
+    result = rod(Lcore, Rcore, dwire, rho, nlayers.astype(np.int64), Vbus=Vbus, material=material or CORE_MATERIAL)
+    del result['Voltage [V]']  # Always Vbus
+    return result
+
+def sizing_jac(Lcore, Rcore, dwire, rho, nlayers, material=None):
+    """
+    Hand-derived gradients of the sizing() outputs (mtq_model.rod(grad=True)) with respect to the design vector
+    x = (Lcore [mm], Rcore [mm]).
+    The turn count is relaxed to PACKING_EFFICIENCY * Lcore / dwire without rounding,
+    so these are the exact gradients of sizing(..., relaxed=True).
+    Parameters:
+        Same as sizing()
+    Returns:
+        dict: Gradient arrays of shape (2,) for 'M [A*m^2]', 'Power [W]', 'Mass [kg]'
+        and the radial constraint 'Rmax - Rwinding [mm]'.
+    """
+
+    _, grad = rod(Lcore, Rcore, dwire, rho, nlayers, Vbus=Vbus, material=material or CORE_MATERIAL,
+                  relaxed=True, grad=True)
+    jac = {key: grad[key][:2] for key in ('M [A*m^2]', 'Power [W]', 'Mass [kg]')}
+    jac['Rmax - Rwinding [mm]'] = np.array([0.0, -1.0])
+    return jac
 
 # ========= OPTIMISER =================================
 
-best_config = None
-best_moment = -1
-
-# Outer sweep over discrete variables: (AWG, nlayers)
-for dwire, rho in AWG_TABLE:
-    for nlayers in range(1, N_LAYERS_MAX+1):  # Discrete integer layers
-        def objective(x):
-            Lcore, Rcore = x
-            result = sizing(Lcore, Rcore, dwire, rho, nlayers)
-            return -result['M [A*m^2]']  # Maximize magnetic moment
-
-        def constraint_radial(x):
-            _, Rcore = x
-            return Rmax - (Rcore + nlayers * dwire)
-
-        def constraint_power(x):
-            Lcore, Rcore = x
-            return Pmax - sizing(Lcore, Rcore, dwire, rho, nlayers)['Power [W]']
-        
-        def constraint_mass(x):
-            Lcore, Rcore = x
-            return mass_max - sizing(Lcore, Rcore, dwire, rho, nlayers)['Mass [kg]']
-
-        constraints = [
-            {'type': 'ineq', 'fun': constraint_radial},
-            {'type': 'ineq', 'fun': constraint_power},
-            {'type': 'ineq', 'fun': constraint_mass}
-        ]
+@instrument.timed('mtq.solve_case')
+def solve_case(dwire, rho, nlayers, material=None, jac_mode='analytic'):
+    """
+    Solve the continuous sub-problem for one (AWG, nlayers, material) combination.
+    Parameters:
+        dwire (float): Wire diameter [mm]
+        rho (float): Resistance per meter of wire [ohm/m]
+        nlayers (int): Number of winding layers
+        material (str): Key of CORE_MATERIALS, default CORE_MATERIAL
+        jac_mode (str): 'analytic' passes sizing_jac() gradients to SLSQP,
+            'fd' lets SLSQP use finite differences,
+            'check' is 'analytic' plus a finite-difference check of every gradient
+    Returns:
+        tuple: (OptimizeResult, magnetic moment [A*m^2] at the solution)
+        The OptimizeResult carries the evaluation counters under 'cache_stats'
+        and, for jac_mode='check', the worst relative gradient error under 'grad_error'.
+    """
 
-        x0 = [50, 4]  # Initial guess: Lcore [mm], Rcore [mm]
-        bounds = [
-            (Lmin, Lmax),   # Lcore
-            (Rmin, Rmax),   # Rcore
+    # All callbacks share one sizing() evaluation per design point
+    model = EvalCache(partial(sizing, material=material))
+    model_jac = EvalCache(partial(sizing_jac, material=material))
+
+    def objective(x):
+        Lcore, Rcore = x
+        result = model(Lcore, Rcore, dwire, rho, nlayers)
+        return -result['M [A*m^2]']  # Maximize magnetic moment
+
+    def constraint_radial(x):
+        _, Rcore = x
+        return Rmax - (Rcore + nlayers * dwire)
+
+    def constraint_power(x):
+        Lcore, Rcore = x
+        return Pmax - model(Lcore, Rcore, dwire, rho, nlayers)['Power [W]']
+
+    def constraint_mass(x):
+        Lcore, Rcore = x
+        return mass_max - model(Lcore, Rcore, dwire, rho, nlayers)['Mass [kg]']
+
+    # Gradients of the callbacks above, from the relaxed turn count
+    def objective_jac(x):
+        Lcore, Rcore = x
+        return -model_jac(Lcore, Rcore, dwire, rho, nlayers)['M [A*m^2]']
+
+    def constraint_radial_jac(x):
+        Lcore, Rcore = x
+        return model_jac(Lcore, Rcore, dwire, rho, nlayers)['Rmax - Rwinding [mm]']
+
+    def constraint_power_jac(x):
+        Lcore, Rcore = x
+        return -model_jac(Lcore, Rcore, dwire, rho, nlayers)['Power [W]']
+
+    def constraint_mass_jac(x):
+        Lcore, Rcore = x
+        return -model_jac(Lcore, Rcore, dwire, rho, nlayers)['Mass [kg]']
+
+    analytic = jac_mode in ('analytic', 'check')
+    constraints = [
+        {'type': 'ineq', 'fun': constraint_radial},
+        {'type': 'ineq', 'fun': constraint_power},
+        {'type': 'ineq', 'fun': constraint_mass}
+    ]
+    if analytic:
+        for constraint, jac in zip(constraints, [constraint_radial_jac, constraint_power_jac,
+                                                 constraint_mass_jac]):
+            constraint['jac'] = jac
+
+    x0 = [50, 4]  # Initial guess: Lcore [mm], Rcore [mm]
+    bounds = [
+        (Lmin, Lmax),   # Lcore
+        (Rmin, Rmax),   # Rcore
+    ]
+
+    from scipy.optimize import minimize # Deferred, scipy is slow to import
+
+    fun = objective
+    if instrument.active():
+        # Count the SLSQP callbacks; the bare functions are used when not recording
+        fun = instrument.counted('slsqp.objective_calls', objective)
+        constraints = [dict(c, fun=instrument.counted('slsqp.constraint_calls', c['fun'])) for c in constraints]
+    with instrument.timer('mtq.slsqp'):
+        res = minimize(fun, x0, jac=objective_jac if analytic else None,
+                       bounds=bounds, constraints=constraints)
+
+    Lcore, Rcore = res.x
+    M = model(Lcore, Rcore, dwire, rho, nlayers)['M [A*m^2]']
+    res['cache_stats'] = model.stats()
+    instrument.count('slsqp.iterations', res.nit)
+    instrument.count('slsqp.jacobian_calls', res.get('njev', 0))
+    instrument.count('sizing.cache_hits', model.hits)
+    instrument.count('sizing.cache_misses', model.misses)
+
+    if jac_mode == 'check':
+        # Finite differences of the rounded model are step functions in Lcore,
+        # so the check runs against the relaxed model the gradients describe
+        def relaxed(key, sign=1.0, offset=0.0):
+            return lambda x: offset + sign * sizing(x[0], x[1], dwire, rho, nlayers, relaxed=True, material=material)[key]
+
+        checks = [
+            (relaxed('M [A*m^2]', -1.0), objective_jac),
+            (constraint_radial, constraint_radial_jac),
+            (relaxed('Power [W]', -1.0, Pmax), constraint_power_jac),
+            (relaxed('Mass [kg]', -1.0, mass_max), constraint_mass_jac),
         ]
+        res['grad_error'] = max(check_jac(fun, jac, x) for fun, jac in checks for x in (x0, res.x))
 
-        res = minimize(objective, x0, bounds=bounds, constraints=constraints)
-
-        if res.success:
-            Lcore, Rcore = res.x
-            result = sizing(Lcore, Rcore, dwire, rho, nlayers)
-            M = result['M [A*m^2]']
-
-            if M > best_moment:
-                best_moment = M
-                best_config = {
-                    'x': res.x,  # Optimal parameters
-                    'dwire': dwire,  # Wire diameter [mm]
-                    'rho': rho,  # Resistance per meter [ohm/m]
-                    'nlayers': nlayers,  # Number of layers
-                }
-
-        else:
-            print(f"Optimization failed for dwire={dwire}, rho={rho}, nlayers={nlayers}: {res.message}")
-
-# Display results
-
-print("--------------------------------------------")
-print("------ Optimal Magnetorquer Design ---------")
-print("--------------------------------------------\n")
-
-# Re-run sizing with the best solution
-if best_config is not None:
-    x = best_config['x']
-    dwire = best_config['dwire']
-    rho = best_config['rho']
-    nlayers = best_config['nlayers']
-    final_result = sizing(x[0], x[1], dwire, rho, nlayers)
-
-    # Printing design variables
-    print("-------- Design Variables ------")
-    print(f"Lcore: {x[0]:.2f} mm")
-    print(f"Rcore: {x[1]:.2f} mm")
-    print(f"dwire [mm]: {dwire}")
-    print(f"resistance_per_m [ohm/m]: {rho}")
-    print(f"nlayers: {nlayers}")
-    print("------------------------------\n")
-
-    # Print clean results
-    for key, value in final_result.items():
-        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
-
-
-    D = 0.80
-    R = final_result['Resistance [ohm]']
-    V = D*Vbus
-    P = V**2/R
-    I = D*final_result['I [A]']
-    M = D*final_result['M [A*m^2]']
+    return res, M
+
+def moment_bound(dwire, rho, nlayers, material=None):
+    """
+    Upper bound on the magnetic moment reachable by solve_case() for each case.
+    With I = Vbus / Resistance the turn count cancels and M grows with Lcore
+    and Rcore, so M peaks at Lcore = Lmax and the largest core the radial
+    constraint allows. The power and mass limits are dropped, which only
+    loosens the bound.
+    Parameters:
+        dwire, rho, nlayers (array_like): Discrete choices, broadcast together
+        material (str): Key of CORE_MATERIALS, default CORE_MATERIAL
+    Returns:
+        ndarray: Bound on M [A*m^2], -inf where no core fits the envelope
+    """
+
+    Rcore = Rmax - np.asarray(nlayers) * np.asarray(dwire)
+    feasible = Rcore >= Rmin
+    result = sizing_batch(Lmax, np.maximum(Rcore, Rmin), dwire, rho, nlayers, material=material)
+    return np.where(feasible, result['M [A*m^2]'], -np.inf)
+
+DUTY_CYCLES = (0.80, 0.10)  # PWM duty cycles reported for a design
+
+PARETO_OBJECTIVES = [
+    # (sizing() key, sense): +1 minimises, -1 maximises
+    ('M [A*m^2]', -1),
+    ('Mass [kg]', +1),
+    ('Power [W]', +1),
+    ('Time Constant [ms]', +1),
+    ('B [T]', +1),
+]
+
+def model_inputs():
+    """
+    Every module-level input the sizing model and optimiser depend on, for the result cache.
+    """
+
+    return {
+        'H': H, 'L': L, 'mass_max': mass_max,
+        'Lmin': Lmin, 'Lmax': Lmax, 'Rmin': Rmin, 'Rmax': Rmax,
+        'mu_0': mu_0, 'CORE_MATERIALS': CORE_MATERIALS, 'CORE_MATERIAL': CORE_MATERIAL,
+        'Pmax': Pmax, 'Vbus': Vbus,
+        'PACKING_EFFICIENCY': PACKING_EFFICIENCY, 'copper_density': copper_density,
+        'code': code_version(rod, sizing, sizing_batch, sizing_jac, solve_case, moment_bound),
+    }
 
-    print(f"\n\n-------- Performance at {D*100:.0f}% Duty Cycle --------")
-    print(f"Current at {D*100:.0f}%: {I:.3f} A")
-    print(f"Power at 80%: {P:.4f} W")
-    print(f"Magnetic Moment at {D*100:.0f}%: {M:.4f} A*m^2")
+def trade_space(n_grid=200, materials=None, eps=0.02):
+    """
+    Pareto front of the rod trade space over a dense (Lcore, Rcore) grid.
+    Every AWG, layer count and core material is evaluated with sizing_batch()
+    on an n_grid x n_grid grid, infeasible rods (radial envelope, power, mass,
+    core saturation) are dropped, and the non-dominated set over
+    PARETO_OBJECTIVES is kept. With only two continuous variables almost every
+    feasible rod of a given wire and layer count is non-dominated, so by default
+    the front is thinned to an eps-Pareto set (see mtq_pareto.non_dominated()).
+    Parameters:
+        n_grid (int): Grid points per continuous design variable
+        materials (list): Core material names, default [CORE_MATERIAL]
+        eps (float): Front resolution relative to each objective's range, None for the exact front
+    Returns:
+        tuple: (front, n_candidates)
+            front is a dict of sizing_batch() keys plus 'rho [ohm/m]' and 'Core Material',
+            each an array over the designs on the front, sorted by decreasing M
+            n_candidates is the number of feasible rods the front was taken from
+    """
 
-    D = 0.10
-    R = final_result['Resistance [ohm]']
+    materials = materials or [CORE_MATERIAL]
+    Lgrid, Rgrid = np.meshgrid(np.linspace(Lmin, Lmax, n_grid), np.linspace(Rmin, Rmax, n_grid))
+    Lgrid, Rgrid = Lgrid.ravel(), Rgrid.ravel()
+
+    # Only the objectives and the design vector of feasible rods are kept,
+    # the full result is re-evaluated for the front at the end
+    designs, costs = [], []
+    for m, material in enumerate(materials):
+        _, B_sat, _ = CORE_MATERIALS[material]
+        for dwire, rho in AWG_TABLE:
+            for nlayers in range(1, N_LAYERS_MAX+1):
+                result = sizing_batch(Lgrid, Rgrid, dwire, rho, nlayers, material=material)
+                feasible = ((Rgrid + nlayers * dwire <= Rmax)
+                            & (result['Power [W]'] <= Pmax)
+                            & (result['Mass [kg]'] <= mass_max)
+                            & (result['B [T]'] <= B_sat))
+                n = feasible.sum()
+                if n == 0:
+                    continue
+                designs.append(np.column_stack([Lgrid[feasible], Rgrid[feasible], np.full(n, dwire),
+                                                np.full(n, rho), np.full(n, nlayers), np.full(n, m)]))
+                costs.append(np.column_stack([sense * result[key][feasible]
+                                              for key, sense in PARETO_OBJECTIVES]))
+
+    if not designs:
+        return {}, 0
+
+    designs = np.concatenate(designs)
+    front = designs[non_dominated(np.concatenate(costs), eps=eps)]
+
+    results = []
+    for m, material in enumerate(materials):
+        Lcore, Rcore, dwire, rho, nlayers, _ = front[front[:, 5] == m].T
+        result = sizing_batch(Lcore, Rcore, dwire, rho, nlayers, material=material)
+        result['rho [ohm/m]'] = rho
+        result['Core Material'] = np.full(len(Lcore), material)
+        results.append(result)
+
+    merged = {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+    order = np.argsort(-merged['M [A*m^2]'], kind='stable')
+    return {key: value[order] for key, value in merged.items()}, len(designs)
+
+def duty_cycle_performance(result, duty_cycles=DUTY_CYCLES):
+    """
+    Current, power and magnetic moment when the coil is driven at reduced PWM duty cycle.
+    Parameters:
+        result (dict): Output of sizing() or sizing_batch(), e.g. a whole Pareto front
+        duty_cycles (sequence): Duty cycles D in [0, 1]
+    Returns:
+        dict: 'I [A]', 'Power [W]' and 'M [A*m^2]', each of shape (len(duty_cycles),) + design shape
+    """
+
+    D = np.asarray(duty_cycles, dtype=float).reshape((-1,) + (1,) * np.ndim(result['I [A]']))
+    R = np.asarray(result['Resistance [ohm]'])
     V = D*Vbus
-    P = V**2/R
-    I = D*final_result['I [A]']
-    M = D*final_result['M [A*m^2]']
+    return {
+        'I [A]': D*np.asarray(result['I [A]']),
+        'Power [W]': V**2/R,
+        'M [A*m^2]': D*np.asarray(result['M [A*m^2]']),
+    }
 
-    print(f"\n\n-------- Performance at {D*100:.0f}% Duty Cycle --------")
-    print(f"Current at {D*100:.0f}%: {I:.3f} A")
-    print(f"Power at 10%: {P:.4f} W")   
-    print(f"Magnetic Moment at {D*100:.0f}%: {M:.4f} A*m^2")
+def write_front_csv(front, path, duty_cycles=DUTY_CYCLES):
+    """
+    Write a trade_space() front to CSV, with the duty cycle performance of every design.
+    """
 
-else:
-    print("No optimal configuration found.")
\ No newline at end of file
+    columns = dict(front)
+    performance = duty_cycle_performance(front, duty_cycles)
+    for i, D in enumerate(duty_cycles):
+        for key, value in performance.items():
+            columns[f"{key} at {D*100:.0f}%"] = value[i]
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*columns.values()))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Magnetorquer rod sizing sweep")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for the (AWG, nlayers) sweep (default: all cores, 1 = serial)")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="Print how many sizing() evaluations the sweep actually ran")
+    parser.add_argument("--jac", choices=["analytic", "fd", "check"], default="analytic",
+                        help="SLSQP gradients: hand-derived, finite differences, or hand-derived checked against finite differences")
+    parser.add_argument("--materials", nargs="+", choices=list(CORE_MATERIALS), default=None,
+                        help=f"Core materials to search over (default: {CORE_MATERIAL} only)")
+    parser.add_argument("--search", choices=["sweep", "bnb"], default="sweep",
+                        help="Solve every discrete case, or branch and bound on moment_bound()")
+    parser.add_argument("--pareto", action="store_true",
+                        help="Report the Pareto front of the trade space instead of the max-moment design")
+    parser.add_argument("--grid", type=int, default=200,
+                        help="Grid points per continuous variable for --pareto")
+    parser.add_argument("--eps", type=float, default=0.02,
+                        help="Pareto front resolution relative to each objective's range, 0 for the exact front")
+    parser.add_argument("--pareto-csv", default=None,
+                        help="Write every design on the Pareto front to this CSV file")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    cache = cache_from_args(args)
+
+    if args.pareto:
+        inputs = (model_inputs(), code_version(trade_space, non_dominated),
+                  args.grid, args.materials, args.eps)
+
+        def compute_front():
+            front, n_candidates = trade_space(args.grid, args.materials, eps=args.eps or None)
+            return dict(front, n_candidates=n_candidates)
+
+        front = cache.get(inputs, compute_front)
+        n_candidates = front.pop('n_candidates')
+        n_front = len(front.get('M [A*m^2]', []))
+        print(f"Pareto front: {n_front} designs out of {n_candidates} feasible candidates\n")
+
+        if n_front:
+            performance = duty_cycle_performance(front)
+            print("-------- Best design per objective ------")
+            for key, sense in PARETO_OBJECTIVES:
+                i = np.argmin(sense * front[key])
+                print(f"{'max' if sense < 0 else 'min'} {key}: "
+                      f"Lcore={front['Lcore [mm]'][i]:.2f} mm, Rcore={front['Rcore [mm]'][i]:.2f} mm, "
+                      f"dwire={front['dwire [mm]'][i]} mm, nlayers={front['nlayers'][i]}, "
+                      f"material={front['Core Material'][i]} | "
+                      + ", ".join(f"{k}={front[k][i]:.4f}" for k, _ in PARETO_OBJECTIVES) + " | "
+                      + ", ".join(f"M at {D*100:.0f}%={performance['M [A*m^2]'][j][i]:.4f}"
+                                  for j, D in enumerate(DUTY_CYCLES)))
+
+        if args.pareto_csv:
+            write_front_csv(front, args.pareto_csv)
+            print(f"\nFront written to {args.pareto_csv}")
+        sys.exit()
+
+    # Outer search over discrete variables: (AWG, nlayers[, material])
+    cases = sweep_cases(AWG_TABLE, N_LAYERS_MAX, args.materials)
+    # Each solved case is cached, so a changed table or limit only re-solves what it affects
+    solver = CachedSolver(partial(solve_case, jac_mode=args.jac), cache, (model_inputs(), args.jac))
+    if args.search == "bnb":
+        bounds = np.array([moment_bound(*case) for case in cases])
+        best_config, results, n_pruned = branch_and_bound(solver, cases, bounds, workers=args.workers,
+                                                          report_failures=True)
+        print(f"Branch and bound: solved {len(results)} of {len(cases)} cases, pruned {n_pruned}")
+    else:
+        best_config, results = run_sweep(solver, cases, workers=args.workers, report_failures=True)
+
+    if args.cache_stats:
+        stats = total_stats([res['cache_stats'] for _, res, _ in results])
+        print(f"sizing() calls: {stats['hits'] + stats['misses']} "
+              f"(hits: {stats['hits']}, misses: {stats['misses']}, "
+              f"evaluations: {stats['evaluations']}, evictions: {stats['evictions']})")
+
+    if args.jac == "check":
+        grad_error = max(res['grad_error'] for _, res, _ in results)
+        print(f"Worst relative gradient error vs finite differences: {grad_error:.2e}")
+
+    # Display results
+
+    print("--------------------------------------------")
+    print("------ Optimal Magnetorquer Design ---------")
+    print("--------------------------------------------\n")
+
+    # Re-run sizing with the best solution
+    if best_config is not None:
+        x = best_config['x']
+        dwire = best_config['dwire']
+        rho = best_config['rho']
+        nlayers = best_config['nlayers']
+        material = best_config.get('material')
+        final_result = sizing(x[0], x[1], dwire, rho, nlayers, material=material)
+
+        # Printing design variables
+        print("-------- Design Variables ------")
+        print(f"Lcore: {x[0]:.2f} mm")
+        print(f"Rcore: {x[1]:.2f} mm")
+        print(f"dwire [mm]: {dwire}")
+        print(f"resistance_per_m [ohm/m]: {rho}")
+        print(f"nlayers: {nlayers}")
+        if material is not None:
+            print(f"core material: {material}")
+        print("------------------------------\n")
+
+        # Print clean results
+        for key, value in final_result.items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+        performance = duty_cycle_performance(final_result)
+        for i, D in enumerate(DUTY_CYCLES):
+            print(f"\n\n-------- Performance at {D*100:.0f}% Duty Cycle --------")
+            print(f"Current at {D*100:.0f}%: {performance['I [A]'][i]:.3f} A")
+            print(f"Power at {D*100:.0f}%: {performance['Power [W]'][i]:.4f} W")
+            print(f"Magnetic Moment at {D*100:.0f}%: {performance['M [A*m^2]'][i]:.4f} A*m^2")
+
+    else:
+        print("No optimal configuration found.")
\ No newline at end of file
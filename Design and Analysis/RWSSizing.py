@@ -16,13 +16,6 @@ alpha_deg = 4 * theta_deg / (t_maneuver**2 - t_coast**2)  # [deg/s²]
 alpha_rad = alpha_deg * (pi / 180)                       # [rad/s²]
 torque = Jy * alpha_rad                                  # [Nm]
 
-# --- Output ---
-print(f"Maneuver time: {t_maneuver} s")
-print(f"Chosen coast angular rate: {w_maneuver:.2f} deg/s")
-print(f"Computed coast time: {t_coast:.2f} s")
-print(f"Required angular acceleration: {alpha_deg:.2f} deg/s^2")
-print(f"Required torque: {torque*1e3:.2f} mNm")  # convert to mNm
-
 H_capacity_mNms = 5.7
 # Convert w_maneuver to rad/s
 w_maneuver_rad = w_maneuver * pi / 180
@@ -31,5 +24,14 @@ H_wheel = Jy * w_maneuver_rad   # [N·m·s] = [kg·m²·rad/s]
 # Convert to mN·m·s for convenience
 H_wheel_mNms = H_wheel * 1e3
 
-print(f"Coasting wheel momentum: {H_wheel_mNms:.3f} mNms")
-print(f"{(H_wheel_mNms/H_capacity_mNms)*1e2:.2f} % Momemtum capacity of wheel during coast ")
\ No newline at end of file
+if __name__ == "__main__":
+
+    # --- Output ---
+    print(f"Maneuver time: {t_maneuver} s")
+    print(f"Chosen coast angular rate: {w_maneuver:.2f} deg/s")
+    print(f"Computed coast time: {t_coast:.2f} s")
+    print(f"Required angular acceleration: {alpha_deg:.2f} deg/s^2")
+    print(f"Required torque: {torque*1e3:.2f} mNm")  # convert to mNm
+
+    print(f"Coasting wheel momentum: {H_wheel_mNms:.3f} mNms")
+    print(f"{(H_wheel_mNms/H_capacity_mNms)*1e2:.2f} % Momemtum capacity of wheel during coast ")
\ No newline at end of file
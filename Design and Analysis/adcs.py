@@ -0,0 +1,90 @@
+"""
+Single command-line entry point for the ADCS design and analysis scripts.
+
+    python adcs.py <command> [options]
+    python adcs.py <command> --help
+    python adcs.py --profile report.json <command> [options]
+
+--profile records the instrumentation timers and counters of the run (see
+instrument.py) and writes them to the given file, as a Chrome trace when the
+name ends in .trace.json.
+
+Each command runs the main block of one module of this directory, with the
+remaining arguments as its own command line. Only that module is imported, and
+the modules defer scipy and matplotlib to the functions that use them, so the
+models can also be imported directly (with this directory on sys.path) by batch
+drivers without loading the plotting or optimisation stacks:
+
+    from MTQRodSizing import sizing
+    from detumbling import simulate_batch
+"""
+
+import os
+import runpy
+import sys
+
+# Command: (module, description)
+COMMANDS = {
+    'mtq-size': ('MTQRodSizing', "Magnetorquer rod sizing sweep"),
+    'mtq-size2': ('MTQRodSizing2', "Magnetorquer rod sizing sweep at the 1.5 W budget, with Pareto fronts"),
+    'rws-size': ('RWSSizing', "Reaction wheel momentum and torque sizing"),
+    'rws-trade': ('rws_trade', "Reaction-wheel slew trade space"),
+    'imu-arw': ('IMUSizing', "Gyro ARW requirement for the attitude error budget"),
+    'allan': ('allan', "Allan deviation of a gyro log against the ARW requirement"),
+    'sensor-log': ('sensor_noise', "Write a synthetic gyro or magnetometer log"),
+    'mekf': ('mekf', "MEKF replay against the gyro-only attitude requirement"),
+    'detumble': ('detumbling', "Single-axis detumbling simulation"),
+    'detumble-tune': ('detumble_tuning', "Tune the B-dot gain and dipole limit"),
+    'closed-loop': ('closed_loop', "Multi-rate closed-loop B-dot detumbling"),
+    'attitude': ('attitude', "Torque-free 3-axis propagation of a batch of tumbling CubeSats"),
+    'determination': ('attitude_determination', "Batched TRIAD/QUEST accuracy and speed"),
+    'field': ('orbit_field', "Geomagnetic field along the CubeSat orbit"),
+    'pointing': ('pointingError', "Pointing error budget"),
+    'pointing-mc': ('pointing_mc', "Monte Carlo pointing error budget"),
+    'bench': ('benchmarks', "Benchmark suite with JSON baselines"),
+}
+
+def usage():
+    width = max(len(name) for name in COMMANDS)
+    lines = ["usage: adcs.py [--profile PATH] <command> [options]", "", "commands:"]
+    lines += [f"  {name:<{width}}  {description}" for name, (_, description) in COMMANDS.items()]
+    return "\n".join(lines)
+
+def main(argv=None):
+    """
+    Run the command in argv (default sys.argv[1:]) as its module's __main__.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    profile = None
+    if argv[:1] == ["--profile"] and len(argv) > 1:
+        profile, argv = argv[1], argv[2:]
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        print(f"\nadcs.py: unknown command {command!r}", file=sys.stderr)
+        return 2
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.insert(0, here)
+    module = COMMANDS[command][0]
+    sys.argv = [f"adcs.py {command}"] + args
+    if profile is None:
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+        return 0
+
+    import instrument
+    recorder = instrument.enable(trace=profile.endswith('.trace.json'))
+    try:
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+    finally:
+        instrument.disable()
+        recorder.save(profile)
+        print(f"\n{recorder.summary()}\nProfile written to {profile}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Streaming overlapping Allan deviation of gyro logs.
+
+The rate samples are integrated to angle, theta_k = sum(rate)/fs, and for each
+cluster size m the overlapping Allan variance is accumulated from the second
+differences theta[k+2m] - 2 theta[k+m] + theta[k], which is O(N) per cluster
+size. Logs are read in chunks (memory-mapped .npy or raw binary, or CSV), and
+only the last 2*m_max angles are carried between chunks, so memory is bounded
+by the longest cluster time rather than the length of the recording.
+
+The angle random walk and bias instability are read off the Allan deviation as
+in IEEE Std 952 and compared against the IMUSizing.py requirement and the
+gyro_params.m datasheet figure.
+"""
+
+import argparse
+import itertools
+import os
+from math import *
+
+import numpy as np
+
+from IMUSizing import max_arw
+
+# Sensors/gyro_params.m
+fs = 100 # UpdateRate [Hz]
+noise_density = 0.005 # NoiseSpectralDensity [dps/sqrt(Hz)]
+
+tau_max = 3600 # Longest cluster time [s], sets the memory carried between chunks
+chunk = 2**18 # Samples read per chunk
+
+def cluster_sizes(m_max, per_decade=10):
+    """
+    Log-spaced cluster sizes 1..m_max [samples], about per_decade per decade.
+    """
+    m_max = max(int(m_max), 1)
+    m = np.logspace(0, log10(m_max), int(log10(m_max)*per_decade) + 1)
+    return np.unique(np.round(m).astype(int))
+
+class AllanAccumulator:
+    """
+    Overlapping Allan variance of multi-axis rate data fed in chunks.
+    Parameters:
+        fs (float): Sample rate [Hz]
+        m (array_like): Cluster sizes [samples]
+        n_axes (int): Columns of the rate data
+    """
+
+    def __init__(self, fs, m, n_axes=3):
+        self.fs = fs
+        self.m = np.sort(np.asarray(m, dtype=int))
+        self.n = 0 # Samples seen
+        self.sums = np.zeros((len(self.m), n_axes))
+        self.counts = np.zeros(len(self.m), dtype=np.int64)
+        self._tail = np.zeros((1, n_axes)) # Angles theta[n - len(tail) + 1 .. n], theta[0] = 0
+        self._offset = None
+
+    def update(self, rate):
+        """
+        Add the next (k, n_axes) rate samples.
+        """
+        rate = np.asarray(rate, dtype=float)
+        if len(rate) == 0:
+            return
+        if self._offset is None:
+            # A constant rate does not change the Allan variance; removing the
+            # bias keeps the integrated angle small and the differences exact
+            self._offset = rate.mean(axis=0)
+
+        k = len(rate)
+        theta = np.cumsum((rate - self._offset) / self.fs, axis=0)
+        theta += self._tail[-1]
+        buf = np.concatenate([self._tail, theta])
+        base = self.n + 1 - len(self._tail) # Sample index of buf[0]
+
+        for i, m in enumerate(self.m):
+            # Second differences ending on the new angles theta[n+1 .. n+k]
+            first = max(self.n + 1, 2*m)
+            if first > self.n + k:
+                continue
+            end = buf[first - base:]
+            mid = buf[first - base - m:len(buf) - m]
+            start = buf[first - base - 2*m:len(buf) - 2*m]
+            d = end - 2*mid + start
+            self.sums[i] += np.einsum('ij,ij->j', d, d)
+            self.counts[i] += len(d)
+
+        self.n += k
+        self._tail = buf[-(2*self.m[-1]):].copy()
+
+    def result(self):
+        """
+        Returns:
+            tuple: (tau (n_tau,) [s], adev (n_tau, n_axes) [rate units]) for the
+                cluster sizes that fit in the data seen
+        """
+        ok = self.counts > 0
+        tau = self.m[ok] / self.fs
+        avar = self.sums[ok] / (2 * tau[:, None]**2 * self.counts[ok, None])
+        return tau, np.sqrt(avar)
+
+def _is_numeric(line):
+    try:
+        [float(field) for field in line.split(',')]
+    except ValueError:
+        return False
+    return True
+
+def open_log(path, fmt=None, columns=(0, 1, 2), n_columns=None, dtype='<f4', chunk=chunk):
+    """
+    Read a rate log in chunks.
+    Parameters:
+        path (str): .npy (memory-mapped), raw binary or CSV log
+        fmt (str): 'npy', 'bin' or 'csv', default from the file extension
+        columns (sequence): Columns holding the rates
+        n_columns (int): Columns per record of a raw binary log, default len(columns)
+        dtype (str): Sample type of a raw binary log
+        chunk (int): Rows per chunk
+    Returns:
+        tuple: (iterator over (k, len(columns)) arrays, number of rows or None if unknown)
+    """
+    columns = list(columns)
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = {'.npy': 'npy', '.csv': 'csv', '.txt': 'csv'}.get(ext, 'bin')
+
+    if fmt in ('npy', 'bin'):
+        if fmt == 'npy':
+            data = np.load(path, mmap_mode='r')
+        else:
+            data = np.memmap(path, dtype=dtype, mode='r')
+            data = data.reshape(-1, n_columns or len(columns))
+        data = data.reshape(len(data), -1)
+        chunks = (data[i:i + chunk, columns] for i in range(0, len(data), chunk))
+        return chunks, len(data)
+
+    if fmt == 'csv':
+        def chunks():
+            with open(path) as f:
+                first = f.readline()
+                lines = [first] if _is_numeric(first) else [] # Skip a header row
+                while True:
+                    lines.extend(itertools.islice(f, chunk - len(lines)))
+                    if not lines:
+                        return
+                    yield np.loadtxt(lines, delimiter=',', ndmin=2)[:, columns]
+                    lines = []
+        return chunks(), None
+
+    raise ValueError(f"Unknown log format {fmt!r}")
+
+def allan_deviation(chunks, fs=fs, n=None, tau_max=tau_max, per_decade=10):
+    """
+    Overlapping Allan deviation of a chunked rate log.
+    Parameters:
+        chunks (iterable): (k, n_axes) rate arrays, e.g. from open_log()
+        fs (float): Sample rate [Hz]
+        n (int): Number of samples if known, limits the cluster sizes to n // 2
+        tau_max (float): Longest cluster time [s]
+        per_decade (int): Cluster times per decade
+    Returns:
+        tuple: (tau [s], adev (n_tau, n_axes), samples read)
+    """
+    m_max = int(tau_max * fs)
+    if n is not None:
+        m_max = min(m_max, max(n // 2, 1))
+    accumulator = None
+    for rate in chunks:
+        rate = np.asarray(rate, dtype=float)
+        if accumulator is None:
+            accumulator = AllanAccumulator(fs, cluster_sizes(m_max, per_decade), rate.shape[1])
+        accumulator.update(rate)
+    if accumulator is None:
+        raise ValueError("Empty log")
+    tau, adev = accumulator.result()
+    return tau, adev, accumulator.n
+
+def noise_parameters(tau, adev):
+    """
+    Angle random walk and bias instability from an Allan deviation curve:
+    N is the -1/2 slope line through the point of the curve whose slope is
+    closest to -1/2, evaluated at tau = 1 s; B is the flat part of the curve
+    (slope closest to 0) divided by sqrt(2 ln2 / pi).
+    Parameters:
+        tau (array_like): Cluster times [s]
+        adev (array_like): (n_tau, n_axes) Allan deviation [deg/s]
+    Returns:
+        tuple: (ARW (n_axes,) [deg/sqrt(s)], bias instability (n_axes,) [deg/s])
+    """
+    log_tau = np.log10(tau)
+    log_adev = np.log10(adev)
+    slope = np.gradient(log_adev, log_tau, axis=0)
+    axes = np.arange(adev.shape[1])
+
+    i = np.argmin(np.abs(slope + 0.5), axis=0)
+    arw = adev[i, axes] * np.sqrt(tau[i])
+    j = np.argmin(np.abs(slope), axis=0)
+    bias_instability = adev[j, axes] / sqrt(2*log(2)/pi)
+    return arw, bias_instability
+
+def synthetic_log(path, hours, fs=fs, seed=0):
+    """
+    Write a 3-axis .npy rate log [deg/s] with white noise at the datasheet noise
+    density, a static bias and a slow bias random walk, for trying the tool.
+    """
+    n = int(hours * 3600 * fs)
+    rng = np.random.default_rng(seed)
+    log = np.lib.format.open_memmap(path, mode='w+', dtype='<f4', shape=(n, 3))
+    bias = rng.uniform(-0.1, 0.1, 3) # gyro_params.m staticBias [deg/s]
+    rrw = 1e-5 # Rate random walk [deg/s/sqrt(s)]
+    for i in range(0, n, chunk):
+        k = min(chunk, n - i)
+        walk = bias + np.cumsum(rng.normal(0, rrw/sqrt(fs), (k, 3)), axis=0)
+        bias = walk[-1]
+        log[i:i + k] = walk + rng.normal(0, noise_density*sqrt(fs), (k, 3))
+    log.flush()
+    return n
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Allan deviation of a gyro log against the ARW requirement")
+    parser.add_argument("log", help="Rate log [deg/s], .npy, raw binary or CSV")
+    parser.add_argument("--format", choices=["npy", "bin", "csv"], help="Default from the file extension")
+    parser.add_argument("--fs", type=float, default=fs, help="Sample rate [Hz]")
+    parser.add_argument("--columns", type=int, nargs="+", default=[0, 1, 2], help="Rate columns")
+    parser.add_argument("--n-columns", type=int, help="Columns per record of a raw binary log")
+    parser.add_argument("--dtype", default="<f4", help="Sample type of a raw binary log")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Factor to deg/s, e.g. 1/Sensitivity for raw counts")
+    parser.add_argument("--tau-max", type=float, default=tau_max, help="Longest cluster time [s]")
+    parser.add_argument("--synthetic", type=float, metavar="HOURS",
+                        help="First write a synthetic log of this length to LOG (.npy)")
+    parser.add_argument("--plot", action="store_true", help="Plot the Allan deviation")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        synthetic_log(args.log, args.synthetic, args.fs)
+
+    chunks, n = open_log(args.log, args.format, args.columns, args.n_columns, args.dtype)
+    if args.scale != 1.0:
+        chunks = (rate * args.scale for rate in chunks)
+    tau, adev, n = allan_deviation(chunks, args.fs, n, args.tau_max)
+    arw, bias_instability = noise_parameters(tau, adev)
+
+    requirement = max_arw() # [mdps/sqrt(Hz)]
+    print(f"{n} samples ({n/args.fs/3600:.2f} h at {args.fs:g} Hz), tau {tau[0]:g} to {tau[-1]:g} s")
+    print(f"Requirement (IMUSizing.py): ARW <= {requirement:.2f} mdps/sqrt(Hz); "
+          f"datasheet noise density {noise_density*1000:.2f} mdps/sqrt(Hz)")
+    for axis, N, B in zip("xyz", arw, bias_instability):
+        N_mdps = N * 1000 # deg/sqrt(s) = deg/s/sqrt(Hz)
+        verdict = "OK" if N_mdps <= requirement else "EXCEEDS"
+        print(f"  {axis}: ARW {N_mdps:.2f} mdps/sqrt(Hz) ({verdict}), "
+              f"bias instability {B*3600:.2f} deg/h")
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.figure()
+        for axis, column in zip("xyz", adev.T):
+            plt.loglog(tau, column, label=axis)
+        plt.loglog(tau, requirement / 1000 / np.sqrt(tau), 'k--', label='ARW requirement')
+        plt.xlabel('Cluster time [s]')
+        plt.ylabel('Allan deviation [deg/s]')
+        plt.grid(True, which='both')
+        plt.legend()
+        plt.show()
@@ -0,0 +1,230 @@
+"""
+Batched static attitude determination: TRIAD and Davenport's q-method (QUEST).
+
+Python counterparts of Simulations/ADCS MILS/Estimator/TRIAD.m and QMethod.m
+that process N epochs per call. QUEST finds the largest eigenvalue of
+Davenport's K matrix from its characteristic polynomial by Newton iteration
+instead of a full eig(K), and falls back to a batched eigh only for the epochs
+where the closed-form eigenvector is ill-conditioned (rotations close to 180 deg).
+
+Quaternions are scalar-first [q0, q1, q2, q3] as in QMethod.m, with q0 >= 0.
+Epochs whose vectors are zero or (nearly) parallel do not determine an attitude;
+they are flagged in the returned valid mask and their outputs are nan.
+"""
+
+import argparse
+import time
+from math import *
+
+import numpy as np
+
+min_angle = radians(1) # Smallest usable angle between two observation vectors [rad]
+
+def _unit(v):
+    """
+    Normalise (..., 3) vectors. Returns (unit vectors, mask of non-zero vectors).
+    """
+    v = np.asarray(v, dtype=float)
+    norm = np.linalg.norm(v, axis=-1, keepdims=True)
+    ok = norm[..., 0] > np.finfo(float).tiny
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return v / norm, ok
+
+def dcm_from_quat(q):
+    """
+    Inertial-to-body DCM (..., 3, 3) of scalar-first quaternions (..., 4),
+    the same matrix TRIAD.m returns.
+    """
+    q = np.asarray(q, dtype=float)
+    q0, qv = q[..., 0], q[..., 1:]
+    I = np.eye(3)
+    qx = np.zeros(q.shape[:-1] + (3, 3))
+    qx[..., 0, 1], qx[..., 0, 2] = -qv[..., 2], qv[..., 1]
+    qx[..., 1, 0], qx[..., 1, 2] = qv[..., 2], -qv[..., 0]
+    qx[..., 2, 0], qx[..., 2, 1] = -qv[..., 1], qv[..., 0]
+    return ((q0**2 - np.sum(qv*qv, axis=-1))[..., None, None] * I
+            + 2*qv[..., :, None]*qv[..., None, :] - 2*q0[..., None, None]*qx)
+
+def triad(r1B, r1N, r2B, r2N, min_angle=min_angle):
+    """
+    TRIAD for N epochs, as TRIAD.m. r1 is the more accurate measurement.
+    Parameters:
+        r1B, r2B (array_like): (N, 3) measurements in body frame
+        r1N, r2N (array_like): (N, 3) the same vectors in inertial frame (from the model)
+        min_angle (float): Pairs closer to parallel than this are degenerate [rad]
+    Returns:
+        tuple: (R (N, 3, 3) inertial-to-body DCMs, valid (N,) bool)
+    """
+    r1B, ok1B = _unit(r1B)
+    r1N, ok1N = _unit(r1N)
+    r2B, ok2B = _unit(r2B)
+    r2N, ok2N = _unit(r2N)
+
+    t2B = np.cross(r1B, r2B)
+    t2N = np.cross(r1N, r2N)
+    sinB = np.linalg.norm(t2B, axis=-1)
+    sinN = np.linalg.norm(t2N, axis=-1)
+    valid = ok1B & ok1N & ok2B & ok2N & (sinB > sin(min_angle)) & (sinN > sin(min_angle))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t2B /= sinB[..., None]
+        t2N /= sinN[..., None]
+    TB = np.stack([r1B, t2B, np.cross(r1B, t2B)], axis=-1)
+    TN = np.stack([r1N, t2N, np.cross(r1N, t2N)], axis=-1)
+
+    # RBN = RBT*(RNT)^T
+    R = np.einsum('nij,nkj->nik', TB, TN)
+    R[~valid] = np.nan
+    return R, valid
+
+def davenport_k(vB, vN, weights=None):
+    """
+    Attitude profile matrix B = sum w vB vN^T and Davenport's K for N epochs.
+    Parameters:
+        vB, vN (array_like): (N, M, 3) M unit observation vectors per epoch
+        weights (array_like): (M,) or (N, M) weights, default all 1
+    Returns:
+        tuple: (B (N, 3, 3), K (N, 4, 4)) with K = [[sigma, Z^T], [Z, S - sigma I]]
+    """
+    w = np.ones(vB.shape[:-1]) if weights is None else np.broadcast_to(weights, vB.shape[:-1])
+    B = np.einsum('nm,nmi,nmj->nij', w, vB, vN)
+    S = B + np.swapaxes(B, -1, -2)
+    sigma = np.trace(B, axis1=-2, axis2=-1)
+    Z = np.stack([B[:, 1, 2] - B[:, 2, 1], B[:, 2, 0] - B[:, 0, 2], B[:, 0, 1] - B[:, 1, 0]], axis=-1)
+    K = np.empty(B.shape[:-2] + (4, 4))
+    K[:, 0, 0] = sigma
+    K[:, 0, 1:] = Z
+    K[:, 1:, 0] = Z
+    K[:, 1:, 1:] = S - sigma[:, None, None]*np.eye(3)
+    return B, K
+
+def quest(vB, vN, weights=None, min_angle=min_angle, tol=1e-12, max_iter=20):
+    """
+    Optimal quaternion (Wahba's problem) for N epochs, as QMethod.m.
+    Parameters:
+        vB (array_like): (N, M, 3) M >= 2 measurements per epoch in body frame
+        vN (array_like): (N, M, 3) the same vectors in inertial frame
+        weights (array_like): (M,) or (N, M) measurement weights, default all 1
+        min_angle (float): Epochs whose usable vectors are all within this angle
+            of being parallel are degenerate [rad]
+        tol (float): Newton convergence tolerance on the eigenvalue, relative to sum(w)
+        max_iter (int): Newton iteration limit
+    Returns:
+        tuple: (q (N, 4) scalar-first quaternions, valid (N,) bool)
+    """
+    vB, okB = _unit(vB)
+    vN, okN = _unit(vN)
+    if vB.ndim != 3 or vB.shape != vN.shape or vB.shape[1] < 2:
+        raise ValueError("vB and vN must both be (N, M, 3) with M >= 2")
+    w = np.ones(vB.shape[:-1]) if weights is None else np.array(np.broadcast_to(weights, vB.shape[:-1]), dtype=float)
+
+    # Zero vectors take no part; at least one usable non-parallel pair must remain
+    usable = okB & okN & (w > 0)
+    w = np.where(usable, w, 0.0)
+    vB = np.where(usable[..., None], vB, 0.0)
+    vN = np.where(usable[..., None], vN, 0.0)
+    i, j = np.triu_indices(vB.shape[1], k=1)
+    sin_pair = np.minimum(np.linalg.norm(np.cross(vB[:, i], vB[:, j]), axis=-1),
+                          np.linalg.norm(np.cross(vN[:, i], vN[:, j]), axis=-1))
+    valid = np.any(sin_pair > sin(min_angle), axis=-1)
+
+    _, K = davenport_k(vB, vN, w)
+    S = K[:, 1:, 1:] + K[:, :1, :1]*np.eye(3)
+    sigma = K[:, 0, 0]
+    z = K[:, 0, 1:]
+
+    # Characteristic polynomial of K (Shuster):
+    # f(lam) = (lam^2 - a)(lam^2 - b) - c(lam - sigma) - d
+    adjS_trace = (S[:, 0, 0]*S[:, 1, 1] - S[:, 0, 1]*S[:, 1, 0]
+                  + S[:, 0, 0]*S[:, 2, 2] - S[:, 0, 2]*S[:, 2, 0]
+                  + S[:, 1, 1]*S[:, 2, 2] - S[:, 1, 2]*S[:, 2, 1])
+    Sz = np.einsum('nij,nj->ni', S, z)
+    S2z = np.einsum('nij,nj->ni', S, Sz)
+    a = sigma**2 - adjS_trace
+    b = sigma**2 + np.sum(z*z, axis=-1)
+    det_S = np.linalg.det(S)
+    c = det_S + np.sum(z*Sz, axis=-1)
+    d = np.sum(z*S2z, axis=-1)
+
+    # Newton from sum(w), an upper bound that is close for consistent measurements
+    lam = w.sum(axis=-1)
+    scale = np.maximum(lam, np.finfo(float).tiny)
+    for _ in range(max_iter):
+        lam2 = lam*lam
+        f = (lam2 - a)*(lam2 - b) - c*(lam - sigma) - d
+        df = 2*lam*(2*lam2 - a - b) - c
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.where(df != 0, f/df, 0.0)
+        lam = lam - step
+        if np.all(np.abs(step[valid]) <= tol*scale[valid]):
+            break
+
+    # Eigenvector x = (alpha I + beta S + S^2) z, q = [gamma, x] normalised
+    alpha = lam**2 - sigma**2 + adjS_trace
+    beta = lam - sigma
+    gamma = (lam + sigma)*alpha - det_S
+    x = alpha[:, None]*z + beta[:, None]*Sz + S2z
+    q = np.concatenate([gamma[:, None], x], axis=-1)
+    norm = np.linalg.norm(q, axis=-1)
+
+    # Near 180 deg gamma and x all vanish; solve those few epochs with eigh
+    ill = valid & (norm <= 1e-6*np.maximum(lam, 1)**3)
+    if np.any(ill):
+        _, V = np.linalg.eigh(K[ill])
+        q[ill] = V[..., -1]
+        norm[ill] = 1.0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        q /= norm[:, None]
+    q[q[:, 0] < 0] *= -1
+    q[~valid] = np.nan
+    return q, valid
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Batched TRIAD/QUEST accuracy and speed on synthetic epochs")
+    parser.add_argument("-n", type=int, default=100000, help="Number of epochs")
+    parser.add_argument("--noise", type=float, default=0.1, help="Measurement noise, 1 sigma per axis [deg]")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    q_true = rng.normal(size=(args.n, 4))
+    q_true /= np.linalg.norm(q_true, axis=-1, keepdims=True)
+    q_true[q_true[:, 0] < 0] *= -1
+    R_true = dcm_from_quat(q_true)
+
+    # Sun and magnetic field directions, inertial, and their noisy body measurements
+    vN = _unit(rng.normal(size=(args.n, 2, 3)))[0]
+    vB = np.einsum('nij,nmj->nmi', R_true, vN) + np.radians(args.noise)*rng.normal(size=(args.n, 2, 3))
+
+    def angle_error(R, valid):
+        # Rotation angle of R R_true^T over the valid epochs [deg]
+        cos_angle = (np.einsum('nij,nij->n', R[valid], R_true[valid]) - 1) / 2
+        return np.degrees(np.arccos(np.clip(cos_angle, -1, 1)))
+
+    start = time.perf_counter()
+    R, valid_t = triad(vB[:, 0], vN[:, 0], vB[:, 1], vN[:, 1])
+    t_triad = time.perf_counter() - start
+    err_triad = angle_error(R, valid_t)
+
+    start = time.perf_counter()
+    q, valid_q = quest(vB, vN)
+    t_quest = time.perf_counter() - start
+    err_quest = angle_error(dcm_from_quat(q), valid_q)
+
+    # Reference: Davenport's q-method one epoch at a time with a full eigendecomposition
+    n_ref = min(args.n, 5000)
+    _, K = davenport_k(_unit(vB[:n_ref])[0], vN[:n_ref])
+    start = time.perf_counter()
+    q_ref = np.array([np.linalg.eigh(Kn)[1][:, -1] for Kn in K])
+    t_ref = (time.perf_counter() - start) * args.n / n_ref
+    q_ref[q_ref[:, 0] < 0] *= -1
+    agree = np.max(np.abs(q[:n_ref] - q_ref)[valid_q[:n_ref]])
+
+    print(f"{args.n} epochs, {args.noise} deg noise")
+    print(f"TRIAD: {t_triad:.3f} s, {valid_t.sum()} valid, error median {np.median(err_triad):.3f} deg,"
+          f" P99 {np.percentile(err_triad, 99):.3f} deg")
+    print(f"QUEST: {t_quest:.3f} s, {valid_q.sum()} valid, error median {np.median(err_quest):.3f} deg,"
+          f" P99 {np.percentile(err_quest, 99):.3f} deg")
+    print(f"Per-epoch eig (estimated from {n_ref} epochs): {t_ref:.2f} s, max |q - q_eig| {agree:.1e}")
@@ -0,0 +1,257 @@
+"""
+Benchmark suite for the analysis hot paths, with JSON baselines.
+
+Every benchmark runs a fixed, seeded workload. It is timed as the best of
+`repeat` runs, each long enough (min_time) to swamp the timer resolution, and
+reported as seconds per run and as a throughput in its own unit of work.
+Results are written as JSON together with the machine and library versions, and
+the compare mode flags every benchmark that got slower than a baseline by more
+than a threshold (exit status 1), so it can gate a change:
+
+    python benchmarks.py run --save baseline.json
+    python benchmarks.py compare baseline.json                  # rerun now
+    python benchmarks.py compare baseline.json --against new.json
+
+Baselines are only comparable on the same machine and library versions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from functools import partial
+from math import *
+
+import numpy as np
+
+repeat = 5 # Timed runs per benchmark, the best one counts
+min_time = 0.2 # Minimum duration of one timed run [s]
+threshold = 0.10 # Slowdown flagged as a regression (0.10 = 10 % slower)
+seed = 0
+
+def bench_sizing():
+    from MTQRodSizing import sizing
+
+    def run():
+        sizing(65.0, 8.4, 0.32, 0.212, 5, 0.2244)
+    return run, 1
+
+def bench_sizing_batch(n=10000):
+    from MTQRodSizing import AWG_TABLE, Imax, Imin, Lmax, Lmin, N_LAYERS_MAX, Rmax, Rmin, sizing_batch
+    rng = np.random.default_rng(seed)
+    awg = rng.integers(len(AWG_TABLE), size=n)
+    dwire, rho = np.array(AWG_TABLE)[awg].T
+    args = (rng.uniform(Lmin, Lmax, n), rng.uniform(Rmin, Rmax, n), dwire, rho,
+            rng.integers(1, N_LAYERS_MAX + 1, n), rng.uniform(Imin, Imax, n))
+
+    def run():
+        sizing_batch(*args)
+    return run, n
+
+def bench_awg_sweep():
+    from MTQRodSizing import AWG_TABLE, N_LAYERS_MAX, solve_case
+    from mtq_sweep import run_sweep, sweep_cases
+    cases = sweep_cases(AWG_TABLE, N_LAYERS_MAX)
+
+    def run():
+        run_sweep(partial(solve_case, jac_mode='analytic'), cases, workers=1, report_failures=False)
+    return run, len(cases)
+
+def bench_detumble(t_final=600.0):
+    from detumbling import dt, simulate
+
+    def run():
+        simulate(t_final=t_final)
+    return run, int(round(t_final / dt))
+
+def bench_detumble_batch(n=1000, t_final=60.0):
+    from detumbling import dispersed_cases, dt, simulate_batch
+    cases = dispersed_cases(n, seed)
+
+    def run():
+        simulate_batch(**cases, t_final=t_final)
+    return run, n * int(round(t_final / dt))
+
+def _epochs(n):
+    from attitude_determination import _unit, dcm_from_quat
+    rng = np.random.default_rng(seed)
+    q = rng.normal(size=(n, 4))
+    vN = _unit(rng.normal(size=(n, 2, 3)))[0]
+    vB = np.einsum('nij,nmj->nmi', dcm_from_quat(q / np.linalg.norm(q, axis=1, keepdims=True)), vN)
+    return vB + np.radians(0.1)*rng.normal(size=vB.shape), vN
+
+def bench_triad(n=100000):
+    from attitude_determination import triad
+    vB, vN = _epochs(n)
+
+    def run():
+        triad(vB[:, 0], vN[:, 0], vB[:, 1], vN[:, 1])
+    return run, n
+
+def bench_quest(n=100000):
+    from attitude_determination import quest
+    vB, vN = _epochs(n)
+
+    def run():
+        quest(vB, vN)
+    return run, n
+
+def bench_mekf(n=1000, steps=100):
+    from mekf import MEKF, meas_period, sigma_att0, sigma_mag, sun_eci
+    from mekf import dt as step
+    P0 = np.diag([sigma_att0**2]*3 + [radians(0.1)**2]*3)
+    rng = np.random.default_rng(seed)
+    q = rng.normal(size=(n, 4))
+    w = np.radians(0.5) * rng.normal(size=(steps, n, 3))
+    b = rng.normal(size=(n, 3))
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    meas_every = int(round(meas_period / step))
+
+    def run():
+        mekf = MEKF(q, P0)
+        for k in range(steps):
+            mekf.propagate(w[k])
+            if k % meas_every == 0:
+                mekf.update(b, sun_eci, sigma_mag)
+    return run, n * steps
+
+# Benchmark: (setup, unit of work); setup() returns (run, work per run)
+BENCHMARKS = {
+    'sizing': (bench_sizing, 'calls'),
+    'sizing_batch': (bench_sizing_batch, 'designs'),
+    'awg_sweep': (bench_awg_sweep, 'cases'),
+    'detumble': (bench_detumble, 'steps'),
+    'detumble_batch': (bench_detumble_batch, 'case-steps'),
+    'triad': (bench_triad, 'epochs'),
+    'quest': (bench_quest, 'epochs'),
+    'mekf': (bench_mekf, 'filter-steps'),
+}
+
+def time_run(run, repeat=repeat, min_time=min_time):
+    """
+    Best time of one call of run() [s], over repeat timed runs of enough calls
+    to last min_time each.
+    """
+    run() # Warm up: imports, caches, first-touch allocations
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops = max(2*loops, int(loops * 1.2 * min_time / max(elapsed, 1e-9)))
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best, loops
+
+def machine():
+    """
+    Machine and library versions the results belong to (scipy for the SLSQP
+    solves of awg_sweep).
+    """
+    import scipy # Deferred, scipy is slow to import
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+    }
+
+def run_benchmarks(names=None, repeat=repeat, min_time=min_time, progress=None):
+    """
+    Run the named benchmarks (default all).
+    Returns:
+        dict: 'machine', 'time' (UNIX time of the run) and 'results', per
+            benchmark 'seconds' (best time per run), 'work' (units per run),
+            'unit', 'rate' (units per second) and 'loops'
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        setup, unit = BENCHMARKS[name]
+        run, work = setup()
+        seconds, loops = time_run(run, repeat, min_time)
+        results[name] = {'seconds': seconds, 'work': work, 'unit': unit, 'rate': work / seconds, 'loops': loops}
+        if progress:
+            progress(name, results[name])
+    return {'machine': machine(), 'time': time.time(), 'results': results}
+
+def compare(baseline, current, threshold=threshold):
+    """
+    Relative change in time per unit of work of every benchmark in both runs.
+    Returns:
+        dict: benchmark -> {'baseline', 'current' [s per run], 'change'
+            (current/baseline - 1 per unit of work, > 0 is slower), 'regression'}
+    """
+    report = {}
+    for name, now in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        change = (now['seconds'] / now['work']) / (base['seconds'] / base['work']) - 1
+        report[name] = {'baseline': base['seconds'], 'current': now['seconds'], 'change': change,
+                        'regression': change > threshold}
+    return report
+
+def _print_result(name, result):
+    print(f"{name:<16} {result['rate']:12.4g} {result['unit']}/s   {result['seconds']*1e3:10.3f} ms/run")
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def _save(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark suite with JSON baselines")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    compare_parser = commands.add_parser("compare", help="Compare with a baseline, exit status 1 on a regression")
+    compare_parser.add_argument("baseline", help="Baseline JSON written by run --save")
+    compare_parser.add_argument("--against", metavar="PATH", help="Compare these results instead of running now")
+    compare_parser.add_argument("--threshold", type=float, default=threshold,
+                                help="Slowdown flagged as a regression, relative (default %(default)s)")
+    for p in (run_parser, compare_parser):
+        p.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Benchmarks to run")
+        p.add_argument("--repeat", type=int, default=repeat, help="Timed runs per benchmark")
+        p.add_argument("--min-time", type=float, default=min_time, help="Minimum duration of a timed run [s]")
+        p.add_argument("--save", metavar="PATH", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.command == "compare" and args.against:
+        current = _load(args.against)
+    else:
+        current = run_benchmarks(args.only, args.repeat, args.min_time, progress=_print_result)
+    if args.save:
+        _save(args.save, current)
+
+    if args.command == "compare":
+        baseline = _load(args.baseline)
+        if baseline['machine'] != current['machine']:
+            print("Warning: baseline from a different machine or library versions", file=sys.stderr)
+        report = compare(baseline, current, args.threshold)
+        print(f"\n{'benchmark':<16} {'baseline':>12} {'current':>12} {'change':>8}")
+        for name, row in report.items():
+            flag = "  REGRESSION" if row['regression'] else ""
+            print(f"{name:<16} {row['baseline']*1e3:9.3f} ms {row['current']*1e3:9.3f} ms "
+                  f"{row['change']*100:+7.1f}%{flag}")
+        missing = sorted(set(current['results']) - set(report))
+        if missing:
+            print(f"Not in the baseline: {', '.join(missing)}")
+        regressions = [name for name, row in report.items() if row['regression']]
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold*100:g}%: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold*100:g}%")
@@ -0,0 +1,311 @@
+"""
+Multi-rate closed-loop detumbling on the event scheduler.
+
+Each component runs at its own rate on scheduler.Scheduler instead of one
+global dt:
+    gyro         100 Hz (gyro_params.m UpdateRate), sensor_noise.GYRO noise
+    estimator    averages the gyro samples of each control period
+    controller   1 Hz B-dot: coils off, wait for them to decay, sample the
+                 magnetometer (sensor_noise.MAGNETOMETER noise), then command
+                 the new dipole as coil voltages
+    coils        R-L circuits of the MTQRodSizing.py optimum, solved exactly
+                 between voltage commands (L/R of a few ms)
+    rigid body   attitude.AttitudePropagator in the orbit_field.py field
+The rigid body steps at most max_step. It takes one short step through each
+coil transient, over which the exact mean dipole is applied, and is only
+stopped exactly at events that change its inputs. Gyro samples read the rate
+from a lookahead step instead of cutting the steps at 100 Hz. A single-rate run
+would step at the finest of these rates throughout.
+
+The control law is the gyro-based B-dot m = (k/|B|) (w x b), b = B/|B|,
+for which w . (m x B) = -k |w x b|^2 <= 0, with the gain of Avanzini and
+Giulietti, k = 2 n (1 + sin i) J_min.
+"""
+
+import argparse
+import time
+from math import *
+
+import numpy as np
+
+from attitude import AttitudePropagator, T_orbit, inertia_matrix
+from attitude_determination import dcm_from_quat
+from MTQRodSizing import Pmax, sizing
+from orbit_field import i as inclination, load_table
+from scheduler import Scheduler
+from sensor_noise import GYRO, MAGNETOMETER, sensor_stream
+
+# MTQRodSizing.py optimum (Lcore, Rcore [mm], AWG 28 at 0.212 ohm/m, 5 layers),
+# at the current that draws Pmax
+rod = sizing(65.0, 8.4, 0.32, 0.212, 5, 1.0)
+R_coil = rod['Resistance [ohm]'] # [ohm]
+L_coil = rod['Inductance [H]'] # [H]
+moment_per_amp = rod['M [A*m^2]'] # [A*m^2/A]
+V_max = sqrt(Pmax * R_coil) # Drive voltage limit at Pmax [V]
+
+# Rates
+gyro_rate = GYRO.update_rate # [Hz]
+control_period = 1.0 # [s]
+settle = 5 * L_coil / R_coil # Coils off before the magnetometer sample [s]
+max_step = 0.1 # Largest rigid-body step [s], detumbling.py dt
+
+wi = radians(5) # Initial rate [rad/s]
+wf = radians(0.2) # Detumbled rate [rad/s]
+t_final = 3*60*60 # [s], detumbling.py td
+
+# Priorities of tasks due at the same instant: sample, then control, then monitor
+SENSOR, CONTROLLER, MONITOR = range(3)
+
+class Coils:
+    """
+    Three magnetorquer coils as R-L circuits driven by piecewise constant
+    voltages, i(t) = V/R + (i0 - V/R) exp(-(t - t_cmd) R/L).
+    """
+
+    def __init__(self, R=R_coil, L=L_coil, moment_per_amp=moment_per_amp, V_max=V_max):
+        self.R = R
+        self.tau = L / R # [s]
+        self.moment_per_amp = moment_per_amp
+        self.V_max = V_max
+        self.i0 = np.zeros(3) # Current at the last command [A]
+        self.V = np.zeros(3) # Commanded voltage [V]
+        self.t_cmd = 0.0
+        self.n_commands = 0
+
+    def current(self, t):
+        i_ss = self.V / self.R
+        return i_ss + (self.i0 - i_ss) * exp(-(t - self.t_cmd) / self.tau)
+
+    def command(self, t, V):
+        """
+        Apply the voltages V (3,) [V] from time t [s], limited to V_max.
+        """
+        self.i0 = self.current(t)
+        self.V = np.clip(V, -self.V_max, self.V_max)
+        self.t_cmd = t
+        self.n_commands += 1
+
+    def mean_dipole(self, t0, t1):
+        """
+        Dipole (3,) [A*m^2] averaged exactly over [t0, t1].
+        """
+        i_ss = self.V / self.R
+        decay = self.tau / (t1 - t0) * (exp(-(t0 - self.t_cmd)/self.tau) - exp(-(t1 - self.t_cmd)/self.tau))
+        return (i_ss + (self.i0 - i_ss) * decay) * self.moment_per_amp
+
+    def max_step(self, t):
+        """
+        Step limit [s] for dynamics driven by the coils: up to the end of a
+        transient (5 time constants after a command) while one lasts, so the
+        steps after it see a constant dipole; none once it has decayed.
+        """
+        remaining = self.t_cmd + 5 * self.tau - t
+        return remaining if remaining > 1e-12 else inf
+
+class RigidBody:
+    """
+    Attitude and rate under the coil torque m x B, with RK4 steps of at most
+    max_step (and the coils' step limit). The scheduler advances it to the
+    events that change its inputs (coil commands). Reads in between, such as
+    gyro samples, interpolate inside a lookahead step instead, so they do not
+    cut the steps short.
+    """
+
+    def __init__(self, coils, field, w0, q0=(1, 0, 0, 0), J=None, max_step=max_step):
+        self.propagator = AttitudePropagator(inertia_matrix() if J is None else J)
+        self.coils = coils
+        self.field = field
+        self.t = 0.0
+        self.q = np.array(q0, dtype=float).reshape(4, 1)
+        self.w = np.array(w0, dtype=float).reshape(3, 1)
+        self.max_step = max_step
+        self.n_steps = 0
+        self._ahead = None # (t, q, w) one step past self.t with the current inputs
+
+    def B_body(self, t, q=None):
+        """
+        Geomagnetic field in body frame (3,) [T] at time t [s], at the attitude
+        q (default the current one).
+        """
+        q = self.q if q is None else q
+        return dcm_from_quat(q[:, 0]) @ self.field.B(t)
+
+    def _step(self, h):
+        # One step from the current state, the dipole averaged over the step
+        t = self.t
+        torque = np.cross(self.coils.mean_dipole(t, t + h), self.B_body(t + h/2))
+        self.n_steps += 1
+        return (t + h,) + self.propagator._step(self.q, self.w, h, torque[:, None])
+
+    def _next_step(self):
+        return min(self.max_step, self.coils.max_step(self.t))
+
+    def advance(self, t0, t1):
+        while t1 - self.t > 1e-12:
+            if self._ahead is None or self._ahead[0] > t1 + 1e-12:
+                # The inputs change at t1: step exactly onto it
+                self._ahead = self._step(min(self._next_step(), t1 - self.t))
+            self.t, self.q, self.w = self._ahead
+            self._ahead = None
+
+    def rate(self, t):
+        """
+        Body rate (3,) [rad/s] at a time t [s] not before the current state,
+        linearly interpolated in the lookahead step (the inputs must not change
+        before t).
+        """
+        while True:
+            if self._ahead is None:
+                self._ahead = self._step(self._next_step())
+            t_ahead, q_ahead, w_ahead = self._ahead
+            if t <= t_ahead + 1e-12:
+                break
+            self.t, self.q, self.w = self._ahead
+            self._ahead = None
+        frac = (t - self.t) / (t_ahead - self.t)
+        return self.w[:, 0] + frac * (w_ahead[:, 0] - self.w[:, 0])
+
+class Sensor:
+    """
+    One sensor_noise.SensorModel sample at a time: truth plus the next sample
+    of the noise stream, quantised and saturated like the sensor.
+    """
+
+    def __init__(self, model, seed=0):
+        self.model = model
+        self._stream = sensor_stream(model, 2**62, seed=seed)
+        self._chunk = np.empty((0, 3))
+        self._row = 0
+
+    def sample(self, truth):
+        if self._row == len(self._chunk):
+            self._chunk = next(self._stream)
+            self._row = 0
+        noise = self._chunk[self._row]
+        self._row += 1
+        s = self.model.sensitivity
+        return np.clip(np.rint(truth * s) + noise * s, -self.model.sat_limit, self.model.sat_limit) / s
+
+def detumble(wi=wi, axis=(1, 1, 1), t_final=t_final, wf=wf, gain=1.0, gyro_rate=gyro_rate,
+             control_period=control_period, max_step=max_step, seed=0, field=None):
+    """
+    Closed-loop B-dot detumbling with every component at its own rate.
+    Parameters:
+        wi (float): Initial rate [rad/s] about axis (body frame)
+        t_final (float): Longest simulated time [s], the run stops once |w| < wf
+        gain (float): Multiple of the Avanzini-Giulietti gain
+        gyro_rate (float): Gyro sample rate [Hz]
+        control_period (float): B-dot period [s]
+        max_step (float): Largest rigid-body step [s]
+        seed (int): Sensor noise seed
+        field (FieldTable): Field lookup, default orbit_field.load_table()
+    Returns:
+        dict: 'time', 'w' (n, 3) [rad/s] and 'm' (n, 3) [A*m^2] once per control
+            period, 'detumble_time' [s] (nan if not reached), 'events' per task,
+            'body_steps', 'coil_commands'
+    """
+    field = field or load_table()
+    J = inertia_matrix()
+    k = 2 * (2*pi/T_orbit) * (1 + sin(inclination)) * np.min(np.linalg.eigvalsh(J)) * gain
+    m_max = V_max / R_coil * moment_per_amp
+
+    coils = Coils()
+    axis = np.asarray(axis, dtype=float)
+    body = RigidBody(coils, field, wi * axis / np.linalg.norm(axis), J=J, max_step=max_step)
+    gyro = Sensor(GYRO, seed)
+    magnetometer = Sensor(MAGNETOMETER, seed + 1)
+
+    scheduler = Scheduler()
+    scheduler.add_continuous(body.advance)
+    gyro_sum = np.zeros(3)
+    gyro_count = [0]
+    history = {'time': [], 'w': [], 'm': []}
+    detumble_time = [nan]
+
+    def sample_gyro(t):
+        gyro_sum[:] += gyro.sample(np.degrees(body.rate(t)))
+        gyro_count[0] += 1
+
+    def estimate_rate():
+        # Mean gyro rate over the last control period [rad/s]
+        w_est = np.radians(gyro_sum / max(gyro_count[0], 1))
+        gyro_sum[:] = 0
+        gyro_count[0] = 0
+        return w_est
+
+    def control(t):
+        # Coils off so the magnetometer does not see them, sample once they decayed
+        coils.command(t, np.zeros(3))
+        w_est = estimate_rate()
+        scheduler.after(settle, lambda t: actuate(t, w_est), CONTROLLER, 'actuate')
+
+    def actuate(t, w_est):
+        B_meas = magnetometer.sample(body.B_body(t) * 1e6) * 1e-6 # [T]
+        B_norm = np.linalg.norm(B_meas)
+        m = k / B_norm * np.cross(w_est, B_meas / B_norm)
+        m *= min(1.0, m_max / np.max(np.abs(m))) if np.any(m) else 1.0 # Keep the direction
+        coils.command(t, m / moment_per_amp * R_coil)
+
+    def monitor(t):
+        history['time'].append(t)
+        history['w'].append(body.w[:, 0].copy())
+        history['m'].append(coils.current(t) * moment_per_amp)
+        if np.linalg.norm(body.w) < wf:
+            detumble_time[0] = t
+            scheduler.stop()
+
+    scheduler.every(1 / gyro_rate, sample_gyro, priority=SENSOR, name='gyro', advance=False)
+    scheduler.every(control_period, control, offset=control_period, priority=CONTROLLER, name='control')
+    scheduler.every(control_period, monitor, priority=MONITOR, name='monitor')
+    scheduler.run(t_final)
+
+    return {
+        'time': np.array(history['time']),
+        'w': np.array(history['w']),
+        'm': np.array(history['m']),
+        'detumble_time': detumble_time[0],
+        'events': scheduler.stats(),
+        'body_steps': body.n_steps,
+        'coil_commands': coils.n_commands,
+    }
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Multi-rate closed-loop B-dot detumbling")
+    parser.add_argument("--wi", type=float, default=degrees(wi), help="Initial rate [deg/s]")
+    parser.add_argument("--gain", type=float, default=1.0, help="Multiple of the Avanzini-Giulietti gain")
+    parser.add_argument("--hours", type=float, default=t_final/3600, help="Longest simulated time [h]")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plot", action="store_true", help="Plot the body rates and dipoles")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = detumble(radians(args.wi), gain=args.gain, t_final=args.hours*3600, seed=args.seed)
+    elapsed = time.perf_counter() - start
+
+    t_end = result['time'][-1]
+    tau = L_coil / R_coil
+    print("---------------MULTI-RATE DETUMBLING------------")
+    print(f"Coils: R {R_coil:.2f} ohm, L {L_coil*1e3:.1f} mH, L/R {tau*1e3:.2f} ms, "
+          f"max dipole {V_max/R_coil*moment_per_amp:.3f} A*m^2")
+    if isnan(result['detumble_time']):
+        print(f"Not detumbled within {t_end/3600:.2f} h, |w| {degrees(np.linalg.norm(result['w'][-1])):.3f} deg/s")
+    else:
+        print(f"Detumbled below {degrees(wf):g} deg/s after {result['detumble_time']/60:.1f} min")
+    print(f"Simulated {t_end:.0f} s in {elapsed:.1f} s")
+    print("Events: " + ", ".join(f"{name} {n}" for name, n in result['events'].items()))
+    print(f"Rigid-body steps: {result['body_steps']} "
+          f"(single rate at L/R: {int(t_end / tau)}, at the gyro rate: {int(t_end * gyro_rate)})")
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(2, 1, sharex=True)
+        axes[0].plot(result['time'], np.degrees(result['w']), label=['x', 'y', 'z'])
+        axes[0].set_ylabel('Body rate [deg/s]')
+        axes[1].plot(result['time'], result['m'], label=['x', 'y', 'z'])
+        axes[1].set_ylabel('Dipole [A*m^2]')
+        axes[1].set_xlabel('Time [s]')
+        for ax in axes:
+            ax.grid(True)
+            ax.legend()
+        plt.show()
@@ -0,0 +1,365 @@
+"""
+Gain tuning for the B-dot detumbling controller of detumbling.py.
+
+Every candidate (feedback gain k, dipole limit m_max) is simulated with the
+same Euler scheme as detumbling.simulate() and scored on
+    time:   time to detumble (|w| < wf) relative to td
+    duty:   fraction of that time with the dipole saturated at m_max
+    energy: magnetorquer energy relative to both rods at rated power for td
+combined as a weighted sum (lower is better). A candidate that does not
+detumble within t_final is charged t_final plus its residual rate |w|/|wi| as
+its time, so such candidates still rank by how far they got.
+
+Candidates are simulated in lockstep batches with detumbling.batch_step(),
+and the batches are spread over a process pool. The time and energy terms only
+grow during a run, so a candidate is stopped (pruned) as soon as they alone
+exceed the best cost found so far by more than the pruning margin. Finished
+and pruned candidates are dropped from the batch.
+
+Pruning only pays off once some candidate detumbles within t_final. A
+candidate that does not is charged at least t_final/td, which the bound of a
+running candidate never exceeds, and the rate keeps falling slowly to the end
+of the run rather than stalling, so there is no earlier sign that it will not
+make it. With the nominal 25 uT field no candidate detumbles and every one runs
+the full 108k steps; at 60 uT about half of them are pruned.
+
+The search is either a single grid or a refinement: a coarse grid, then
+successively finer grids around the best candidate. The optimum is returned
+with its sensitivity curves, the metrics along k and m_max through the optimum.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import *
+
+import numpy as np
+
+from detumbling import B, Jz, batch_gain, batch_step, dt, m_x, t_final, td, wf, wi
+from MTQRodSizing import Pmax
+
+P_rated = Pmax # Power of one rod at the rated dipole m_x [W], P ~ m^2
+WEIGHTS = {'time': 1.0, 'duty': 0.0, 'energy': 0.1}
+margin = 0.05 # Candidates bounded above (1 + margin) * best cost are pruned
+prune_every = 100 # Steps between pruning checks
+
+# Search space
+k_range = (0.1, 1000) # Feedback gain, searched in log scale
+m_range = (0.05, m_x) # Dipole limit [A*m^2], up to the rated dipole
+
+def evaluate(k, m_max, wi=wi, B=B, Jz=Jz, dt=dt, t_final=t_final, wf=wf, weights=WEIGHTS,
+             best_cost=inf, margin=margin):
+    """
+    Simulate a batch of candidates in lockstep and score them.
+    Parameters:
+        k (array_like): Feedback gains
+        m_max (array_like): Dipole limits [A*m^2], broadcast against k
+        wi, B, Jz, dt, t_final, wf: As for detumbling.simulate_batch()
+        weights (dict): Weights of the 'time', 'duty' and 'energy' metrics
+        best_cost (float): Best cost known from elsewhere, for pruning
+        margin (float): Pruning margin relative to the best cost, inf to never prune
+    Returns:
+        dict: Arrays over the candidates: 'k', 'm_max', 'detumble_time' [s] (nan if
+            not reached), 'w_final' [rad/s] (rate at the end of the run, nan if pruned),
+            'duty' (saturated fraction), 'energy' [J], 'cost' (inf if pruned),
+            'pruned' (bool), and 'steps', the candidate steps simulated
+    """
+    k, m_max = (np.array(a, dtype=float).ravel() for a in np.broadcast_arrays(k, m_max))
+    n = len(k)
+    n_steps = int(ceil(t_final / dt))
+    E_ref = 2 * P_rated * td
+    energy_scale = 2 * P_rated / m_x**2 * dt # [J] per (A*m^2)^2 step, both rods
+    w_time, w_duty, w_energy = (weights.get(name, 0.0) for name in ('time', 'duty', 'energy'))
+
+    detumble_time = np.full(n, np.nan)
+    w_final = np.full(n, np.nan)
+    duty = np.full(n, np.nan)
+    energy = np.full(n, np.nan)
+    cost = np.full(n, np.inf)
+    pruned = np.zeros(n, dtype=bool)
+    best = best_cost
+    steps = 0
+
+    # State of the candidates still running, and their indices into the outputs
+    idx = np.arange(n)
+    w = np.full(n, float(wi))
+    kk = k.copy()
+    mm = m_max.copy()
+    n_saturated = np.zeros(n, dtype=np.int64)
+    m2_sum = np.zeros(n)
+
+    gain = batch_gain(B, Jz, dt)
+
+    def buffers(size):
+        return np.empty(size), np.empty(size), np.empty(size), np.empty(size, dtype=bool)
+
+    m, m_abs, phase, flag = buffers(n)
+
+    def finish(done, status_steps):
+        """
+        Score the candidates that reach |w| < wf, return the mask of those still running.
+        """
+        nonlocal best
+        i = idx[done]
+        detumble_time[i] = status_steps * dt
+        w_final[i] = w[done]
+        duty[i] = n_saturated[done] / status_steps
+        energy[i] = m2_sum[done] * energy_scale
+        cost[i] = (w_time * detumble_time[i] / td + w_duty * duty[i] + w_energy * energy[i] / E_ref)
+        best = min(best, cost[i].min())
+        return ~done
+
+    for step in range(n_steps):
+        t = step * dt
+
+        batch_step(w, t, kk, mm, gain, m, phase)
+        np.abs(m, out=m_abs)
+        np.greater_equal(m_abs, mm, out=flag)
+        n_saturated += flag
+        np.multiply(m_abs, m_abs, out=phase)
+        m2_sum += phase
+        steps += len(w)
+
+        np.abs(w, out=m_abs)
+        np.less(m_abs, wf, out=flag)
+        keep = finish(flag, step + 1) if flag.any() else None
+
+        if (step + 1) % prune_every == 0 and isfinite(best):
+            # Lower bound of the final cost: the duty term can still be 0
+            bound = w_time * (t + dt) / td + w_energy * m2_sum * energy_scale / E_ref
+            over = bound > best * (1 + margin)
+            if keep is not None:
+                over &= keep # Candidates that just detumbled are scored, not pruned
+            if over.any():
+                pruned[idx[over]] = True
+                keep = ~over if keep is None else keep & ~over
+
+        if keep is not None:
+            idx, w, kk, mm = idx[keep], w[keep], kk[keep], mm[keep]
+            n_saturated, m2_sum = n_saturated[keep], m2_sum[keep]
+            m, m_abs, phase, flag = buffers(len(idx))
+            if len(idx) == 0:
+                break
+
+    # Not detumbled within t_final: metrics over the whole run, the time term
+    # t_final/td plus the residual rate
+    if len(idx):
+        w_final[idx] = w
+        duty[idx] = n_saturated / n_steps
+        energy[idx] = m2_sum * energy_scale
+        cost[idx] = (w_time * (n_steps * dt / td + np.abs(w) / abs(wi)) + w_duty * duty[idx]
+                     + w_energy * energy[idx] / E_ref)
+
+    return {
+        'k': k,
+        'm_max': m_max,
+        'detumble_time': detumble_time,
+        'w_final': w_final,
+        'duty': duty,
+        'energy': energy,
+        'cost': cost,
+        'pruned': pruned,
+        'steps': steps,
+    }
+
+def _evaluate(args):
+    k, m_max, options = args
+    return evaluate(k, m_max, **options)
+
+def _merge(results):
+    merged = {key: np.concatenate([r[key] for r in results]) for key in results[0] if key != 'steps'}
+    merged['steps'] = sum(r['steps'] for r in results)
+    return merged
+
+def _best(candidates):
+    # Lowest cost; ties (e.g. candidates that all stall at the same rate) go to
+    # the lowest energy, then the lowest duty
+    return int(np.lexsort((candidates['duty'], candidates['energy'], candidates['cost']))[0])
+
+def evaluate_parallel(k, m_max, workers=None, pool=None, **options):
+    """
+    evaluate() with the candidates split into batches over a process pool.
+    Each batch prunes against the best cost passed in and its own best.
+    Parameters:
+        workers (int): Number of worker processes, None for os.cpu_count(),
+            1 to run in this process
+        pool (ProcessPoolExecutor): Existing pool to use instead
+        options: Keyword arguments of evaluate()
+    """
+    k, m_max = (np.array(a, dtype=float).ravel() for a in np.broadcast_arrays(k, m_max))
+    workers = workers or os.cpu_count() or 1
+    if pool is None and workers == 1:
+        return evaluate(k, m_max, **options)
+
+    # One batch per worker: the per-step overhead is paid per batch, and finished
+    # candidates leave their batch anyway
+    n_batches = min(len(k), workers)
+    jobs = [(kb, mb, options) for kb, mb in zip(np.array_split(k, n_batches), np.array_split(m_max, n_batches))]
+    if pool is not None:
+        return _merge(list(pool.map(_evaluate, jobs)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _merge(list(pool.map(_evaluate, jobs)))
+
+def grid(k_range=k_range, m_range=m_range, n_k=25, n_m=8):
+    """
+    Candidate grid, log-spaced in k and linear in m_max.
+    Returns:
+        tuple: (k (n_k * n_m,), m_max (n_k * n_m,))
+    """
+    K, M = np.meshgrid(np.geomspace(*k_range, n_k), np.linspace(*m_range, n_m), indexing='ij')
+    return K.ravel(), M.ravel()
+
+def search(method='refine', k_range=k_range, m_range=m_range, n_k=25, n_m=8, rounds=4, shrink=0.25,
+           workers=None, **options):
+    """
+    Find the candidate of lowest cost.
+    Parameters:
+        method (str): 'grid' (one n_k x n_m grid) or 'refine' (then rounds - 1 finer
+            grids around the best, each spanning shrink times the previous one)
+        k_range, m_range (tuple): Search bounds
+        n_k, n_m (int): Grid size per round
+        workers (int): Worker processes, see evaluate_parallel()
+        options: Keyword arguments of evaluate()
+    Returns:
+        dict: 'best' (index into the candidates), 'candidates' (evaluate() results of
+            every round, concatenated), 'rounds' (candidates per round)
+    """
+    if method not in ('grid', 'refine'):
+        raise ValueError(f"Unknown search method {method!r}")
+    rounds = 1 if method == 'grid' else rounds
+    log_k = [log10(k_range[0]), log10(k_range[1])]
+    m_lo, m_hi = m_range
+
+    results = []
+    best_cost = options.pop('best_cost', inf)
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for r in range(rounds):
+            k, m_max = grid((10**log_k[0], 10**log_k[1]), (m_lo, m_hi), n_k, n_m)
+            result = evaluate_parallel(k, m_max, workers, pool, best_cost=best_cost, **options)
+            results.append(result)
+            best_cost = min(best_cost, result['cost'].min())
+
+            # Next grid: centred on the best of all rounds, shrunk, inside the bounds
+            candidates = _merge(results)
+            j = _best(candidates)
+            half_k = (log_k[1] - log_k[0]) * shrink / 2
+            half_m = (m_hi - m_lo) * shrink / 2
+            centre_k = log10(candidates['k'][j])
+            centre_m = candidates['m_max'][j]
+            log_k = [max(centre_k - half_k, log10(k_range[0])), min(centre_k + half_k, log10(k_range[1]))]
+            m_lo, m_hi = max(centre_m - half_m, m_range[0]), min(centre_m + half_m, m_range[1])
+    finally:
+        if pool:
+            pool.shutdown()
+
+    candidates = _merge(results)
+    return {
+        'best': _best(candidates),
+        'candidates': candidates,
+        'rounds': [len(r['k']) for r in results],
+    }
+
+def sensitivity(k, m_max, k_values=None, m_values=None, m_range=m_range, workers=None, **options):
+    """
+    Metrics along k (at m_max) and along m_max (at k), without pruning.
+    Parameters:
+        k, m_max (float): The point the curves pass through, typically the optimum
+        k_values, m_values (array_like): Where to evaluate, default 41 points over
+            k/10..10k and 21 over m_range
+        m_range (tuple): Dipole limit range of the default m_values [A*m^2]
+    Returns:
+        dict: {'k': evaluate() result along k, 'm_max': evaluate() result along m_max}
+    """
+    k_values = np.geomspace(k/10, k*10, 41) if k_values is None else np.asarray(k_values, dtype=float)
+    m_values = np.linspace(*m_range, 21) if m_values is None else np.asarray(m_values, dtype=float)
+    options = dict(options, margin=inf)
+    return {
+        'k': evaluate_parallel(k_values, m_max, workers, **options),
+        'm_max': evaluate_parallel(k, m_values, workers, **options),
+    }
+
+def tune(method='refine', workers=None, weights=WEIGHTS, **options):
+    """
+    search() for the optimal gain and dipole limit, then its sensitivity curves.
+    Returns:
+        dict: 'k', 'm_max', 'detumble_time' [s] (nan if not reached), 'w_final' [rad/s],
+            'duty', 'energy' [J], 'cost' of the optimum, 'search' (search() result) and 'sensitivity' (sensitivity() result)
+    """
+    found = search(method, workers=workers, weights=weights, **options)
+    candidates, i = found['candidates'], found['best']
+    sim_options = {key: value for key, value in options.items()
+                   if key in ('wi', 'B', 'Jz', 'dt', 't_final', 'wf')}
+    curves = sensitivity(candidates['k'][i], candidates['m_max'][i], workers=workers, weights=weights,
+                         m_range=options.get('m_range', m_range), **sim_options)
+    best = {key: float(candidates[key][i])
+            for key in ('k', 'm_max', 'detumble_time', 'w_final', 'duty', 'energy', 'cost')}
+    return dict(best, search=found, sensitivity=curves)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Tune the B-dot gain and dipole limit of detumbling.py")
+    parser.add_argument("--method", choices=["grid", "refine"], default="refine")
+    parser.add_argument("--weights", type=float, nargs=3, default=[WEIGHTS[k] for k in ('time', 'duty', 'energy')],
+                        metavar=("TIME", "DUTY", "ENERGY"), help="Cost weights of the normalised metrics")
+    parser.add_argument("--k-range", type=float, nargs=2, default=k_range)
+    parser.add_argument("--m-range", type=float, nargs=2, default=m_range, help="Dipole limit range [A*m^2]")
+    parser.add_argument("--grid", type=int, nargs=2, default=[25, 8], metavar=("N_K", "N_M"),
+                        help="Grid size (per round)")
+    parser.add_argument("--rounds", type=int, default=4, help="Refinement rounds")
+    parser.add_argument("--wi", type=float, default=degrees(wi), help="Initial rate [deg/s]")
+    parser.add_argument("--B", type=float, default=B*1e6, help="Field strength [uT]")
+    parser.add_argument("--margin", type=float, default=margin, help="Pruning margin, relative to the best cost")
+    parser.add_argument("--workers", type=int, help="Worker processes, default one per CPU")
+    parser.add_argument("--plot", action="store_true", help="Plot the sensitivity curves")
+    args = parser.parse_args()
+
+    weights = dict(zip(('time', 'duty', 'energy'), args.weights))
+    start = time.perf_counter()
+    result = tune(args.method, args.workers, weights, k_range=tuple(args.k_range), m_range=tuple(args.m_range),
+                  n_k=args.grid[0], n_m=args.grid[1], rounds=args.rounds, margin=args.margin,
+                  wi=radians(args.wi), B=args.B*1e-6)
+    elapsed = time.perf_counter() - start
+
+    candidates = result['search']['candidates']
+    n = len(candidates['k'])
+    full = n * int(ceil(t_final / dt))
+    print("---------------B-DOT GAIN TUNING------------")
+    print("Weights: " + ", ".join(f"{name} {value:g}" for name, value in weights.items()))
+    print(f"{n} candidates ({' + '.join(map(str, result['search']['rounds']))}) in {elapsed:.1f} s, "
+          f"{candidates['pruned'].sum()} pruned, {candidates['steps']/full*100:.1f} % of the full-length steps")
+    print(f"Optimal gain k: {result['k']:.4g}")
+    print(f"Optimal dipole limit: {result['m_max']:.3f} A*m^2")
+    if isnan(result['detumble_time']):
+        print(f"Not detumbled within {t_final/3600:.1f} h, final rate {degrees(abs(result['w_final'])):.3f} deg/s")
+    else:
+        print(f"Detumble time: {result['detumble_time']/60:.1f} min")
+    print(f"Saturated duty: {result['duty']*100:.1f} %")
+    print(f"Energy: {result['energy']:.1f} J")
+
+    nominal = evaluate(10, m_x, radians(args.wi), args.B*1e-6, weights=weights, margin=inf)
+    reached = (f"{nominal['detumble_time'][0]/60:.1f} min" if not isnan(nominal['detumble_time'][0])
+               else f"not detumbled ({degrees(abs(nominal['w_final'][0])):.3f} deg/s)")
+    print(f"Hand-picked k = 10, {m_x} A*m^2: {reached}, duty {nominal['duty'][0]*100:.1f} %, "
+          f"{nominal['energy'][0]:.1f} J, cost {nominal['cost'][0]:.4f} (optimum {result['cost']:.4f})")
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(3, 2, sharex='col', figsize=(10, 8))
+        for column, (name, curve) in enumerate(result['sensitivity'].items()):
+            x = curve[name]
+            axes[0, column].plot(x, curve['detumble_time'] / 60)
+            axes[1, column].plot(x, curve['duty'] * 100)
+            axes[2, column].plot(x, curve['energy'])
+            for row in axes[:, column]:
+                row.axvline(result[name], linestyle='--', color='gray')
+                row.grid(True)
+            axes[2, column].set_xlabel('Gain k' if name == 'k' else 'Dipole limit [A*m^2]')
+        axes[0, 0].set_xscale('log')
+        axes[0, 0].set_ylabel('Detumble time [min]')
+        axes[1, 0].set_ylabel('Saturated duty [%]')
+        axes[2, 0].set_ylabel('Energy [J]')
+        plt.tight_layout()
+        plt.show()
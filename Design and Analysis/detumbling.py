@@ -4,9 +4,16 @@
 # Constant magnetic field in orbital frame
 
 
+import argparse
 from math import *
 import numpy as np
-import matplotlib.pyplot as plt
+
+import instrument
+import integrators
+import plotting
+from integrators import Event, rk4, rk45
+from history import HistoryRecorder
+from resultcache import add_cache_arguments, cache_from_args, code_version
 
 wi = radians(5)
 wf = radians(0.2)
@@ -16,55 +23,372 @@ m_x = 0.4 # Magnetic dipole moment [A*m^2]
 m_y = 0.4 # Magnetic dipole moment [A*m^2]
 td = 3*60*60 # Desired maximum detumbling time [s] 3 hours (~2 orbits)
 
+# Time parameters
+dt = 0.1  # time step [s]
+t_final = td # total simulation time [s]
+k = 10 # Feedback gain
+
+# Integrator settings for simulate_ode()
+rk4_step = 1.0 # RK4 step [s]
+rtol = 1e-8 # RK45 relative tolerance
+atol = 1e-10 # RK45 absolute tolerance [rad/s]
+
 def wdot(J,T):
     wdot = T/J
     return wdot
 
-# Time parameters
-dt = 0.1  # time step [s]
-t_final = td # total simulation time [s]
-time = np.arange(0, t_final, dt)
-# Store results
-w_history = []
-m_y_history = []
-m_x_history = []
-
-# Simulation loop
-w = wi
-k = 10
-
-for t in time:
-    m_y = k*w # Feedback control law
-    m_x = k*w
-    m_y = np.clip(m_y, -0.4, 0.4)  # Limit magnetic dipole moment
-    m_x = np.clip(m_x, -0.4, 0.4)  # Limit magnetic dipole moment
-    
+@instrument.timed('detumbling.simulate')
+def simulate(wi=wi, B=B, Jz=Jz, k=k, m_max=m_x, dt=dt, t_final=t_final, decimate=1, envelope=False, path=None):
+    """
+    Simulate the z-axis rate under B-dot style dipole feedback.
+    Parameters:
+        wi (float): Initial angular velocity [rad/s]
+        B (float): Magnetic field strength [T]
+        Jz (float): Moment of inertia about z [kg*m^2]
+        k (float): Feedback gain
+        m_max (float): Dipole limit of each magnetorquer [A*m^2]
+        dt (float): Time step [s]
+        t_final (float): Total simulation time [s]
+        decimate (int): Keep every decimate-th step (see history.HistoryRecorder)
+        envelope (bool): Keep the [min, max] of each block of decimate steps instead
+        path (str): Stream the histories to this .npy file (columns time, w, m_x, m_y)
+    Returns:
+        dict: 'time', 'w' [rad/s], 'm_x' and 'm_y' [A*m^2] histories
+    """
+
+    # Same instants as np.arange(0, t_final, dt), generated as needed
+    n_steps = int(ceil(t_final / dt))
+    # Store results
+    history = HistoryRecorder(('time', 'w', 'm_x', 'm_y'), n_steps, decimate, envelope, path)
+
+    # Simulation loop
+    w = wi
+    recorder = instrument.active()
+    stages = recorder and recorder.stages(('detumbling.control', 'detumbling.field',
+                                           'detumbling.dynamics', 'detumbling.history'))
+
+    for i in range(n_steps):
+        t = i * dt
+        m_y = k*w # Feedback control law
+        m_x = k*w
+        m_y = np.clip(m_y, -m_max, m_max)  # Limit magnetic dipole moment
+        m_x = np.clip(m_x, -m_max, m_max)  # Limit magnetic dipole moment
+        if stages: stages.mark(0)
+
+        Bx = B*cos(w*t)
+        By = -B*sin(w*t)
+        Bz = 0
+        if stages: stages.mark(1)
+
+        w =  w + wdot(Jz, -m_y*Bx + m_x*By) * dt
+        if stages: stages.mark(2)
+        history.record(t, w, m_x, m_y)
+        if stages: stages.mark(3)
+
+    if stages:
+        stages.close()
+        recorder.count('detumbling.steps', n_steps)
+    return history.result()
+
+def batch_gain(B=B, Jz=Jz, dt=dt):
+    """
+    Rate change per unit dipole of one batch_step() at the phase peak [rad/s/(A*m^2)].
+    """
+    # -m_y*Bx + m_x*By with m_x = m_y = m, Bx = B cos(wt), By = -B sin(wt)
+    # is -m*B*(cos(wt) + sin(wt)) = -sqrt(2)*m*B*sin(wt + pi/4)
+    return sqrt(2) * np.asarray(B, dtype=float) * dt / Jz
+
+def batch_step(w, t, k, m_max, gain, m, phase):
+    """
+    One Euler step of the simulate() dynamics for a batch of cases, in place.
+    Parameters:
+        w (ndarray): Rates at t [rad/s], advanced to t + dt
+        t (float): Time of the step [s]
+        k, m_max (array_like): Feedback gains and dipole limits [A*m^2]
+        gain (array_like): batch_gain() of the cases
+        m (ndarray): Receives the commanded dipole of the step [A*m^2]
+        phase (ndarray): Work buffer shaped like w
+    """
+    # Feedback control law, limited to the dipole capability
+    np.multiply(k, w, out=m)
+    np.clip(m, -m_max, m_max, out=m)
+
+    np.multiply(w, t, out=phase)
+    phase += pi/4
+    np.sin(phase, out=phase)
+    phase *= m
+    phase *= gain
+    w -= phase
+
+@instrument.timed('detumbling.simulate_batch')
+def simulate_batch(wi=wi, B=B, Jz=Jz, k=k, m_max=m_x, dt=dt, t_final=t_final, wf=wf):
+    """
+    Vectorised simulate() for N independent cases advanced in lockstep.
+    Any parameter may be an array of N values, scalars are shared by all cases.
+    Only per-case statistics are kept, not the histories.
+    Parameters:
+        wi, B, Jz, k, m_max (array_like): As for simulate()
+        dt (float): Time step [s], common to all cases
+        t_final (float): Total simulation time [s]
+        wf (float): Detumbled rate threshold [rad/s]
+    Returns:
+        dict: Arrays over the cases
+            'detumble_time' [s]: first time |w| < wf, nan if never reached
+            'w_final' [rad/s]: rate at t_final
+            'm_peak' [A*m^2]: peak commanded dipole magnitude (per axis)
+            'm_mean' [A*m^2]: mean dipole magnitude over the run
+            'saturated_fraction': fraction of steps with the dipole at its limit
+    """
+
+    wi, B, Jz, k, m_max = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (wi, B, Jz, k, m_max)))
+    time = np.arange(0, t_final, dt).tolist()
+
+    w = wi.copy()
+    detumble_time = np.full(w.shape, np.nan)
+    pending = np.ones(w.shape, dtype=bool)
+    m_peak = np.zeros(w.shape)
+    m_sum = np.zeros(w.shape)
+    n_saturated = np.zeros(w.shape, dtype=np.int64)
+
+    gain = batch_gain(B, Jz, dt)
+
+    # Work buffers, so the step loop does not allocate
+    m = np.empty(w.shape)
+    m_abs = np.empty(w.shape)
+    phase = np.empty(w.shape)
+    flag = np.empty(w.shape, dtype=bool)
+    instrument.count('detumbling.batch_case_steps', w.size * len(time))
+
+    for t in time:
+        batch_step(w, t, k, m_max, gain, m, phase)
+
+        np.abs(m, out=m_abs)
+        np.maximum(m_peak, m_abs, out=m_peak)
+        m_sum += m_abs
+        np.greater_equal(m_abs, m_max, out=flag)
+        n_saturated += flag
+
+        np.abs(w, out=m_abs)
+        np.less(m_abs, wf, out=flag)
+        flag &= pending
+        if flag.any():
+            detumble_time[flag] = t + dt
+            pending &= ~flag
+
+    return {
+        'detumble_time': detumble_time,
+        'w_final': w,
+        'm_peak': m_peak,
+        'm_mean': m_sum / len(time),
+        'saturated_fraction': n_saturated / len(time),
+    }
+
+def rate_derivative(t, w, B=B, Jz=Jz, k=k, m_max=m_x):
+    """
+    Right-hand side of the rate dynamics in simulate(), dw/dt [rad/s^2].
+    """
+    m = min(max(k*w, -m_max), m_max)
     Bx = B*cos(w*t)
     By = -B*sin(w*t)
-    Bz = 0
-    
-    w =  w + wdot(Jz, -m_y*Bx + m_x*By) * dt
-    m_y_history.append(m_y)
-    m_x_history.append(m_x) 
-    w_history.append(w)
-
-# --- Plot ---
-plt.figure()
-plt.plot(time, w_history, label='ω_z [deg/s]')
-plt.plot(time, 0 * np.ones_like(time), 'k--', label='ω_z = 0')
-plt.plot(time, wf * np.ones_like(time), 'b--', label='ω_z = 2deg/s')
-plt.xlabel('Time [s]')
-plt.ylabel('Angular velocity z [rad/s]')
-
-plt.figure()
-plt.plot(time, m_y_history, label='m_y [A*m^2]')
-plt.xlabel('Time [s]')
-plt.ylabel('Magnetic dipole moment y [A*m^2]')
-
-plt.figure()
-plt.plot(time, m_x_history, label='m_x [A*m^2]')
-plt.xlabel('Time [s]')  
-plt.ylabel('Magnetic dipole moment x [A*m^2]')
-
-plt.show()
+    return wdot(Jz, -m*Bx + m*By)
+
+@instrument.timed('detumbling.simulate_ode')
+def simulate_ode(wi=wi, B=B, Jz=Jz, k=k, m_max=m_x, t_final=t_final, wf=wf,
+                 method='rk45', rk4_step=rk4_step, rtol=rtol, atol=atol, stop_at_wf=True):
+    """
+    Integrate the rate dynamics of simulate() with a higher order integrator.
+    Steps end exactly where the dipole enters or leaves saturation (the control
+    law has a kink there) and, with stop_at_wf, the run ends once |w| < wf.
+    Parameters:
+        wi, B, Jz, k, m_max (float): As for simulate()
+        t_final (float): Total simulation time [s]
+        wf (float): Detumbled rate threshold [rad/s]
+        method (str): 'rk4' (fixed step rk4_step) or 'rk45' (adaptive, rtol/atol)
+        stop_at_wf (bool): End the run at the detumble event
+    Returns:
+        dict: 'time', 'w' [rad/s], 'm_x' and 'm_y' [A*m^2] at the steps taken,
+            'detumble_time' [s] (nan if never reached), 'n_steps' and 'n_fev'
+    """
+
+    def f(t, y):
+        return np.array([rate_derivative(t, y[0], B, Jz, k, m_max)])
+
+    events = [
+        Event(lambda t, y: abs(k*y[0]) - m_max),
+        Event(lambda t, y: abs(y[0]) - wf, terminal=stop_at_wf, direction=-1),
+    ]
+    if method == 'rk4':
+        result = rk4(f, (0, t_final), [wi], rk4_step, events=events)
+    elif method == 'rk45':
+        result = rk45(f, (0, t_final), [wi], rtol=rtol, atol=atol, events=events)
+    else:
+        raise ValueError(f"Unknown integration method {method!r}")
+
+    w = result['y'][:, 0]
+    m = np.clip(k*w, -m_max, m_max)
+    crossings = result['t_events'][1]
+    return {
+        'time': result['t'],
+        'w': w,
+        'm_x': m,
+        'm_y': m,
+        'detumble_time': crossings[0] if len(crossings) else np.nan,
+        'n_steps': result['n_steps'],
+        'n_fev': result['n_fev'],
+    }
+
+def dispersed_cases(n, seed=0):
+    """
+    Draw n dispersed detumbling cases around the nominal parameters.
+    Initial rate uniform 1-10 deg/s with random sign, Jz and the dipole limit
+    +-10 %, field strength uniform 20-50 uT (LEO range), gain +-20 %.
+    Returns:
+        dict: Keyword arguments for simulate_batch()
+    """
+
+    rng = np.random.default_rng(seed)
+    return {
+        'wi': np.radians(rng.uniform(1, 10, n)) * rng.choice([-1, 1], n),
+        'Jz': Jz * rng.uniform(0.9, 1.1, n),
+        'B': rng.uniform(20e-6, 50e-6, n),
+        'm_max': m_x * rng.uniform(0.9, 1.1, n),
+        'k': k * rng.uniform(0.8, 1.2, n),
+    }
+
+def draw_figures(history, axes, max_points=plotting.max_points, method=plotting.method):
+    """
+    Draw the rate and the y and x dipole histories on three matplotlib axes,
+    downsampled to max_points per series (see plotting.downsample()).
+    """
+    time = history['time']
+    if time.ndim == 2:
+        time = time[:, 0]  # Start of each envelope block
+    ax_w, ax_m_y, ax_m_x = axes
+
+    plotting.plot_series(ax_w, time, history['w'], max_points, method, label='ω_z [deg/s]')
+    ax_w.axhline(0, color='k', linestyle='--', label='ω_z = 0')
+    ax_w.axhline(wf, color='b', linestyle='--', label='ω_z = 2deg/s')
+    ax_w.set_xlabel('Time [s]')
+    ax_w.set_ylabel('Angular velocity z [rad/s]')
+
+    plotting.plot_series(ax_m_y, time, history['m_y'], max_points, method, label='m_y [A*m^2]')
+    ax_m_y.set_xlabel('Time [s]')
+    ax_m_y.set_ylabel('Magnetic dipole moment y [A*m^2]')
+
+    plotting.plot_series(ax_m_x, time, history['m_x'], max_points, method, label='m_x [A*m^2]')
+    ax_m_x.set_xlabel('Time [s]')
+    ax_m_x.set_ylabel('Magnetic dipole moment x [A*m^2]')
+
+def save_figures(history, prefix, fmt='png', max_points=plotting.max_points, method=plotting.method):
+    """
+    Render the figures of draw_figures() without a display to
+    {prefix}rate.{fmt}, {prefix}m_y.{fmt} and {prefix}m_x.{fmt}.
+    Returns:
+        list: Paths written
+    """
+    figures = [plotting.new_figure() for _ in range(3)]
+    draw_figures(history, [ax for _, ax in figures], max_points, method)
+    return [plotting.save(fig, f"{prefix}{name}.{fmt}") for (fig, _), name in zip(figures, ('rate', 'm_y', 'm_x'))]
+
+def case_figures(case, prefix, fmt='png', max_points=plotting.max_points, method=plotting.method):
+    """
+    Simulate one case (keyword arguments of simulate()) and save its figures.
+    """
+    return save_figures(simulate(**case), prefix, fmt, max_points, method)
+
+def campaign_figure(stats, path):
+    """
+    Histogram of the detumble times of a simulate_batch() campaign, saved to path.
+    """
+    fig, ax = plotting.new_figure()
+    detumbled = ~np.isnan(stats['detumble_time'])
+    ax.hist(stats['detumble_time'][detumbled] / 60, bins=50)
+    ax.set_xlabel('Detumble time [min]')
+    ax.set_ylabel('Cases')
+    ax.set_title(f"{detumbled.mean()*100:.1f} % of {len(detumbled)} cases detumbled within {t_final/3600:.1f} h")
+    return plotting.save(fig, path)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Single-axis detumbling simulation")
+    parser.add_argument("--monte-carlo", type=int, metavar="N",
+                        help="Run N dispersed cases in one batch and print statistics instead of plotting")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the dispersions")
+    parser.add_argument("--integrator", choices=["euler", "rk4", "rk45"], default="euler",
+                        help="Forward Euler at dt (default), fixed-step RK4 or adaptive RK45")
+    parser.add_argument("--full", action="store_true",
+                        help="With rk4/rk45, keep integrating after |w| drops below wf")
+    parser.add_argument("--decimate", type=int, default=1, metavar="N",
+                        help="Keep every N-th Euler step of the histories")
+    parser.add_argument("--envelope", action="store_true",
+                        help="With --decimate, keep the min/max envelope of each N steps instead")
+    parser.add_argument("--history-file", metavar="PATH",
+                        help="Stream the Euler histories to this .npy file (bypasses the cache)")
+    parser.add_argument("--save", metavar="PREFIX",
+                        help="Write the figures to PREFIX<name>.<format> files instead of showing them")
+    parser.add_argument("--format", choices=["png", "svg", "pdf"], default="png", help="Figure file format")
+    parser.add_argument("--downsample", choices=["minmax", "lttb"], default=plotting.method,
+                        help="Reduction of long series before plotting")
+    parser.add_argument("--max-points", type=int, default=plotting.max_points,
+                        help="Points per plotted series after downsampling")
+    parser.add_argument("--figures", type=int, default=0, metavar="K",
+                        help="With --monte-carlo and --save, also save the histories of the first K cases")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes rendering the --figures cases (default: all cores)")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    cache = cache_from_args(args)
+
+    if args.monte_carlo:
+        cases = dispersed_cases(args.monte_carlo, args.seed)
+        inputs = dict(cases, dt=dt, t_final=t_final, wf=wf)
+        stats = cache.get((inputs, code_version(simulate_batch, dispersed_cases)),
+                          lambda: simulate_batch(**inputs))
+
+        detumbled = ~np.isnan(stats['detumble_time'])
+        print(f"Monte Carlo detumbling, {args.monte_carlo} cases (seed {args.seed})")
+        print(f"Detumbled within {t_final/3600:.1f} h: {detumbled.mean()*100:.1f} %")
+        if detumbled.any():
+            p50, p95, p100 = np.percentile(stats['detumble_time'][detumbled], [50, 95, 100])
+            print(f"Detumble time [min]: median {p50/60:.1f}, P95 {p95/60:.1f}, max {p100/60:.1f}")
+        print(f"Final rate [deg/s]: median {np.degrees(np.median(np.abs(stats['w_final']))):.3f}, "
+              f"max {np.degrees(np.max(np.abs(stats['w_final']))):.3f}")
+        print(f"Peak dipole [A*m^2]: max {stats['m_peak'].max():.3f}")
+        print(f"Mean dipole [A*m^2]: median {np.median(stats['m_mean']):.3f}")
+        print(f"Saturated fraction: median {np.median(stats['saturated_fraction'])*100:.1f} %, "
+              f"max {stats['saturated_fraction'].max()*100:.1f} %")
+        if args.save:
+            paths = [campaign_figure(stats, f"{args.save}campaign.{args.format}")]
+            jobs = [(case_figures, ({name: float(value[i]) for name, value in cases.items()},
+                                    f"{args.save}case{i}_", args.format, args.max_points, args.downsample))
+                    for i in range(min(args.figures, args.monte_carlo))]
+            paths += [path for case_paths in plotting.render(jobs, args.workers) for path in case_paths]
+            print(f"{len(paths)} figures written to {args.save}*.{args.format}")
+        raise SystemExit
+
+    if args.integrator == "euler":
+        inputs = dict(wi=wi, B=B, Jz=Jz, k=k, m_max=m_x, dt=dt, t_final=t_final,
+                      decimate=args.decimate, envelope=args.envelope)
+        if args.history_file:
+            history = simulate(**inputs, path=args.history_file)
+        else:
+            history = cache.get((inputs, code_version(wdot, simulate, HistoryRecorder)),
+                                lambda: simulate(**inputs))
+    else:
+        inputs = dict(wi=wi, B=B, Jz=Jz, k=k, m_max=m_x, t_final=t_final, wf=wf, method=args.integrator,
+                      rk4_step=rk4_step, rtol=rtol, atol=atol, stop_at_wf=not args.full)
+        history = cache.get((inputs, code_version(wdot, rate_derivative, simulate_ode, integrators)),
+                            lambda: simulate_ode(**inputs))
+        if np.isnan(history['detumble_time']):
+            print(f"Not detumbled within {t_final/3600:.1f} h")
+        else:
+            print(f"Detumbled after {history['detumble_time']/60:.1f} min")
+        print(f"{args.integrator.upper()}: {history['n_steps']} steps, {history['n_fev']} derivative evaluations")
+    if args.save:
+        paths = save_figures(history, args.save, args.format, args.max_points, args.downsample)
+        print(f"Figures written to {', '.join(paths)}")
+    else:
+        import matplotlib.pyplot as plt
 
+        draw_figures(history, [plt.figure().add_subplot() for _ in range(3)], args.max_points, args.downsample)
+        plt.show()
@@ -0,0 +1,85 @@
+"""
+Bounded memoisation of model evaluations.
+
+SLSQP calls the objective and every constraint at the same design vector, and
+each of those callbacks re-runs the full sizing model. Wrapping the model in an
+EvalCache lets all callbacks share one evaluation per point.
+"""
+
+from collections import OrderedDict
+
+import instrument
+
+
+class EvalCache:
+    """
+    Least-recently-used cache around a model function.
+    The key is the full positional argument tuple, i.e. the continuous design
+    vector together with the discrete parameters (dwire, rho, nlayers).
+    Parameters:
+        func (callable): Model to memoise, e.g. sizing()
+        maxsize (int): Max number of stored evaluations before the oldest is evicted
+    """
+
+    def __init__(self, func, maxsize=256):
+        self.func = func
+        self.maxsize = maxsize
+        # Timer of the model evaluations, by the name of the (partial) function
+        self.name = getattr(getattr(func, 'func', func), '__name__', 'model')
+        self._store = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evaluations = 0
+        self.evictions = 0
+
+    def __call__(self, *args):
+        key = tuple(float(a) for a in args)
+        try:
+            result = self._store[key]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._store.move_to_end(key)
+            return result
+
+        recorder = instrument.active()
+        if recorder is None:
+            result = self.func(*args)
+        else:
+            with recorder.timer(self.name):
+                result = self.func(*args)
+        self.evaluations += 1
+        self._store[key] = result
+        if len(self._store) > self.maxsize:
+            self._store.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def clear(self):
+        """Drop all stored evaluations, keeping the counters."""
+        self._store.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses, evaluations, evictions and current size
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evaluations': self.evaluations,
+            'evictions': self.evictions,
+            'size': len(self._store),
+        }
+
+
+def total_stats(stats_list):
+    """
+    Sum the counters of several EvalCache.stats() dicts, e.g. over a sweep.
+    """
+    total = {'hits': 0, 'misses': 0, 'evaluations': 0, 'evictions': 0, 'size': 0}
+    for stats in stats_list:
+        for key in total:
+            total[key] += stats[key]
+    return total
@@ -0,0 +1,30 @@
+"""
+Finite-difference check of hand-derived gradients.
+"""
+
+import numpy as np
+
+
+def check_jac(fun, jac, x, rel_step=1e-6):
+    """
+    Compare an analytic gradient against central finite differences.
+    Parameters:
+        fun (callable): Scalar function of the design vector
+        jac (callable): Its analytic gradient, returning an array like x
+        x (array_like): Point to check at
+        rel_step (float): Step relative to |x| (absolute for x == 0)
+    Returns:
+        float: Max absolute gradient error, relative to the largest gradient component
+    """
+    x = np.asarray(x, dtype=float)
+    analytic = np.asarray(jac(x), dtype=float)
+
+    fd = np.empty_like(x)
+    for i in range(x.size):
+        h = rel_step * max(abs(x[i]), 1.0)
+        step = np.zeros_like(x)
+        step[i] = h
+        fd[i] = (fun(x + step) - fun(x - step)) / (2 * h)
+
+    scale = max(np.max(np.abs(analytic)), np.max(np.abs(fd)), np.finfo(float).tiny)
+    return float(np.max(np.abs(analytic - fd)) / scale)
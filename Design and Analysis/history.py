@@ -0,0 +1,109 @@
+"""
+Fixed-memory recording of simulation histories.
+
+A HistoryRecorder collects one row of scalar fields per step into a small
+preallocated chunk buffer. Full chunks are reduced (every n-th sample, or the
+min/max envelope of blocks of n samples) and written to a preallocated output
+array, or appended to an .npy file for long runs, so the memory in use does not
+grow with the length of the simulation.
+"""
+
+import numpy as np
+
+
+class HistoryRecorder:
+    """
+    Parameters:
+        fields (sequence): Names of the scalar fields recorded each step, in column order
+        n_samples (int): Number of steps that will be recorded
+        decimate (int): Keep one row per block of this many samples
+        envelope (bool): Keep the min and max of each block instead of its first sample
+        path (str): Stream the rows to this .npy file instead of memory
+        chunk (int): Samples buffered before each reduction/write
+        dtype: Storage type of all fields
+    """
+
+    def __init__(self, fields, n_samples, decimate=1, envelope=False, path=None, chunk=8192, dtype=np.float64):
+        if decimate < 1:
+            raise ValueError("decimate must be >= 1")
+        self.fields = tuple(fields)
+        self.n_samples = int(n_samples)
+        self.decimate = int(decimate)
+        self.envelope = envelope
+        self.path = path
+        self.count = 0  # Samples recorded so far
+
+        # Whole blocks per chunk, so no block straddles two chunks
+        chunk = max(self.decimate, chunk - chunk % self.decimate)
+        self._buf = np.empty((chunk, len(self.fields)), dtype)
+        self._n = 0
+
+        n_blocks = -(-self.n_samples // self.decimate)
+        self._shape = (2 * n_blocks if envelope else n_blocks, len(self.fields))
+        self._rows = 0
+        if path is None:
+            self._out = np.empty(self._shape, dtype)
+            self._file = None
+        else:
+            self._out = None
+            self._file = open(path, 'wb')
+            np.lib.format.write_array_header_1_0(
+                self._file, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                             'fortran_order': False, 'shape': self._shape})
+
+    def record(self, *values):
+        """
+        Add one step, with a value for every field in order.
+        """
+        self._buf[self._n] = values
+        self._n += 1
+        if self._n == len(self._buf):
+            self._flush()
+
+    def _flush(self):
+        if self.count + self._n > self.n_samples:
+            raise ValueError(f"More than the {self.n_samples} declared samples recorded")
+        block = self._buf[:self._n]
+        if self.envelope:
+            starts = np.arange(0, self._n, self.decimate)
+            rows = np.empty((len(starts), 2, block.shape[1]), block.dtype)
+            rows[:, 0] = np.minimum.reduceat(block, starts, axis=0)
+            rows[:, 1] = np.maximum.reduceat(block, starts, axis=0)
+            rows = rows.reshape(-1, block.shape[1])
+        else:
+            rows = block[::self.decimate]
+
+        if self._file is None:
+            self._out[self._rows:self._rows + len(rows)] = rows
+        else:
+            rows.tofile(self._file)
+        self._rows += len(rows)
+        self.count += self._n
+        self._n = 0
+
+    def close(self):
+        """
+        Write out the buffered samples. Called by result().
+        """
+        if self._n:
+            self._flush()
+        if self._file is not None and not self._file.closed:
+            # The header promised n_samples; pad a run that ended early with nan
+            missing = self._shape[0] - self._rows
+            if missing:
+                np.full((missing, self._shape[1]), np.nan, self._buf.dtype).tofile(self._file)
+            self._file.close()
+
+    def result(self):
+        """
+        Returns:
+            dict: One array per field over the recorded samples (memory-mapped
+                views of the file when streaming). With envelope each array is
+                (n_blocks, 2) holding the [min, max] of each block.
+        """
+        self.close()
+        out = self._out if self._file is None else np.load(self.path, mmap_mode='r')
+        out = out[:self._rows]
+        if self.envelope:
+            out = out.reshape(-1, 2, out.shape[1])
+        return {name: out[..., i] for i, name in enumerate(self.fields)}
@@ -0,0 +1,258 @@
+"""
+Named timers and counters for finding where a run spends its time.
+
+Instrumented code reports to the active Recorder, if there is one:
+
+    import instrument
+    with instrument.timer('mtq.slsqp'):
+        res = minimize(...)
+    instrument.count('slsqp.iterations', res.nit)
+
+Without an active recorder timer() returns a shared no-op context manager and
+count() returns at once (about 0.1 us per call). Inner loops that run millions
+of times hoist instrument.active() out of the loop and mark their stages only
+when it is not None, so a run without a recorder pays one test per mark.
+
+A recorder is switched on by instrument.enable(), by `adcs.py --profile PATH`,
+or for any script by the ADCS_PROFILE environment variable, which names the
+report file written when the process exits. The report is JSON: per timer the
+number of calls, total, mean, min and max time, and the counters. A path ending
+in .trace.json (or format='chrome') gives the Chrome trace event format instead,
+every timed span on a timeline (chrome://tracing, https://ui.perfetto.dev).
+
+Timers and counters of worker processes are not collected; profile parallel
+sweeps with workers=1.
+"""
+
+import atexit
+import json
+import os
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+max_spans = 10**6 # Spans kept for a trace, later ones are only aggregated
+
+_recorder = None
+_null = nullcontext()
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add(self.name, time.perf_counter() - self.start, self.start)
+
+class Stages:
+    """
+    Lap timer over the fixed stages of a loop: mark(i) charges the time since
+    the previous mark to stage i. Created by Recorder.stages().
+    """
+
+    def __init__(self, recorder, names):
+        self.recorder = recorder
+        self.names = names
+        self.totals = [0.0] * len(names)
+        self.calls = [0] * len(names)
+        self.last = time.perf_counter()
+
+    def mark(self, i):
+        now = time.perf_counter()
+        self.totals[i] += now - self.last
+        self.calls[i] += 1
+        self.last = now
+
+    def close(self):
+        """
+        Add the stage totals to the recorder's timers.
+        """
+        for name, total, calls in zip(self.names, self.totals, self.calls):
+            if calls:
+                self.recorder.add(name, total, calls=calls)
+
+class Recorder:
+    """
+    Timers (calls, total, min, max) and counters of one run.
+    Parameters:
+        trace (bool): Keep every timed span for a Chrome trace
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.t0 = time.perf_counter()
+        self.timers = {}
+        self.counters = {}
+        self.spans = []
+        self.dropped = 0
+
+    def timer(self, name):
+        """
+        Context manager timing its block under name.
+        """
+        return _Span(self, name)
+
+    def add(self, name, seconds, start=None, calls=1):
+        """
+        Add a measured time [s] (calls calls in total) to timer name; start is
+        the perf_counter() value at its beginning, for the trace. Only single
+        calls count towards the min and max, an aggregate (Stages.close())
+        says nothing about its individual calls.
+        """
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = timer = [0, 0.0, float('inf'), 0.0]
+        timer[0] += calls
+        timer[1] += seconds
+        if calls == 1:
+            timer[2] = min(timer[2], seconds)
+            timer[3] = max(timer[3], seconds)
+        if self.trace and start is not None:
+            if len(self.spans) < max_spans:
+                self.spans.append((name, start, seconds))
+            else:
+                self.dropped += 1
+
+    def count(self, name, n=1):
+        """
+        Add n to counter name.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stages(self, names):
+        """
+        Stages lap timer over the named stages of a loop; close() it after the loop.
+        """
+        return Stages(self, names)
+
+    def report(self):
+        """
+        Returns:
+            dict: 'wall_time' [s] since the recorder started, 'timers' (per name,
+                largest total first: 'calls', 'total', 'mean', 'min', 'max' [s]
+                and 'fraction' of the wall time) and 'counters'; 'min' and 'max'
+                are None for timers only fed aggregates, like the Stages timers
+        """
+        wall = time.perf_counter() - self.t0
+        timers = {}
+        for name, (calls, total, low, high) in sorted(self.timers.items(), key=lambda item: -item[1][1]):
+            single = low <= high # False when no single call was recorded
+            timers[name] = {'calls': calls, 'total': total, 'mean': total / calls,
+                            'min': low if single else None, 'max': high if single else None,
+                            'fraction': total / wall if wall > 0 else 0.0}
+        return {'wall_time': wall, 'timers': timers, 'counters': dict(sorted(self.counters.items()))}
+
+    def chrome_trace(self):
+        """
+        The spans and final counter values in the Chrome trace event format.
+        """
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'ts': (start - self.t0) * 1e6, 'dur': seconds * 1e6,
+                   'pid': pid, 'tid': 0} for name, start, seconds in self.spans]
+        end = (time.perf_counter() - self.t0) * 1e6
+        events += [{'name': name, 'ph': 'C', 'ts': end, 'pid': pid, 'args': {'value': value}}
+                   for name, value in self.counters.items()]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'dropped_spans': self.dropped, 'report': self.report()}}
+
+    def save(self, path, format=None):
+        """
+        Write the report to path, format 'json' or 'chrome' (default from the
+        file name: .trace.json is a Chrome trace).
+        """
+        format = format or ('chrome' if path.endswith('.trace.json') else 'json')
+        data = self.chrome_trace() if format == 'chrome' else self.report()
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=None if format == 'chrome' else 2)
+
+    def summary(self, limit=20):
+        """
+        Text table of the largest timers and the counters.
+        """
+        report = self.report()
+        lines = [f"Wall time: {report['wall_time']:.3f} s",
+                 f"{'timer':<32} {'calls':>10} {'total [s]':>10} {'mean [us]':>10} {'share':>7}"]
+        for name, t in list(report['timers'].items())[:limit]:
+            lines.append(f"{name:<32} {t['calls']:>10} {t['total']:>10.3f} {t['mean']*1e6:>10.2f} "
+                         f"{t['fraction']*100:>6.1f}%")
+        lines += [f"{name:<32} {value:>10}" for name, value in report['counters'].items()]
+        return "\n".join(lines)
+
+def enable(trace=False):
+    """
+    Start recording to a new Recorder, which is returned.
+    """
+    global _recorder
+    _recorder = Recorder(trace)
+    return _recorder
+
+def disable():
+    """
+    Stop recording. Returns the recorder that was active, or None.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+def active():
+    """
+    The active Recorder, None when disabled.
+    """
+    return _recorder
+
+def timer(name):
+    """
+    Context manager timing its block under name, a no-op when disabled.
+    """
+    return _null if _recorder is None else _Span(_recorder, name)
+
+def count(name, n=1):
+    """
+    Add n to counter name, a no-op when disabled.
+    """
+    if _recorder is not None:
+        _recorder.count(name, n)
+
+def timed(name=None):
+    """
+    Decorator timing every call of a function (under its qualified name by default).
+    """
+    def decorator(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with _Span(_recorder, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def counted(name, func):
+    """
+    func wrapped to count its calls under name. Meant to be applied only while
+    a recorder is active, so disabled runs keep the bare function.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        count(name)
+        return func(*args, **kwargs)
+    return wrapper
+
+def _from_environment():
+    # ADCS_PROFILE=path records the whole process and writes the report at exit
+    # (only from this process: spawned workers import this module again)
+    path = os.environ.get('ADCS_PROFILE')
+    if path and _recorder is None:
+        recorder = enable(trace=path.endswith('.trace.json'))
+        pid = os.getpid()
+        atexit.register(lambda: os.getpid() == pid and recorder.save(path))
+
+_from_environment()
@@ -0,0 +1,254 @@
+"""
+Explicit Runge-Kutta integrators with event location.
+
+rk4() takes fixed steps, rk45() adapts the step to a local error tolerance
+with the embedded Dormand-Prince 5(4) pair. Both locate sign changes of event
+functions inside a step and then shorten the step to land on the event, so:
+    - a terminal event (e.g. the rate dropping below the detumbled threshold)
+      ends the run exactly at the crossing, and
+    - a non-terminal event placed on a discontinuity of the dynamics (e.g. the
+      dipole reaching its saturation limit) is never stepped across, which
+      keeps the error estimate valid and avoids rejected steps at the kink.
+"""
+
+import numpy as np
+
+import instrument
+
+
+class Event:
+    """
+    Zero crossing of g(t, y) to locate during integration.
+    Parameters:
+        g (callable): Scalar function g(t, y)
+        terminal (bool): Stop the integration at the crossing
+        direction (int): +1 for rising crossings only, -1 for falling only, 0 for both
+    """
+
+    def __init__(self, g, terminal=False, direction=0):
+        self.g = g
+        self.terminal = terminal
+        self.direction = direction
+
+    def crosses(self, g0, g1):
+        if self.direction >= 0 and g0 < 0 <= g1:
+            return True
+        if self.direction <= 0 and g0 > 0 >= g1:
+            return True
+        return False
+
+
+# Dormand-Prince 5(4) tableau
+_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1])
+_A = [
+    [],
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+    [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84],
+]
+_B5 = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0])
+_E = _B5 - np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40])
+
+
+def _dopri_step(f, t, y, f0, h):
+    # One Dormand-Prince step; returns (y_new, f_new, error estimate).
+    # The last stage is evaluated at y_new (_A[6] == _B5, _C[6] == 1), so it is
+    # also the first stage of the next step (FSAL): 6 evaluations per step.
+    k = [f0]
+    for i in range(1, 7):
+        y_stage = y + h * sum(a * ki for a, ki in zip(_A[i], k) if a)
+        k.append(f(t + _C[i] * h, y_stage))
+    y_new, f_new = y_stage, k[6]
+    error = h * sum(e * ki for e, ki in zip(_E, k) if e)
+    return y_new, f_new, error
+
+
+def _rk4_step(f, t, y, f0, h):
+    k2 = f(t + h/2, y + h/2 * f0)
+    k3 = f(t + h/2, y + h/2 * k2)
+    k4 = f(t + h, y + h * k3)
+    y_new = y + h/6 * (f0 + 2*k2 + 2*k3 + k4)
+    return y_new, f(t + h, y_new)
+
+
+def _hermite(t0, y0, f0, t1, y1, f1):
+    # Cubic Hermite interpolant of a step, for locating events inside it
+    h = t1 - t0
+    def y(t):
+        s = (t - t0) / h
+        return ((1 + 2*s) * (1 - s)**2 * y0 + s**2 * (3 - 2*s) * y1
+                + s * (1 - s)**2 * h * f0 - s**2 * (1 - s) * h * f1)
+    return y
+
+
+def _first_event(events, g_start, t0, y0, f0, t1, y1, f1):
+    """
+    Earliest event crossing in (t0, t1]. Returns (t_event, index) or (None, None).
+    Crossings right at t0 are those already landed on by the previous step.
+    """
+    interp = None
+    first_t, first_i = None, None
+    for i, event in enumerate(events):
+        g1 = event.g(t1, y1)
+        if not event.crosses(g_start[i], g1):
+            continue
+        if interp is None:
+            interp = _hermite(t0, y0, f0, t1, y1, f1)
+        if g1 == 0:
+            t_root = t1
+        else:
+            from scipy.optimize import brentq # Deferred, only needed once an event fires
+            instrument.count('integrator.event_roots')
+            t_root = brentq(lambda t: event.g(t, interp(t)), t0, t1, xtol=1e-12 * max(1.0, abs(t1)))
+        if t_root - t0 <= 1e-9 * (t1 - t0):
+            continue
+        if first_t is None or t_root < first_t:
+            first_t, first_i = t_root, i
+    return first_t, first_i
+
+
+def _integrate(f, t_span, y0, step, events, max_steps):
+    # Shared driver: step(t, y, f0, h, t_end, fixed) -> (y_new, f_new, t_new, h_next),
+    # with fixed=True taking exactly the step h
+    t, t_end = map(float, t_span)
+    y = np.array(y0, dtype=float)
+    events = list(events or [])
+
+    fy = f(t, y)
+    ts, ys = [t], [y.copy()]
+    t_events = [[] for _ in events]
+    g_start = [event.g(t, y) for event in events]
+    h = None
+    status = 'completed'
+
+    while t < t_end:
+        if len(ts) > max_steps:
+            status = 'max_steps'
+            break
+        y_new, f_new, t_new, h = step(t, y, fy, h, t_end)
+
+        t_hit, i_hit = _first_event(events, g_start, t, y, fy, t_new, y_new, f_new)
+        if t_hit is not None:
+            # Redo the step so that it ends on the event
+            y_new, f_new, t_new, _ = step(t, y, fy, t_hit - t, t_end, fixed=True)
+            t_events[i_hit].append(t_new)
+
+        t, y, fy = t_new, y_new, f_new
+        ts.append(t)
+        ys.append(y.copy())
+        g_start = [event.g(t, y) for event in events]
+        if t_hit is not None:
+            g_start[i_hit] = 0.0
+            if events[i_hit].terminal:
+                status = 'event'
+                break
+
+    return {
+        't': np.array(ts),
+        'y': np.array(ys),
+        't_events': [np.array(te) for te in t_events],
+        'status': status,
+    }
+
+
+class _Counter:
+    # Wraps f to count right-hand side evaluations
+    def __init__(self, f):
+        self.f = f
+        self.n = 0
+
+    def __call__(self, t, y):
+        self.n += 1
+        return self.f(t, y)
+
+
+def rk4(f, t_span, y0, h, events=None, max_steps=10**7):
+    """
+    Classical fixed-step 4th order Runge-Kutta.
+    Parameters:
+        f (callable): Right-hand side dy/dt = f(t, y)
+        t_span (tuple): (t0, t_end) [s]
+        y0 (array_like): Initial state
+        h (float): Step size [s], the last step is shortened to end at t_end
+        events (list): Event instances to locate
+        max_steps (int): Give up after this many steps
+    Returns:
+        dict: 't' and 'y' at the steps, 't_events' (one array per event), 'status'
+            ('completed', 'event' or 'max_steps'), 'n_steps', 'n_fev'
+    """
+    f = _Counter(f)
+
+    def step(t, y, fy, h_prev, t_end, fixed=False):
+        h_step = h_prev if fixed else min(h, t_end - t)
+        y_new, f_new = _rk4_step(f, t, y, fy, h_step)
+        return y_new, f_new, t + h_step, h
+
+    result = _integrate(f, t_span, y0, step, events, max_steps)
+    result['n_steps'] = len(result['t']) - 1
+    result['n_fev'] = f.n
+    instrument.count('rk4.steps', result['n_steps'])
+    instrument.count('rk4.fev', f.n)
+    return result
+
+
+def rk45(f, t_span, y0, rtol=1e-6, atol=1e-9, h0=None, max_step=np.inf, events=None, max_steps=10**7):
+    """
+    Adaptive Dormand-Prince 5(4) with local extrapolation.
+    Parameters:
+        f (callable): Right-hand side dy/dt = f(t, y)
+        t_span (tuple): (t0, t_end) [s]
+        y0 (array_like): Initial state
+        rtol, atol (float): Relative and absolute local error tolerances
+        h0 (float): Initial step [s], estimated from f when None
+        max_step (float): Upper limit on the step [s]
+        events (list): Event instances to locate
+        max_steps (int): Give up after this many steps
+    Returns:
+        dict: As for rk4(), plus 'n_rejected'
+    """
+    f = _Counter(f)
+    rejected = [0]
+
+    def step(t, y, fy, h, t_end, fixed=False):
+        if fixed:
+            y_new, f_new, _ = _dopri_step(f, t, y, fy, h)
+            return y_new, f_new, t + h, h
+        if h is None:
+            h = h0 if h0 is not None else _initial_step(f, t, y, fy, rtol, atol)
+        while True:
+            h = min(h, max_step, t_end - t)
+            y_new, f_new, error = _dopri_step(f, t, y, fy, h)
+            scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+            err = np.sqrt(np.mean((error / scale)**2))
+            factor = 5.0 if err == 0 else min(5.0, max(0.2, 0.9 * err**-0.2))
+            if err <= 1:
+                return y_new, f_new, t + h, h * factor
+            rejected[0] += 1
+            h *= min(factor, 1.0)
+
+    result = _integrate(f, t_span, y0, step, events, max_steps)
+    result['n_steps'] = len(result['t']) - 1
+    result['n_fev'] = f.n
+    result['n_rejected'] = rejected[0]
+    instrument.count('rk45.steps', result['n_steps'])
+    instrument.count('rk45.rejected', rejected[0])
+    instrument.count('rk45.fev', f.n)
+    return result
+
+
+def _initial_step(f, t, y, fy, rtol, atol):
+    # Hairer, Norsett & Wanner (II.4): step with a small first-order error estimate
+    scale = atol + rtol * np.abs(y)
+    d0 = np.sqrt(np.mean((y / scale)**2))
+    d1 = np.sqrt(np.mean((fy / scale)**2))
+    h = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+    f1 = f(t + h, y + h * fy)
+    d2 = np.sqrt(np.mean(((f1 - fy) / scale)**2)) / h
+    if max(d1, d2) <= 1e-15:
+        h1 = max(1e-6, h * 1e-3)
+    else:
+        h1 = (0.01 / max(d1, d2))**0.2
+    return min(100 * h, h1)
@@ -0,0 +1,490 @@
+"""
+Multiplicative extended Kalman filter (MEKF) fusing gyro and vector measurements.
+
+The state is the attitude quaternion (scalar-first, inertial to body as in
+attitude_determination.py) and the gyro bias; the filter estimates the 6-state
+error [attitude error angles, bias error] about them and folds it back into
+the quaternion after every measurement update (Markley & Crassidis,
+Fundamentals of Spacecraft Attitude Determination and Control, ch. 6-7).
+
+Propagation uses the closed-form discrete model for a rate held constant over
+the step: the exact quaternion rotation, the exact state-transition matrix Phi
+and the discrete process noise Q, which only depends on dt and is cached. The
+filter runs N independent instances at once; all arrays are preallocated and
+the propagation and update loops write into them in place.
+
+replay() runs the filter over dispersed gyro noise, bias and measurement noise
+draws with periodic outages of the vector measurements, and checks the
+attitude error at the end of each outage against the IMUSizing.py requirement
+(max_3sigma_angle_deg over T_required_s of gyro-only propagation).
+"""
+
+import argparse
+import time
+from functools import lru_cache
+from math import *
+
+import numpy as np
+
+from IMUSizing import T_required_s, max_3sigma_angle_deg, max_arw
+from attitude_determination import dcm_from_quat
+from orbit_field import load_table
+from resultcache import add_cache_arguments, cache_from_args
+from sensor_noise import GYRO
+
+# Gyro, sensor_noise.GYRO (Sensors/gyro_params.m)
+sigma_v = radians(GYRO.noise_density) # Angle random walk [rad/sqrt(s)]
+sigma_u = radians(GYRO.bias_random_walk) # Bias random walk [rad/s/sqrt(s)]
+# The filter has no Gauss-Markov bias state; its driving noise is added to
+# the bias random walk, which is what it looks like over times << tau
+sigma_u_filter = sqrt(sigma_u**2 + 2*radians(GYRO.bias_instability)**2/GYRO.correlation_time)
+
+# Vector measurements, 1-sigma per axis of the unit vector [rad] (assumed:
+# fine sun sensor, magnetometer including field model and hard-iron residuals)
+sigma_sun = radians(0.1)
+sigma_mag = radians(1.0)
+sun_eci = np.array([1.0, 0.0, 0.0]) # Sun direction, fixed over the replay
+
+dt = 0.1 # Filter step [s], gyro samples averaged to 10 Hz
+meas_period = 1.0 # Vector measurement period [s]
+sigma_att0 = radians(1.0) # Initial attitude uncertainty per axis [rad]
+series_limit = 1e-3 # Rotation per step below which Phi uses Taylor series [rad]
+
+def skew(v, out):
+    """
+    Cross-product matrices [v x] (n, 3, 3) of vectors (n, 3), written into out
+    (its diagonal must be zero).
+    """
+    np.negative(v[:, 2], out=out[:, 0, 1])
+    np.copyto(out[:, 0, 2], v[:, 1])
+    np.copyto(out[:, 1, 0], v[:, 2])
+    np.negative(v[:, 0], out=out[:, 1, 2])
+    np.negative(v[:, 1], out=out[:, 2, 0])
+    np.copyto(out[:, 2, 1], v[:, 0])
+    return out
+
+def _cross(a, b, out, tmp):
+    # a x b (n, 3) into out, tmp (n,) scratch
+    for i, j, k in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        np.multiply(a[:, j], b[:, k], out=out[:, i])
+        np.multiply(a[:, k], b[:, j], out=tmp)
+        out[:, i] -= tmp
+    return out
+
+@lru_cache(maxsize=None)
+def process_noise(dt, sigma_v=sigma_v, sigma_u=sigma_u_filter):
+    """
+    Discrete process noise Q (6, 6) of the attitude error and bias over dt [s].
+    Independent of the rate, so it is computed once per dt; read-only.
+    """
+    I = np.eye(3)
+    Q = np.zeros((6, 6))
+    Q[:3, :3] = (sigma_v**2*dt + sigma_u**2*dt**3/3) * I
+    Q[:3, 3:] = Q[3:, :3] = -sigma_u**2*dt**2/2 * I
+    Q[3:, 3:] = sigma_u**2*dt * I
+    Q.setflags(write=False)
+    return Q
+
+class QuatRotation:
+    """
+    Closed-form step of n scalar-first quaternions at a rate held constant
+    over the step, q' = [cos(|w|dt/2) I + sin(|w|dt/2)/|w| Omega(w)] q, on
+    preallocated buffers.
+    """
+
+    def __init__(self, n):
+        self.rate = np.empty(n)
+        self.c = np.empty(n)
+        self.s = np.empty(n)
+        self.tmp = np.empty(n)
+        self.psi = np.empty((n, 3))
+        self.cross = np.empty((n, 3))
+
+    def step(self, q, w, dt, out):
+        """
+        Rotate q (n, 4) by the body rate w (n, 3) [rad/s] over dt [s] into out (not q).
+        """
+        rate, c, s, tmp, psi = self.rate, self.c, self.s, self.tmp, self.psi
+        np.einsum('ij,ij->i', w, w, out=rate)
+        np.sqrt(rate, out=rate)
+        np.multiply(rate, dt/2, out=c)
+        np.sin(c, out=s)
+        np.cos(c, out=c)
+        # psi = sin(|w|dt/2) w/|w|, which is ~0 anyway where |w| hits the floor
+        np.maximum(rate, np.finfo(float).tiny, out=tmp)
+        np.divide(s, tmp, out=s)
+        np.multiply(w, s[:, None], out=psi)
+
+        q0, qv = q[:, 0], q[:, 1:]
+        np.einsum('ij,ij->i', psi, qv, out=tmp)
+        np.multiply(c, q0, out=out[:, 0])
+        out[:, 0] -= tmp
+        np.multiply(qv, c[:, None], out=out[:, 1:])
+        np.multiply(psi, q0[:, None], out=self.cross)
+        out[:, 1:] += self.cross
+        out[:, 1:] -= _cross(psi, qv, self.cross, tmp)
+        return out
+
+class MEKF:
+    """
+    n independent MEKF instances propagated and updated together.
+    Parameters:
+        q0 (ndarray): (n, 4) initial quaternions, inertial to body
+        P0 (ndarray): (6, 6) or (n, 6, 6) initial error covariance [rad^2, (rad/s)^2]
+        b0 (ndarray): (n, 3) initial bias estimates [rad/s], default zero
+        dt (float): Default propagation step [s]
+        sigma_v (float): Gyro angle random walk [rad/sqrt(s)]
+        sigma_u (float): Gyro bias random walk [rad/s/sqrt(s)]
+    """
+
+    def __init__(self, q0, P0, b0=None, dt=dt, sigma_v=sigma_v, sigma_u=sigma_u_filter):
+        q0 = np.atleast_2d(np.asarray(q0, dtype=float))
+        n = len(q0)
+        self.n = n
+        self.dt = dt
+        self.sigma_v = sigma_v
+        self.sigma_u = sigma_u
+        self.q = q0 / np.linalg.norm(q0, axis=1, keepdims=True)
+        self.b = np.zeros((n, 3)) if b0 is None else np.array(np.broadcast_to(b0, (n, 3)), dtype=float)
+        self.P = np.array(np.broadcast_to(P0, (n, 6, 6)), dtype=float)
+
+        # Propagation buffers
+        self._q = np.empty((n, 4))
+        self._w = np.empty((n, 3))
+        self._rotation = QuatRotation(n)
+        self._theta = np.empty(n)
+        self._f = np.empty((3, n)) # sin(t)/t, (1 - cos(t))/t^2, (t - sin(t))/t^3
+        self._series = np.empty((3, n))
+        self._series0 = np.array([[1], [1/2], [1/6]])
+        self._small = np.empty(n, dtype=bool)
+        self._W = np.zeros((n, 3, 3))
+        self._W2 = np.empty((n, 3, 3))
+        self._T33 = np.empty((n, 3, 3))
+        self._Phi = np.zeros((n, 6, 6))
+        self._Phi[:, 3:, 3:] = np.eye(3)
+        self._PhiT = self._Phi.transpose(0, 2, 1)
+        flat = self._Phi.reshape(n, 36)
+        self._diag11 = flat[:, 0:15:7] # Diagonals of the Phi blocks, as views
+        self._diag12 = flat[:, 3:18:7]
+        self._T66 = np.empty((n, 6, 6))
+
+        # Update buffers
+        self._A = np.empty((n, 3, 3))
+        self._bhat = np.empty((n, 3))
+        self._y = np.empty((n, 3))
+        self._B = np.zeros((n, 3, 3))
+        self._h = np.zeros((n, 6))
+        self._Ph = np.empty((n, 6))
+        self._s = np.empty(n)
+        self._innovation = np.empty(n)
+        self._dx = np.empty((n, 6))
+        self._K = np.empty((n, 6))
+        self._tmp = np.empty(n)
+        self._cross = np.empty((n, 3))
+
+    def propagate(self, w_meas, dt=None):
+        """
+        Propagate by dt [s] (default self.dt) with the gyro rate (n, 3) [rad/s]
+        averaged over the step.
+        """
+        dt = self.dt if dt is None else dt
+        w, theta, f, series, small = self._w, self._theta, self._f, self._series, self._small
+        W, W2, T33, Phi = self._W, self._W2, self._T33, self._Phi
+        np.subtract(w_meas, self.b, out=w)
+
+        # Attitude quaternion
+        self._rotation.step(self.q, w, dt, self._q)
+        self.q, self._q = self._q, self.q
+
+        # Phi11 = I - dt f1 [w x] + dt^2 f2 [w x]^2
+        # Phi12 = dt^2 f2 [w x] - dt I - dt^3 f3 [w x]^2
+        np.multiply(self._rotation.rate, dt, out=theta)
+        np.sin(theta, out=f[0])
+        np.cos(theta, out=f[1])
+        np.subtract(theta, f[0], out=f[2])
+        np.subtract(1, f[1], out=f[1])
+        np.maximum(theta, np.finfo(float).tiny, out=self._tmp)
+        np.divide(f[0], self._tmp, out=f[0])
+        for i in (1, 2):
+            np.divide(f[i], self._tmp, out=f[i])
+            np.divide(f[i], self._tmp, out=f[i])
+        np.divide(f[2], self._tmp, out=f[2])
+        np.less(theta, series_limit, out=small)
+        if small.any():
+            np.square(theta, out=self._tmp)
+            np.multiply(self._tmp, -1/6, out=series[0])
+            np.multiply(self._tmp, -1/24, out=series[1])
+            np.multiply(self._tmp, -1/120, out=series[2])
+            series += self._series0
+            np.copyto(f, series, where=small)
+        f[0] *= dt
+        f[1] *= dt**2
+        f[2] *= dt**3
+
+        skew(w, W)
+        np.matmul(W, W, out=W2)
+        Phi11, Phi12 = Phi[:, :3, :3], Phi[:, :3, 3:]
+        np.multiply(W, -f[0][:, None, None], out=Phi11)
+        np.multiply(W2, f[1][:, None, None], out=T33)
+        Phi11 += T33
+        self._diag11 += 1
+        np.multiply(W, f[1][:, None, None], out=Phi12)
+        np.multiply(W2, f[2][:, None, None], out=T33)
+        Phi12 -= T33
+        self._diag12 -= dt
+
+        # P = Phi P Phi' + Q
+        np.matmul(Phi, self.P, out=self._T66)
+        np.matmul(self._T66, self._PhiT, out=self.P)
+        self.P += process_noise(dt, self.sigma_v, self.sigma_u)
+
+    def attitude_matrix(self, out=None):
+        """
+        Inertial-to-body DCMs (n, 3, 3) of the current estimates.
+        """
+        A = self._A if out is None else out
+        q0, qv = self.q[:, 0], self.q[:, 1:]
+        np.einsum('ni,nj->nij', qv, qv, out=A)
+        A *= 2
+        skew(qv, self._B)
+        np.multiply(self._B, q0[:, None, None], out=self._T33)
+        self._T33 *= 2
+        A -= self._T33
+        np.einsum('ij,ij->i', qv, qv, out=self._tmp)
+        np.multiply(q0, q0, out=self._s)
+        np.subtract(self._s, self._tmp, out=self._tmp)
+        A.reshape(self.n, 9)[:, 0:9:4] += self._tmp[:, None]
+        return A
+
+    def update(self, b_meas, r_ref, sigma, valid=None):
+        """
+        Measurement update with one unit vector per instance, processed as
+        three sequential scalar updates about the same linearisation.
+        Parameters:
+            b_meas (ndarray): (n, 3) measured unit vectors in body
+            r_ref (ndarray): (3,) or (n, 3) reference unit vectors in inertial
+            sigma (float): 1-sigma noise per axis [rad]
+            valid (ndarray): (n,) instances that have the measurement, default all
+        """
+        A, bhat, y, B, h, Ph, K = self._A, self._bhat, self._y, self._B, self._h, self._Ph, self._K
+        s, innovation, dx = self._s, self._innovation, self._dx
+        self.attitude_matrix(A)
+        np.einsum('nij,nj->ni', A, np.broadcast_to(r_ref, (self.n, 3)), out=bhat)
+        np.subtract(b_meas, bhat, out=y)
+        # b = (I - [dtheta x]) bhat = bhat + [bhat x] dtheta: H = [[bhat x], 0]
+        skew(bhat, B)
+        dx.fill(0)
+        for i in range(3):
+            np.copyto(h[:, :3], B[:, i, :])
+            np.einsum('nij,nj->ni', self.P, h, out=Ph)
+            np.einsum('ni,ni->n', h, Ph, out=s)
+            s += sigma**2
+            np.divide(1, s, out=s)
+            if valid is not None:
+                s *= valid
+            np.einsum('ni,ni->n', h, dx, out=innovation)
+            np.subtract(y[:, i], innovation, out=innovation)
+            innovation *= s
+            np.multiply(Ph, innovation[:, None], out=K)
+            dx += K
+            np.einsum('ni,nj->nij', Ph, Ph, out=self._T66)
+            self._T66 *= s[:, None, None]
+            self.P -= self._T66
+        np.add(self.P, self.P.transpose(0, 2, 1), out=self._T66)
+        np.multiply(self._T66, 0.5, out=self.P)
+        self._reset(dx)
+
+    def _reset(self, dx):
+        # Fold the error state into the quaternion, q = dq(dtheta) (x) q
+        half = self._w
+        np.multiply(dx[:, :3], 0.5, out=half)
+        q, out = self.q, self._q
+        q0, qv = q[:, 0], q[:, 1:]
+        np.einsum('ij,ij->i', half, qv, out=self._tmp)
+        np.subtract(q0, self._tmp, out=out[:, 0])
+        np.multiply(half, q0[:, None], out=out[:, 1:])
+        out[:, 1:] += qv
+        out[:, 1:] -= _cross(half, qv, self._cross, self._tmp)
+        np.einsum('ij,ij->i', out, out, out=self._tmp)
+        np.sqrt(self._tmp, out=self._tmp)
+        out /= self._tmp[:, None]
+        self.q, self._q = out, q
+        self.b += dx[:, 3:]
+
+    def sigma(self):
+        """
+        1-sigma attitude error per axis (n, 3) [rad] from the covariance.
+        """
+        return np.sqrt(np.einsum('nii->ni', self.P[:, :3, :3]))
+
+def _error_angles(q_true, q_est):
+    # Small attitude error angles (n, 3) [rad], A_true A_est' = I - [e x]
+    E = np.einsum('nij,nkj->nik', dcm_from_quat(q_true), dcm_from_quat(q_est))
+    return 0.5 * np.stack([E[:, 1, 2] - E[:, 2, 1], E[:, 2, 0] - E[:, 0, 2], E[:, 0, 1] - E[:, 1, 0]], axis=1)
+
+def _unit_noisy(v, sigma, rng):
+    v = v + sigma*rng.standard_normal(v.shape)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def replay(n=500, hours=1.0, outage=T_required_s, cycle=300.0, settle=600.0, rate_max=1.0,
+           dt=dt, meas_period=meas_period, gyro=GYRO, sigma_sun=sigma_sun, sigma_mag=sigma_mag,
+           seed=0, cache=None):
+    """
+    Run n filter instances on simulated data and collect the attitude error at
+    the end of gyro-only outages.
+
+    Every instance has its own static bias, bias random walk, Gauss-Markov bias,
+    gyro white noise and measurement noise draws, a random initial attitude and
+    a random constant body rate. Sun and magnetometer vectors are available
+    except during the last outage seconds of every cycle.
+    Parameters:
+        n (int): Filter instances
+        hours (float): Simulated time [h]
+        outage (float): Gyro-only propagation at the end of each cycle [s]
+        cycle (float): Outage period [s]
+        settle (float): Outages ending before this are not counted [s]
+        rate_max (float): Largest body rate of the instances [deg/s]
+        dt (float): Filter step [s]
+        meas_period (float): Vector measurement period [s]
+        gyro (SensorModel): Gyro noise model [deg/s]
+        sigma_sun, sigma_mag (float): 1-sigma vector measurement noise per axis [rad]
+        seed (int): RNG seed
+        cache (ResultCache): Cache of the geomagnetic field table
+    Returns:
+        dict: 'outage_error' and 'aided_error' (k, n, 3) error angles at the end
+            and start of each counted outage, 'outage_sigma' (k, n, 3) filter
+            1-sigma at the end [deg], 'samples', 'steps'
+    """
+    rng = np.random.default_rng(seed)
+    field = load_table(cache=cache)
+    steps = int(round(hours*3600 / dt))
+    meas_every = max(int(round(meas_period / dt)), 1)
+    cycle_steps = int(round(cycle / dt))
+    outage_steps = int(round(outage / dt))
+    if outage_steps >= cycle_steps:
+        raise ValueError("The outage must be shorter than the cycle")
+
+    # Truth
+    q_true = rng.standard_normal((n, 4))
+    q_true /= np.linalg.norm(q_true, axis=1, keepdims=True)
+    axis = rng.standard_normal((n, 3))
+    w_true = axis / np.linalg.norm(axis, axis=1, keepdims=True) * np.radians(rng.uniform(0, rate_max, (n, 1)))
+    bias_static = np.radians(rng.uniform(-gyro.static_bias, gyro.static_bias, (n, 3)))
+    walk = np.zeros((n, 3))
+    phi = exp(-dt / gyro.correlation_time)
+    markov = np.radians(gyro.bias_instability) * rng.standard_normal((n, 3))
+    walk_sigma = radians(gyro.bias_random_walk) * sqrt(dt)
+    markov_sigma = radians(gyro.bias_instability) * sqrt(1 - phi**2)
+    arw = radians(gyro.noise_density) / sqrt(dt) # Averaged white noise over a step [rad/s]
+
+    # Filter, started within sigma_att0 of the truth and without a bias estimate
+    q0 = q_true.copy()
+    q0[:, 1:] += 0.5*sigma_att0 * rng.standard_normal((n, 3))
+    P0 = np.diag([sigma_att0**2]*3 + [radians(gyro.static_bias)**2/3]*3)
+    mekf = MEKF(q0, P0, dt=dt)
+
+    rotation = QuatRotation(n)
+    q_next = np.empty_like(q_true)
+    w_meas = np.empty((n, 3))
+    noise = np.empty((n, 3))
+    aided, outage_error, outage_sigma = [], [], []
+    for k in range(1, steps + 1):
+        # Gyro output averaged over the step, with the bias at its start
+        rng.standard_normal(out=noise)
+        np.multiply(noise, arw, out=w_meas)
+        w_meas += w_true
+        w_meas += bias_static
+        w_meas += walk
+        w_meas += markov
+        rng.standard_normal(out=noise)
+        noise *= walk_sigma
+        walk += noise
+        rng.standard_normal(out=noise)
+        noise *= markov_sigma
+        markov *= phi
+        markov += noise
+
+        rotation.step(q_true, w_true, dt, q_next)
+        q_true, q_next = q_next, q_true
+        mekf.propagate(w_meas)
+
+        phase = k % cycle_steps
+        counted = k*dt > settle
+        if phase == cycle_steps - outage_steps and counted:
+            aided.append(_error_angles(q_true, mekf.q))
+        elif phase == 0 and counted and aided:
+            outage_error.append(_error_angles(q_true, mekf.q))
+            outage_sigma.append(mekf.sigma())
+        if phase <= cycle_steps - outage_steps and k % meas_every == 0:
+            A = dcm_from_quat(q_true)
+            for r, sigma in ((sun_eci, sigma_sun), (field.B(k*dt), sigma_mag)):
+                r = r / np.linalg.norm(r)
+                mekf.update(_unit_noisy(A @ r, sigma, rng), r, sigma)
+
+    aided = aided[:len(outage_error)]
+    return {
+        'outage_error': np.degrees(np.array(outage_error)).reshape(-1, n, 3),
+        'aided_error': np.degrees(np.array(aided)).reshape(-1, n, 3),
+        'outage_sigma': np.degrees(np.array(outage_sigma)).reshape(-1, n, 3),
+        'samples': len(outage_error) * n,
+        'steps': steps,
+    }
+
+def check_requirement(result, max_3sigma_angle_deg=max_3sigma_angle_deg):
+    """
+    Statistics of the attitude error accumulated over the outages (end minus
+    start, what IMUSizing.py budgets) against the 3-sigma requirement [deg].
+    Returns:
+        dict: 'three_sigma' (3*RMS per axis), 'p9973' (of |growth| per axis),
+            'exceedance' (fraction of axis errors above the requirement),
+            'aided_three_sigma' and 'total_three_sigma' (absolute error at the
+            start and end), 'filter_three_sigma' (3*RMS of the filter 1-sigma
+            at the end), 'met'
+    """
+    growth = np.abs(result['outage_error'] - result['aided_error']).ravel()
+    three_sigma = 3*sqrt(np.mean(growth**2))
+    return {
+        'three_sigma': three_sigma,
+        'p9973': float(np.quantile(growth, 0.9973)),
+        'exceedance': float(np.mean(growth > max_3sigma_angle_deg)),
+        'aided_three_sigma': 3*sqrt(np.mean(result['aided_error']**2)),
+        'total_three_sigma': 3*sqrt(np.mean(result['outage_error']**2)),
+        'filter_three_sigma': 3*sqrt(np.mean(result['outage_sigma']**2)),
+        'met': three_sigma <= max_3sigma_angle_deg,
+    }
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="MEKF replay against the gyro-only attitude requirement")
+    parser.add_argument("--instances", type=int, default=500, help="Filter instances run together")
+    parser.add_argument("--hours", type=float, default=1.0, help="Simulated time per instance [h]")
+    parser.add_argument("--outage", type=float, default=T_required_s, help="Gyro-only interval [s]")
+    parser.add_argument("--cycle", type=float, default=300.0, help="Outage period [s]")
+    parser.add_argument("--rate-max", type=float, default=1.0, help="Largest body rate [deg/s]")
+    parser.add_argument("--dt", type=float, default=dt, help="Filter step [s]")
+    parser.add_argument("--seed", type=int, default=0)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = replay(args.instances, args.hours, args.outage, args.cycle, rate_max=args.rate_max,
+                    dt=args.dt, seed=args.seed, cache=cache_from_args(args))
+    elapsed = time.perf_counter() - start
+    check = check_requirement(result)
+    predicted = 3 * GYRO.noise_density * sqrt(args.outage)
+
+    print("---------------MEKF GYRO-ONLY PROPAGATION CHECK------------")
+    print(f"Replay: {args.instances} instances x {args.hours:g} h at {1/args.dt:g} Hz "
+          f"({args.instances*args.hours:g} h of data) in {elapsed:.1f} s")
+    print(f"Gyro ARW: {GYRO.noise_density*1000:g} mdps/sqrt(Hz) "
+          f"(IMUSizing limit {max_arw(max_3sigma_angle_deg, args.outage):.2f})")
+    print(f"Samples: {result['samples']} outages of {args.outage:g} s, 3 axes each")
+    print(f"Error at the start of the outage (3-sigma): {check['aided_three_sigma']:.4f} deg")
+    print(f"Error at the end of the outage (3-sigma): {check['total_three_sigma']:.4f} deg "
+          f"(filter {check['filter_three_sigma']:.4f} deg)")
+    print(f"ARW-only prediction of the growth (3-sigma): {predicted:.4f} deg")
+    print(f"Error growth over the outage (3-sigma): {check['three_sigma']:.4f} deg")
+    print(f"Error growth over the outage (P99.73): {check['p9973']:.4f} deg")
+    print(f"Axis growths above {max_3sigma_angle_deg} deg: {check['exceedance']*100:.2f} % (0.27 % allowed)")
+    print(f"Requirement {max_3sigma_angle_deg} deg (3-sigma) over {args.outage:g} s:",
+          "met" if check['met'] else "NOT met")
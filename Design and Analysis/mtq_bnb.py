@@ -0,0 +1,84 @@
+"""
+Branch-and-bound search over the discrete magnetorquer choices.
+
+Every (dwire, rho, nlayers[, material]) combination is a branch with a cheap
+upper bound on the magnetic moment from a continuous relaxation (see
+moment_bound() in the MTQ sizing scripts). Branches are solved best-bound
+first, and the search stops as soon as no remaining bound can beat the best
+design found so far, so only the few branches that matter reach SLSQP.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from mtq_sweep import _solve, best_config_for, report_failure
+
+
+def branch_and_bound(solve_case, cases, bounds, workers=None, report_failures=True, rtol=1e-6):
+    """
+    Find the case with the largest magnetic moment without solving every case.
+    Parameters:
+        solve_case (callable): Module-level function solve_case(*case) returning (res, M),
+            as for mtq_sweep.run_sweep()
+        cases (list): Discrete combinations, e.g. from mtq_sweep.sweep_cases()
+        bounds (array_like): Upper bound on M [A*m^2] for each case
+        workers (int): Branches solved concurrently per round, None for os.cpu_count(),
+            1 to run serially in this process (as for mtq_sweep.run_sweep())
+        report_failures (bool): Print failed sub-problems like the serial loop
+        rtol (float): Relative slack on the bounds, since SLSQP may overshoot an
+            active constraint (and hence the bound) by its tolerance
+    Returns:
+        tuple: (best_config, results, n_pruned)
+            best_config as for mtq_sweep.run_sweep()
+            results lists (case, res, M) for the solved cases in input order
+            n_pruned is the number of cases that were never solved
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, workers)
+
+    bounds = np.asarray(bounds, dtype=float) * (1 + rtol)
+    # Best bound first; ties in input order so the search is reproducible
+    order = sorted(range(len(cases)), key=lambda i: (-bounds[i], i))
+
+    solved = {}
+    best_index = None
+    best_moment = -1
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        pos = 0
+        while pos < len(order) and bounds[order[pos]] > best_moment:
+            # Take the next round of branches that can still beat the incumbent
+            batch = []
+            while pos < len(order) and len(batch) < workers and bounds[order[pos]] > best_moment:
+                batch.append(order[pos])
+                pos += 1
+
+            jobs = [(solve_case, cases[i]) for i in batch]
+            outputs = pool.map(_solve, jobs) if pool else map(_solve, jobs)
+
+            for i, (res, M) in zip(batch, outputs):
+                solved[i] = (res, M)
+                # Same selection rule as the exhaustive sweep: largest M, earliest case on ties
+                if res.success and (M > best_moment or (M == best_moment and i < best_index)):
+                    best_moment = M
+                    best_index = i
+    finally:
+        if pool:
+            pool.shutdown()
+
+    results = []
+    for i in sorted(solved):
+        res, M = solved[i]
+        if not res.success and report_failures:
+            report_failure(cases[i], res)
+        results.append((cases[i], res, M))
+
+    best_config = None
+    if best_index is not None:
+        best_config = best_config_for(cases[best_index], *solved[best_index])
+
+    return best_config, results, len(cases) - len(solved)
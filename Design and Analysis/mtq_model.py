@@ -0,0 +1,144 @@
+"""
+Magnetorquer rod model shared by MTQRodSizing.py and MTQRodSizing2.py.
+
+rod() uses plain arithmetic only, so the same formulas evaluate one design on
+floats (the optimiser's path, sizing()) or many designs on broadcast numpy
+arrays (sizing_batch()). The current is either a design variable or set by the
+bus voltage.
+
+With grad=True, rod() also returns the hand-derived gradients of its outputs
+with respect to the design vector (Lcore [mm], Rcore [mm], I [A]) for the
+relaxed (unrounded) turn count. Each derivative is computed right after the
+formula it differentiates, so the gradients are carried through the same
+code as the values (sizing_jac()).
+"""
+
+from math import pi, sqrt
+
+import numpy as np
+
+mu_0 = 4 * pi * 1e-7  # Permeability of free space [H/m]
+
+# Core material catalog: name -> (mu_r, B_saturation [T], core_density [kg/m^3])
+CORE_MATERIALS = {
+    'ferrite': (2000, 1.2, 7500),
+    'mu-metal': (500000, 0.75, 7500),
+}
+
+PACKING_EFFICIENCY = 0.8    # Packing efficiency for winding
+copper_density = 8960       # Density of copper [kg/m^3]
+
+def _round(x):
+    # Nearest integer, half to even like round(), for floats and arrays
+    if isinstance(x, np.ndarray):
+        return np.rint(x).astype(np.int64)
+    return round(x)
+
+def rod(Lcore, Rcore, dwire, rho, nlayers, I=None, Vbus=None, material='ferrite', relaxed=False, grad=False):
+    """
+    Magnetorquer rod design parameters, for one design (floats) or many
+    (numpy arrays of a common shape).
+    Parameters:
+        Lcore (float): Length of the core [mm]
+        Rcore (float): Radius of the core [mm]
+        dwire (float): Wire diameter [mm]
+        rho (float): Resistance per meter of wire [ohm/m]
+        nlayers (int): Number of winding layers
+        I (float): Current [A], or None to drive the coil at Vbus
+        Vbus (float): Bus voltage [V], used when I is None
+        material (str): Key of CORE_MATERIALS
+        relaxed (bool): Use a continuous turns per layer instead of rounding
+        grad (bool): Also return the gradients (one design, relaxed only)
+    Returns:
+        dict: Design parameters including magnetic moment, number of turns, wire length, resistance, voltage, and power.
+        With grad, a tuple (that dict, gradients): arrays of shape (3,) over
+        (Lcore [mm], Rcore [mm], I [A]) for 'M [A*m^2]', 'Power [W]', 'Voltage [V]'
+        and 'Mass [kg]'. With I set by Vbus the current is not a design variable
+        and the last component is 0.
+    """
+
+    if grad and not relaxed:
+        raise ValueError("Gradients need the relaxed turn count")
+    mu_r, _, core_density = CORE_MATERIALS[material]
+
+    # Convert to SI units
+    Lcore = Lcore * 1e-3
+    Rcore = Rcore * 1e-3
+    dwire = dwire * 1e-3
+    if grad:
+        dLcore = np.array([1e-3, 0.0, 0.0])
+        dRcore = np.array([0.0, 1e-3, 0.0])
+
+    # Winding calculations
+    nturns_per_layer = PACKING_EFFICIENCY * (Lcore / dwire)         # Turns per layer
+    if not relaxed:
+        nturns_per_layer = _round(nturns_per_layer)
+    N = nlayers * nturns_per_layer                                  # Total number of turns
+    R_avg = Rcore + (nlayers * dwire) / 2                           # Average radius of winding [m]
+    wire_len = 2 * pi * R_avg * N                                   # Wire length [m]
+    if grad:
+        dN = N / Lcore * dLcore
+        dwire_len = 2 * pi * (dRcore * N + R_avg * dN)
+
+    # Power calculations
+    Resistance = rho * wire_len # [ohm]
+    if grad:
+        dResistance = rho * dwire_len
+    if I is None:
+        I = Vbus / Resistance   # Current [A]
+        if grad:
+            dI = -I / Resistance * dResistance
+    elif grad:
+        dI = np.array([0.0, 0.0, 1.0])
+    Voltage = I * Resistance    # [V]
+    Power = I**2 * Resistance   # [W]
+    if grad:
+        dVoltage = I * dResistance + Resistance * dI
+        dPower = I**2 * dResistance + 2 * I * Resistance * dI
+
+    # Magnetic moment calculations
+    Acore = pi * Rcore**2                                           # Core Area [m^2]
+    Nd = 1/((2*(Lcore/Rcore)/sqrt(pi))+1)                           # Demagnetization factor
+    f = 1 + ((mu_r - 1) / (1 + (mu_r - 1) * Nd))                    # Effective relative permeability
+
+    M = N * I * Acore * f                                           # Magnetic moment [A*m^2]
+    if grad:
+        dAcore = 2 * pi * Rcore * dRcore
+        dNd = -2/sqrt(pi) * Nd**2 * (dLcore / Rcore - Lcore / Rcore**2 * dRcore)
+        df = -(mu_r - 1)**2 / (1 + (mu_r - 1) * Nd)**2 * dNd
+        dM = I * Acore * f * dN + N * Acore * f * dI + N * I * f * dAcore + N * I * Acore * df
+
+    H = N * I / Lcore                                               # Applied Magnetic field strength by coil [A/m]
+    mu_eff = mu_0 * f                                               # Effective permeability
+    B = mu_eff*H           # Magnetic flux density [T] in core
+
+    # Mass calculations
+    core_volume = Acore * Lcore  # Core volume [m^3]
+    core_mass = core_volume * core_density  # Core mass [kg]
+    wire_mass = wire_len * (pi*dwire**2 / 4) * copper_density  # Wire mass [kg]
+    mass = core_mass + wire_mass  # Total mass [kg]
+    if grad:
+        dmass = core_density * (dAcore * Lcore + Acore * dLcore) + copper_density * (pi*dwire**2 / 4) * dwire_len
+    Inductance = mu_eff * N**2 * (pi * (Rcore)**2)/Lcore  # Inductance [H]
+
+    result = {
+        'Lcore [mm]': Lcore * 1e3,
+        'Rcore [mm]': Rcore * 1e3,
+        'dwire [mm]': dwire * 1e3,
+        'nlayers': nlayers,
+        'I [A]': I,
+        'Turns per Layer': nturns_per_layer,
+        'Total Turns': N,
+        'Wire Length [m]': wire_len,
+        'M [A*m^2]': M,
+        'B [T]': B,
+        'Resistance [ohm]': Resistance,
+        'Voltage [V]': Voltage,
+        'Power [W]': Power,
+        'Mass [kg]': mass,
+        'Inductance [H]': Inductance,
+        'Time Constant [ms]': Inductance/Resistance*1e3  # Time constant [ms]
+    }
+    if grad:
+        return result, {'M [A*m^2]': dM, 'Power [W]': dPower, 'Voltage [V]': dVoltage, 'Mass [kg]': dmass}
+    return result
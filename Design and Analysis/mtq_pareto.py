@@ -0,0 +1,92 @@
+"""
+Non-dominated sorting for the magnetorquer trade space.
+"""
+
+import numpy as np
+
+
+def _dominated_by(front, block):
+    """
+    Mask of block rows weakly dominated by some front row (front <= row in
+    every objective). Objectives are compared one at a time to avoid an
+    (n_front, n_block, k) temporary.
+    """
+    le = front[:, None, 0] <= block[None, :, 0]
+    for k in range(1, front.shape[1]):
+        le &= front[:, None, k] <= block[None, :, k]
+    return le.any(axis=0)
+
+
+def non_dominated(costs, eps=None, chunk=512):
+    """
+    Indices of the Pareto-optimal rows of a cost matrix (all objectives minimised).
+    Duplicate rows are collapsed and the rest sorted lexicographically, so a row
+    can only be dominated by rows before it. The candidates are then streamed in
+    chunks against the front found so far, which keeps the work close to
+    n * front size and the memory to chunk * front size.
+
+    With eps set, the objective space is split into boxes of eps times the range
+    of each objective and only the best row of each box takes part in the sort
+    (an eps-Pareto set). Use this when the front itself holds millions of rows.
+    Parameters:
+        costs (array_like): (n, k) objective values, smaller is better
+        eps (float): Box size relative to each objective's range, None for the exact front
+        chunk (int): Candidates compared against the front at once
+    Returns:
+        ndarray: Indices into costs of the non-dominated rows
+    """
+    costs = np.asarray(costs, dtype=float)
+    if costs.ndim != 2:
+        raise ValueError("costs must be an (n, k) array")
+    if len(costs) == 0:
+        return np.empty(0, dtype=int)
+
+    if eps is not None:
+        lo = costs.min(axis=0)
+        span = costs.max(axis=0) - lo
+        span[span == 0] = 1.0
+        scaled = (costs - lo) / span
+        boxes = np.floor(scaled / eps)
+        # Representative of each box: the row nearest its lower corner
+        closeness = (scaled - boxes * eps).sum(axis=1)
+        order = np.lexsort((closeness,) + tuple(boxes.T[::-1]))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = np.any(boxes[order[1:]] != boxes[order[:-1]], axis=1)
+        representatives = order[first]
+        return representatives[non_dominated(boxes[representatives], chunk=chunk)]
+
+    # Identical rows do not dominate each other, keep one per group for the sort
+    unique, inverse = np.unique(costs, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    front = np.empty((0, costs.shape[1]))
+    keep = []
+    for start in range(0, len(unique), chunk):
+        block = unique[start:start+chunk]
+        index = np.arange(start, start + len(block))
+
+        # Drop candidates dominated by the front found so far
+        if len(front):
+            alive = ~_dominated_by(front, block)
+            block, index = block[alive], index[alive]
+
+        # Within the (sorted) chunk, row i can only be dominated by rows j < i
+        le = np.tril(_pairwise_le(block), k=-1)
+        alive = ~le.any(axis=1)
+
+        front = np.concatenate([front, block[alive]])
+        keep.append(index[alive])
+
+    on_front = np.zeros(len(unique), dtype=bool)
+    on_front[np.concatenate(keep)] = True
+    return np.flatnonzero(on_front[inverse])
+
+
+def _pairwise_le(block):
+    """
+    le[i, j] is True when block[j] <= block[i] in every objective.
+    """
+    le = block[None, :, 0] <= block[:, None, 0]
+    for k in range(1, block.shape[1]):
+        le &= block[None, :, k] <= block[:, None, k]
+    return le
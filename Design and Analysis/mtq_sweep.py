@@ -0,0 +1,149 @@
+"""
+Parallel sweep engine for the magnetorquer sizing scripts.
+
+The MTQ sizing scripts solve one continuous sub-problem per discrete
+(dwire, rho, nlayers) combination. The sub-problems are independent, so they
+are farmed out over a process pool here. Results are collected in submission
+order, which keeps the selected best design identical to the serial loop no
+matter which worker finishes first.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+
+
+def sweep_cases(awg_table, n_layers_max, materials=None):
+    """
+    Enumerate the discrete sub-problems in the same order as the serial loop.
+    Parameters:
+        awg_table (list): (diameter_mm, resistance_ohm_per_m) wire entries
+        n_layers_max (int): Max number of winding layers
+        materials (list): Core material names to sweep as the outermost loop,
+            None to leave the material out of the cases
+    Returns:
+        list: (dwire, rho, nlayers) tuples, or (dwire, rho, nlayers, material)
+    """
+    if materials is None:
+        return [(dwire, rho, nlayers)
+                for dwire, rho in awg_table
+                for nlayers in range(1, n_layers_max+1)]
+    return [(dwire, rho, nlayers, material)
+            for material in materials
+            for dwire, rho in awg_table
+            for nlayers in range(1, n_layers_max+1)]
+
+
+def _solve(args):
+    solve_case, case = args
+    return solve_case(*case)
+
+
+def best_config_for(case, res, M):
+    """
+    Build the best_config dict reported for a solved case.
+    """
+    dwire, rho, nlayers = case[:3]
+    config = {
+        'x': res.x,  # Optimal parameters
+        'dwire': dwire,  # Wire diameter [mm]
+        'rho': rho,  # Resistance per meter [ohm/m]
+        'nlayers': nlayers,  # Number of layers
+        'M': M,  # Magnetic moment [A*m^2]
+    }
+    if len(case) > 3:
+        config['material'] = case[3]  # Core material
+    return config
+
+
+def report_failure(case, res):
+    """
+    Print a failed sub-problem the way the serial loop does.
+    """
+    dwire, rho, nlayers = case[:3]
+    material = f", material={case[3]}" if len(case) > 3 else ""
+    print(f"Optimization failed for dwire={dwire}, rho={rho}, nlayers={nlayers}{material}: {res.message}")
+
+
+@instrument.timed('mtq.sweep')
+def run_sweep(solve_case, cases, workers=None, report_failures=True):
+    """
+    Solve every discrete sub-problem and pick the one with the largest moment.
+    Parameters:
+        solve_case (callable): Module-level function solve_case(*case)
+            returning (res, M), where res is the scipy OptimizeResult and M the
+            magnetic moment at res.x (ignored when res.success is False)
+        cases (list): (dwire, rho, nlayers) tuples, see sweep_cases()
+        workers (int): Number of worker processes, None for os.cpu_count(),
+            1 to run serially in this process
+        report_failures (bool): Print failed sub-problems like the serial loop
+    Returns:
+        tuple: (best_config, results)
+            best_config is a dict with keys 'x', 'dwire', 'rho', 'nlayers', 'M'
+            (and 'material' for 4-tuple cases), or None if no sub-problem converged
+            results lists (case, res, M) for every case in input order
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(cases)))
+
+    jobs = [(solve_case, case) for case in cases]
+    if workers == 1:
+        results = list(map(_solve, jobs))
+    else:
+        # A few chunks per worker keeps scheduling overhead low while still
+        # balancing sub-problems that take very different numbers of iterations
+        chunksize = max(1, len(jobs) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_solve, jobs, chunksize=chunksize))
+
+    best_config = None
+    best_moment = -1
+
+    # Ties keep the earliest case, exactly as the serial loop does
+    for case, (res, M) in zip(cases, results):
+        if res.success:
+            if M > best_moment:
+                best_moment = M
+                best_config = best_config_for(case, res, M)
+        elif report_failures:
+            report_failure(case, res)
+
+    return best_config, [(case, res, M) for case, (res, M) in zip(cases, results)]
+
+
+class CachedSolver:
+    """
+    Wrap solve_case so every case's (res, M) is kept in a ResultCache.
+    Instances are picklable and can be passed to run_sweep() in place of solve_case.
+    Parameters:
+        solve_case (callable): Module-level solve_case(*case) returning (res, M)
+        cache (ResultCache): Where results are stored
+        inputs (tuple): Model inputs and code version the results depend on,
+            the case itself is added to the key
+    """
+
+    _RESULT_FIELDS = ('x', 'success', 'status', 'message', 'fun', 'nit', 'nfev', 'njev', 'grad_error')
+
+    def __init__(self, solve_case, cache, inputs):
+        self.solve_case = solve_case
+        self.cache = cache
+        self.inputs = inputs
+
+    def __call__(self, *case):
+        key = self.cache.key(self.inputs, case)
+        stored = self.cache.load(key)
+        if stored is not None:
+            from scipy.optimize import OptimizeResult
+            res = OptimizeResult({name: stored[name] for name in self._RESULT_FIELDS if name in stored})
+            res['cache_stats'] = {name[len('cache_stats.'):]: value for name, value in stored.items()
+                                  if name.startswith('cache_stats.')}
+            return res, stored['M']
+
+        res, M = self.solve_case(*case)
+        stored = {name: res[name] for name in self._RESULT_FIELDS if name in res}
+        stored.update({f'cache_stats.{name}': value for name, value in res.get('cache_stats', {}).items()})
+        stored['M'] = M
+        self.cache.save(key, stored)
+        return res, M
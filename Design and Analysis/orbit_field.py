@@ -0,0 +1,221 @@
+"""
+Orbit ephemeris and geomagnetic field along the orbit, as a cached lookup table.
+
+The orbit of SimulationModel_v3.0/CubeSat_Params.m is propagated as a Keplerian
+ellipse and the Earth's field is evaluated along it with a dipole model:
+    'tilted': degree-1 IGRF-13 (2020) Gauss coefficients g10, g11, h11
+    'axial':  g10 only, dipole aligned with the spin axis
+Both are tabulated in ECI on a uniform time grid. The table is stored in the
+result cache as an uncompressed .npy file and memory-mapped, so a simulation
+looks B(t) up with a linear interpolation instead of evaluating the model on
+every step, and reruns do not rebuild it.
+"""
+
+import argparse
+import time
+from math import *
+
+import numpy as np
+
+import instrument
+from resultcache import ResultCache, add_cache_arguments, cache_from_args, code_version
+
+# Orbital parameters from CubeSat_Params.m
+alt = 500e3 # Altitude [m]
+Re = 6371e3 # Radius of Earth [m]
+Mu = 3.986e14 # Standard gravitational parameter of Earth [m^3/s^2]
+a = Re + alt # Semi-major axis [m]
+e = 0 # Eccentricity
+i = radians(90) # Inclination [rad]
+RAAN = 0 # Right ascension of the ascending node [rad]
+argp = radians(90) # Argument of periapsis [rad]
+ta = radians(0) # True anomaly at t = 0 [rad]
+
+w_earth = 7.2921159e-5 # Earth rotation rate [rad/s]
+gmst0 = 0 # Greenwich sidereal angle at t = 0 [rad]
+
+# IGRF-13 degree-1 Gauss coefficients, epoch 2020 [T] (reference radius 6371.2 km)
+R_ref = 6371.2e3 # [m]
+g10 = -29404.8e-9
+g11 = -1450.9e-9
+h11 = 4652.5e-9
+
+# Table grid
+table_step = 5.0 # [s]
+table_duration = 24*60*60 # [s], the field is not orbit-periodic as the Earth turns under the orbit
+
+def orbit_elements():
+    """
+    Returns:
+        dict: Keplerian elements of the CubeSat_Params.m orbit
+    """
+    return dict(a=a, e=e, i=i, RAAN=RAAN, argp=argp, ta=ta)
+
+def kepler_position(t, a=a, e=e, i=i, RAAN=RAAN, argp=argp, ta=ta):
+    """
+    ECI position on a Keplerian orbit.
+    Parameters:
+        t (array_like): Time since epoch [s]
+        a, e, i, RAAN, argp, ta: Elements at epoch [m, -, rad, rad, rad, rad]
+    Returns:
+        ndarray: (..., 3) position [m]
+    """
+    t = np.asarray(t, dtype=float)
+    n = sqrt(Mu/a**3) # Mean motion [rad/s]
+
+    E0 = 2*atan2(sqrt(1 - e)*sin(ta/2), sqrt(1 + e)*cos(ta/2))
+    M = E0 - e*sin(E0) + n*t
+    # Kepler's equation by Newton iteration (exact in one step for e = 0)
+    E = M.copy()
+    for _ in range(50):
+        dE = (E - e*np.sin(E) - M) / (1 - e*np.cos(E))
+        E -= dE
+        if np.max(np.abs(dE)) < 1e-14:
+            break
+    nu = 2*np.arctan2(sqrt(1 + e)*np.sin(E/2), sqrt(1 - e)*np.cos(E/2))
+    r = a*(1 - e*np.cos(E))
+
+    # Perifocal to ECI, R3(-RAAN) R1(-i) R3(-argp)
+    u = argp + nu # Argument of latitude
+    cu, su = np.cos(u), np.sin(u)
+    cO, sO, ci, si = cos(RAAN), sin(RAAN), cos(i), sin(i)
+    return r[..., None] * np.stack([cO*cu - sO*su*ci,
+                                    sO*cu + cO*su*ci,
+                                    su*si], axis=-1)
+
+def dipole_field(r_ecef, model='tilted'):
+    """
+    Degree-1 geomagnetic field B = (R_ref/r)^3 [3 (g . r_hat) r_hat - g],
+    with g = [g11, h11, g10] the dipole Gauss coefficients in ECEF.
+    Parameters:
+        r_ecef (array_like): (..., 3) ECEF position [m]
+        model (str): 'tilted' or 'axial'
+    Returns:
+        ndarray: (..., 3) field in ECEF [T]
+    """
+    if model == 'tilted':
+        g = np.array([g11, h11, g10])
+    elif model == 'axial':
+        g = np.array([0, 0, g10])
+    else:
+        raise ValueError(f"Unknown field model {model!r}")
+    r_ecef = np.asarray(r_ecef, dtype=float)
+    r = np.linalg.norm(r_ecef, axis=-1, keepdims=True)
+    r_hat = r_ecef / r
+    return (R_ref/r)**3 * (3*(r_hat @ g)[..., None]*r_hat - g)
+
+def _rotate_z(v, angle):
+    # Rotate (..., 3) vectors by angle [rad] about z
+    c, s = np.cos(angle), np.sin(angle)
+    return np.stack([c*v[..., 0] - s*v[..., 1], s*v[..., 0] + c*v[..., 1], v[..., 2]], axis=-1)
+
+def field_eci(t, model='tilted', elements=None):
+    """
+    Position and geomagnetic field along the orbit, evaluated directly.
+    Parameters:
+        t (array_like): Time since epoch [s]
+        model (str): Field model, see dipole_field()
+        elements (dict): Orbit elements, default orbit_elements()
+    Returns:
+        tuple: (r_eci (..., 3) [m], B_eci (..., 3) [T])
+    """
+    t = np.asarray(t, dtype=float)
+    r_eci = kepler_position(t, **(elements or orbit_elements()))
+    gmst = gmst0 + w_earth*t
+    B_ecef = dipole_field(_rotate_z(r_eci, -gmst), model)
+    return r_eci, _rotate_z(B_ecef, gmst)
+
+def build_table(model='tilted', step=table_step, duration=table_duration, elements=None):
+    """
+    Tabulate field_eci() on a uniform grid.
+    Returns:
+        ndarray: (n, 6) rows [r_eci (m), B_eci (T)] at t = k*step
+    """
+    t = np.arange(int(ceil(duration/step)) + 1) * step
+    r_eci, B_eci = field_eci(t, model, elements)
+    return np.hstack([r_eci, B_eci])
+
+class FieldTable:
+    """
+    Orbit and field lookup by linear interpolation in a build_table() table.
+    Parameters:
+        table (ndarray): (n, 6) table, typically a memory map from load_table()
+        step (float): Grid step of the table [s]
+    """
+
+    def __init__(self, table, step=table_step):
+        self.table = table
+        self.step = step
+        self.duration = (len(table) - 1) * step
+
+    def _lookup(self, t, columns):
+        instrument.count('field.lookups')
+        t = np.asarray(t, dtype=float)
+        if np.any(t < 0) or np.any(t > self.duration):
+            raise ValueError(f"Time outside the table (0 to {self.duration:.0f} s)")
+        x = t / self.step
+        k = np.minimum(x.astype(int), len(self.table) - 2)
+        frac = (x - k)[..., None]
+        lo = self.table[k, columns]
+        hi = self.table[k + 1, columns]
+        return lo + frac*(hi - lo)
+
+    def position(self, t):
+        """
+        ECI position (..., 3) [m] at time t [s].
+        """
+        return self._lookup(t, slice(0, 3))
+
+    def B(self, t):
+        """
+        Geomagnetic field in ECI (..., 3) [T] at time t [s].
+        """
+        return self._lookup(t, slice(3, 6))
+
+def load_table(model='tilted', step=table_step, duration=table_duration, cache=None):
+    """
+    FieldTable for the CubeSat_Params.m orbit, built on the first call and
+    memory-mapped from the result cache afterwards.
+    Parameters:
+        model (str): Field model, see dipole_field()
+        step (float): Grid step [s]
+        duration (float): Time span covered [s]
+        cache (ResultCache): Where the table is kept, default ResultCache()
+    """
+    cache = cache or ResultCache()
+    inputs = dict(model=model, step=step, duration=duration, elements=orbit_elements(), Mu=Mu,
+                  w_earth=w_earth, gmst0=gmst0, R_ref=R_ref, g=[g10, g11, h11])
+    version = code_version(kepler_position, dipole_field, _rotate_z, field_eci, build_table)
+    table = cache.get_mmap((inputs, version), lambda: build_table(model, step, duration))
+    return FieldTable(table, step)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Geomagnetic field along the CubeSat orbit")
+    parser.add_argument("--model", choices=["tilted", "axial"], default="tilted")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    cache = cache_from_args(args)
+
+    start = time.perf_counter()
+    table = load_table(args.model, cache=cache)
+    print(f"Table: {len(table.table)} points over {table.duration/3600:.0f} h, "
+          f"{time.perf_counter() - start:.3f} s to build or map")
+
+    T = 2*pi*sqrt(a**3/Mu)
+    t = np.linspace(0, T, 10001)
+    B_norm = np.linalg.norm(table.B(t), axis=-1)
+    print(f"Orbit period: {T/60:.1f} min")
+    print(f"|B| over the first orbit: {B_norm.min()*1e6:.1f} to {B_norm.max()*1e6:.1f} uT")
+
+    # Interpolation error and cost against direct evaluation, off the grid points
+    t = np.random.default_rng(0).uniform(0, table.duration, 100000)
+    start = time.perf_counter()
+    B_direct = field_eci(t, args.model)[1]
+    direct = time.perf_counter() - start
+    start = time.perf_counter()
+    B_table = table.B(t)
+    lookup = time.perf_counter() - start
+    error = np.max(np.linalg.norm(B_table - B_direct, axis=-1) / np.linalg.norm(B_direct, axis=-1))
+    print(f"Lookup vs direct model, 100k points: {lookup*1e3:.1f} ms vs {direct*1e3:.1f} ms, "
+          f"max relative error {error:.1e}")
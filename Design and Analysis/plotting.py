@@ -0,0 +1,145 @@
+"""
+Downsampled, headless figure rendering for long simulation histories.
+
+Series longer than max_points are reduced before they reach matplotlib:
+    'minmax': the min and max of each bucket, in time order, so every peak
+              (e.g. the dipole hitting its saturation limit) is kept exactly
+    'lttb':   largest-triangle-three-buckets, one point per bucket chosen to
+              preserve the visual shape of the line
+Min/max envelopes from history.HistoryRecorder (an (n, 2) series) are merged
+bucket by bucket and drawn as a band.
+
+Figures are plain matplotlib.figure.Figure objects, never pyplot, so they need
+no display and can be saved to PNG or SVG from worker processes. render() runs
+figure jobs over a process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from math import *
+
+import numpy as np
+
+max_points = 2000 # Points per series after downsampling
+method = 'minmax' # Default downsampling method
+dpi = 120
+figsize = (8, 5) # [in]
+
+def lttb(x, y, n):
+    """
+    Largest-triangle-three-buckets: indices of n points of (x, y) that keep
+    the shape of the line. The first and last points are always kept.
+    """
+    N = len(y)
+    if n >= N or n < 3:
+        return np.arange(N)
+    # n - 2 buckets between the first and last point; bucket i is edges[i]:edges[i+1]
+    edges = np.linspace(1, N - 1, n - 1).astype(np.int64)
+    bounds = np.append(edges, N)
+    cx, cy = np.concatenate([[0.0], np.cumsum(x)]), np.concatenate([[0.0], np.cumsum(y)])
+    # Mean of the bucket after each bucket (the last point after the last bucket)
+    lo, hi = bounds[1:-1], bounds[2:]
+    mean_x = (cx[hi] - cx[lo]) / (hi - lo)
+    mean_y = (cy[hi] - cy[lo]) / (hi - lo)
+
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, N - 1
+    a = 0
+    for i in range(n - 2):
+        s = slice(edges[i], edges[i + 1])
+        # Twice the area of the triangle (a, candidate, next bucket mean)
+        area = np.abs((x[a] - mean_x[i]) * (y[s] - y[a]) - (x[a] - x[s]) * (mean_y[i] - y[a]))
+        a = edges[i] + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def minmax(y, n):
+    """
+    Indices of the min and max of each of n//2 buckets of y, in order, plus the
+    first and last points.
+    """
+    N = len(y)
+    buckets = max(n // 2, 1)
+    if n >= N:
+        return np.arange(N)
+    size = -(-N // buckets)
+    padded = np.concatenate([y, np.full(size*buckets - N, y[-1])]).reshape(buckets, size)
+    start = np.arange(buckets) * size
+    lo = np.minimum(start + padded.argmin(axis=1), N - 1)
+    hi = np.minimum(start + padded.argmax(axis=1), N - 1)
+    return np.unique(np.concatenate([[0, N - 1], lo, hi]))
+
+def envelope(x, y, n):
+    """
+    Merge an (N, 2) min/max envelope into at most n blocks.
+    Returns:
+        tuple: (x at the block starts, (k, 2) envelope)
+    """
+    N = len(y)
+    if n >= N:
+        return x, y
+    starts = np.linspace(0, N, n + 1).astype(np.int64)[:-1]
+    return x[starts], np.stack([np.minimum.reduceat(y[:, 0], starts), np.maximum.reduceat(y[:, 1], starts)], axis=1)
+
+def downsample(x, y, n=max_points, method=method):
+    """
+    Reduce the series y(x) to about n points. y may be (N,) or an (N, 2)
+    min/max envelope, which always uses envelope().
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if y.ndim == 2:
+        return envelope(x, y, n)
+    if method == 'lttb':
+        keep = lttb(x, y, n)
+    elif method == 'minmax':
+        keep = minmax(y, n)
+    else:
+        raise ValueError(f"Unknown downsampling method {method!r}")
+    return x[keep], y[keep]
+
+def plot_series(ax, x, y, max_points=max_points, method=method, **style):
+    """
+    Draw y(x) on ax after downsampling: a line, or a band for an (N, 2) envelope.
+    """
+    x, y = downsample(x, y, max_points, method)
+    if y.ndim == 2:
+        return ax.fill_between(x, y[:, 0], y[:, 1], **style)
+    return ax.plot(x, y, **style)
+
+def new_figure(figsize=figsize):
+    """
+    A Figure with one set of axes, detached from pyplot and any display.
+    Returns:
+        tuple: (Figure, Axes)
+    """
+    from matplotlib.figure import Figure # Deferred, matplotlib is slow to import
+    fig = Figure(figsize=figsize, layout='tight')
+    return fig, fig.add_subplot()
+
+def save(fig, path, dpi=dpi):
+    """
+    Write fig to path, format from the extension (.png, .svg, .pdf).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(path, dpi=dpi)
+    return path
+
+def _run(job):
+    function, args = job
+    return function(*args)
+
+def render(jobs, workers=1):
+    """
+    Run figure jobs, (function, args) pairs with module-level functions that
+    draw and save their figures, workers at a time in separate processes.
+    Returns:
+        list: The results of the jobs, in order
+    """
+    jobs = list(jobs)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        return [_run(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run, jobs))
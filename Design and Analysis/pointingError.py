@@ -27,13 +27,15 @@ theta_total_peak = theta_est_peak + theta_ctrl_peak + jitter_peak
 # Requirement
 theta_required = 1.0  # degrees
 
-# Print results
-print("---------------NOMINAL MODE POINTING ERROR ANALYSIS------------")
-# print("Pixel angular resolution:", round(pixel_angular_resolution, 5), "deg/pixel")
-print("Estimation Error (RMS):", theta_est_rms, "deg")
-print("Control Error (RMS):", theta_ctrl_rms, "deg")
-print("Jitter (RMS):", round(jitter_rms, 4), "deg")
-print("Total Pointing Error (RMS):", round(theta_total_rms, 4), "deg")
-print("Total Pointing Error (Worst-case):", round(theta_total_peak, 4), "deg")
-print("Pointing Error Requirement:", theta_required, "deg")
-print("RMS Margin:", round((theta_required - theta_total_rms) / theta_required * 100, 2), "%")
\ No newline at end of file
+if __name__ == "__main__":
+
+    # Print results
+    print("---------------NOMINAL MODE POINTING ERROR ANALYSIS------------")
+    # print("Pixel angular resolution:", round(pixel_angular_resolution, 5), "deg/pixel")
+    print("Estimation Error (RMS):", theta_est_rms, "deg")
+    print("Control Error (RMS):", theta_ctrl_rms, "deg")
+    print("Jitter (RMS):", round(jitter_rms, 4), "deg")
+    print("Total Pointing Error (RMS):", round(theta_total_rms, 4), "deg")
+    print("Total Pointing Error (Worst-case):", round(theta_total_peak, 4), "deg")
+    print("Pointing Error Requirement:", theta_required, "deg")
+    print("RMS Margin:", round((theta_required - theta_total_rms) / theta_required * 100, 2), "%")
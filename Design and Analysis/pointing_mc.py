@@ -0,0 +1,197 @@
+"""
+Monte Carlo pointing error budget.
+
+Each error source of pointingError.py is drawn as a small 3-D rotation
+(rotation vector) from a configurable distribution. The rotations are composed
+as quaternions and the pointing error is the angle by which the composed
+rotation moves the boresight (body +z), so errors about the boresight do not
+count and the sources combine geometrically rather than as scalars.
+
+The RMS is accumulated directly and the quantiles from a fixed-bin histogram,
+so memory does not depend on the number of samples. Sampling stops early once
+the confidence interval of the P99.7 margin against theta_required is narrower
+than the requested tolerance.
+"""
+
+import argparse
+import time
+from math import *
+
+import numpy as np
+
+from pointingError import jitter_peak, theta_ctrl_rms, theta_est_rms, theta_required
+
+# Error sources: (distribution, parameter) [deg]
+#   'normal':   per-axis standard deviation, scalar or (x, y, z)
+#   'uniform':  per-axis half width, scalar or (x, y, z)
+#   'sinusoid': peak amplitude about a random axis normal to the boresight, random phase
+# The RMS values of pointingError.py are 2-axis pointing errors, hence /sqrt(2) per axis
+SOURCES = {
+    'estimation': ('normal', theta_est_rms / sqrt(2)),
+    'control': ('normal', theta_ctrl_rms / sqrt(2)),
+    'jitter': ('sinusoid', jitter_peak),
+}
+
+batch = 10**6 # Samples per vectorised batch
+max_samples = 10**8
+min_samples = 10**6
+tolerance = 2e-3 # Target half width of the P99.7 margin confidence interval [deg]
+confidence = 0.99
+bin_width = 1e-5 # Quantile resolution [deg]
+
+def sample_source(kind, param, rng, n):
+    """
+    Rotation vectors (3, n) [rad] of one error source.
+    """
+    if kind == 'normal':
+        scale = np.radians(np.broadcast_to(param, 3))[:, None]
+        return scale * rng.standard_normal((3, n))
+    if kind == 'uniform':
+        scale = np.radians(np.broadcast_to(param, 3))[:, None]
+        return scale * rng.uniform(-1, 1, (3, n))
+    if kind == 'sinusoid':
+        amplitude = radians(param) * np.sin(rng.uniform(0, 2*pi, n))
+        axis = rng.uniform(0, 2*pi, n)
+        return np.stack([amplitude*np.cos(axis), amplitude*np.sin(axis), np.zeros(n)])
+    raise ValueError(f"Unknown error distribution {kind!r}")
+
+def rotvec_to_quat(v):
+    """
+    Scalar-first quaternions (4, n) of rotation vectors (3, n) [rad].
+    """
+    angle = np.sqrt(np.sum(v*v, axis=0))
+    # sin(angle/2)/angle without the 0/0 at zero rotation
+    return np.concatenate([np.cos(angle/2)[None], 0.5*np.sinc(angle/(2*pi)) * v])
+
+def quat_multiply(p, q):
+    """
+    Hamilton product p*q of scalar-first quaternions (4, n): rotation q, then p.
+    """
+    return np.stack([
+        p[0]*q[0] - p[1]*q[1] - p[2]*q[2] - p[3]*q[3],
+        p[0]*q[1] + p[1]*q[0] + p[2]*q[3] - p[3]*q[2],
+        p[0]*q[2] - p[1]*q[3] + p[2]*q[0] + p[3]*q[1],
+        p[0]*q[3] + p[1]*q[2] - p[2]*q[1] + p[3]*q[0],
+    ])
+
+def pointing_error(sources, rng, n):
+    """
+    Pointing error [deg] of n samples of the composed error sources.
+    """
+    q = None
+    for kind, param in sources.values():
+        dq = rotvec_to_quat(sample_source(kind, param, rng, n))
+        q = dq if q is None else quat_multiply(dq, q)
+    # Boresight z after the rotation: z.R(q)z = 1 - 2(q1^2 + q2^2) = cos(angle)
+    return np.degrees(2*np.arcsin(np.minimum(np.sqrt(q[1]**2 + q[2]**2), 1)))
+
+class StreamingStats:
+    """
+    RMS, maximum and quantiles of a stream of non-negative samples in constant
+    memory. Quantiles come from a histogram of fixed bin width (their
+    resolution); samples beyond the last bin are counted as overflow.
+    Parameters:
+        bin_width (float): Histogram bin width
+        upper (float): Top of the histogram
+    """
+
+    def __init__(self, bin_width, upper):
+        self.bin_width = bin_width
+        self.counts = np.zeros(int(ceil(upper / bin_width)) + 1, dtype=np.int64)
+        self.n = 0
+        self.sum_sq = 0.0
+        self.max = 0.0
+
+    def update(self, x):
+        bins = np.minimum((x / self.bin_width).astype(np.int64), len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.n += len(x)
+        self.sum_sq += float(np.dot(x, x))
+        self.max = max(self.max, float(x.max()))
+
+    @property
+    def rms(self):
+        return sqrt(self.sum_sq / self.n)
+
+    def quantile(self, p):
+        """
+        Quantile p (scalar or array), linearly interpolated inside its bin.
+        Returns inf for quantiles in the overflow bin.
+        """
+        p = np.clip(p, 0, 1)
+        cumulative = np.cumsum(self.counts)
+        rank = p * self.n
+        i = np.minimum(np.searchsorted(cumulative, rank), len(self.counts) - 1)
+        below = np.where(i > 0, cumulative[np.maximum(i - 1, 0)], 0)
+        frac = np.where(self.counts[i] > 0, (rank - below) / np.maximum(self.counts[i], 1), 0)
+        value = (i + frac) * self.bin_width
+        return np.where(i == len(self.counts) - 1, np.inf, value)
+
+    def quantile_interval(self, p, confidence):
+        """
+        Distribution-free confidence interval of quantile p from the binomial
+        distribution of the order statistics (normal approximation).
+        """
+        from scipy.stats import norm # Deferred, scipy is slow to import
+        half = norm.ppf(0.5 + confidence/2) * sqrt(p*(1 - p)/self.n)
+        return self.quantile(p - half), self.quantile(p + half)
+
+def run_budget(sources=SOURCES, theta_required=theta_required, batch=batch, max_samples=max_samples,
+               min_samples=min_samples, tolerance=tolerance, confidence=confidence, bin_width=bin_width,
+               seed=0):
+    """
+    Sample the pointing error until the P99.7 margin is known to within tolerance.
+    Returns:
+        dict: 'n', 'rms', 'p95', 'p997', 'max', 'p997_interval', 'margin' (theta_required - P99.7)
+            and 'margin_interval' [deg], 'converged'
+    """
+    rng = np.random.default_rng(seed)
+    stats = StreamingStats(bin_width, 20*theta_required)
+    converged = False
+    while stats.n < max_samples:
+        stats.update(pointing_error(sources, rng, min(batch, max_samples - stats.n)))
+        lo, hi = stats.quantile_interval(0.997, confidence)
+        if stats.n >= min_samples and (hi - lo)/2 <= tolerance:
+            converged = True
+            break
+
+    p95, p997 = stats.quantile([0.95, 0.997])
+    return {
+        'n': stats.n,
+        'rms': stats.rms,
+        'p95': float(p95),
+        'p997': float(p997),
+        'max': stats.max,
+        'p997_interval': (float(lo), float(hi)),
+        'margin': theta_required - float(p997),
+        'margin_interval': (theta_required - float(hi), theta_required - float(lo)),
+        'converged': converged,
+    }
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Monte Carlo pointing error budget")
+    parser.add_argument("--max-samples", type=float, default=max_samples)
+    parser.add_argument("--tolerance", type=float, default=tolerance,
+                        help="Stop once the P99.7 margin is known to +- this [deg]")
+    parser.add_argument("--confidence", type=float, default=confidence)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = run_budget(max_samples=int(args.max_samples), tolerance=args.tolerance,
+                        confidence=args.confidence, seed=args.seed)
+    elapsed = time.perf_counter() - start
+
+    print("---------------MONTE CARLO POINTING ERROR BUDGET------------")
+    for name, (kind, param) in SOURCES.items():
+        print(f"{name.capitalize()}: {kind} {param:.4g} deg")
+    print(f"Samples: {result['n']:.3g} in {elapsed:.1f} s"
+          f" ({'converged' if result['converged'] else 'sample limit reached'})")
+    print("Total Pointing Error (RMS):", round(result['rms'], 4), "deg")
+    print("Total Pointing Error (P95):", round(result['p95'], 4), "deg")
+    print("Total Pointing Error (P99.7):", round(result['p997'], 4), "deg")
+    print("Pointing Error Requirement:", theta_required, "deg")
+    lo, hi = result['margin_interval']
+    print(f"P99.7 Margin: {result['margin']:.4f} deg "
+          f"({args.confidence*100:g}% interval {lo:.4f} to {hi:.4f} deg)")
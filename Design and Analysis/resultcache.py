@@ -0,0 +1,211 @@
+"""
+Content-addressed on-disk cache for analysis results.
+
+Results are stored as .npz files named after a SHA-256 hash of the model
+inputs and the model code version, so a rerun only recomputes what actually
+changed. Large lookup tables are stored as plain .npy files instead, so they
+can be memory-mapped rather than read in full. The cache directory is trimmed
+to a maximum size by evicting the least recently used entries.
+"""
+
+import hashlib
+import inspect
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import instrument
+
+CACHE_DIR = os.environ.get(
+    'ADCS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+MAX_CACHE_BYTES = 512 * 1024**2   # Cache size limit before eviction [bytes]
+
+
+def code_version(*funcs):
+    """
+    Hash of the source code of the functions that produce a result.
+    Editing any of them invalidates the cached results, while editing
+    unrelated parts of a script (e.g. the plotting) does not.
+    """
+    h = hashlib.sha256()
+    for func in funcs:
+        h.update(inspect.getsource(func).encode())
+    return h.hexdigest()
+
+
+def _update(h, obj):
+    # Feed a canonical, type-tagged encoding of obj to the hash
+    if isinstance(obj, dict):
+        h.update(b'd%d' % len(obj))
+        for key in sorted(obj, key=str):
+            _update(h, str(key))
+            _update(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'l%d' % len(obj))
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, np.ndarray):
+        h.update(f'a{obj.dtype.str}{obj.shape}'.encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (bool, int, float, str, type(None), np.generic)):
+        if isinstance(obj, np.generic):
+            obj = obj.item()
+        h.update(f'{type(obj).__name__}:{obj!r};'.encode())
+    else:
+        raise TypeError(f"Cannot hash model input of type {type(obj).__name__}")
+
+
+class ResultCache:
+    """
+    Persistent cache of dicts of arrays, keyed by model inputs.
+    Parameters:
+        directory (str): Where the .npz files live, default CACHE_DIR
+        max_bytes (int): Size limit of the directory, oldest entries are evicted beyond it
+        enabled (bool): False turns every lookup into a miss and skips writes
+    """
+
+    def __init__(self, directory=None, max_bytes=MAX_CACHE_BYTES, enabled=True):
+        self.directory = directory or CACHE_DIR
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    def key(self, *inputs):
+        """
+        Content hash of the model inputs (nested dicts, lists, arrays and scalars).
+        Include the code_version() of the model among the inputs.
+        """
+        h = hashlib.sha256()
+        _update(h, inputs)
+        return h.hexdigest()
+
+    def _path(self, key, suffix='.npz'):
+        return os.path.join(self.directory, key + suffix)
+
+    def load(self, key):
+        """
+        Returns:
+            dict: Stored arrays (0-d arrays as Python scalars), or None on a miss
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                result = {name: data[name] for name in data.files}
+            os.utime(path)  # Mark as recently used for eviction
+        except (OSError, ValueError):
+            instrument.count('resultcache.misses')
+            return None
+        instrument.count('resultcache.hits')
+        return {name: value.item() if value.ndim == 0 else value for name, value in result.items()}
+
+    def save(self, key, result):
+        """
+        Store a dict of arrays and scalars under key.
+        """
+        if not self.enabled:
+            return
+        self._write(self._path(key), lambda f: np.savez_compressed(f, **result))
+
+    def _write(self, path, write):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so concurrent workers never read a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def get(self, inputs, compute):
+        """
+        Return the cached result for inputs, computing and storing it on a miss.
+        Parameters:
+            inputs (tuple): Everything the result depends on, see key()
+            compute (callable): Called without arguments on a miss, returns a dict of arrays
+        """
+        key = self.key(*inputs)
+        result = self.load(key)
+        if result is None:
+            with instrument.timer('resultcache.compute'):
+                result = compute()
+            self.save(key, result)
+        return result
+
+    def get_mmap(self, inputs, compute):
+        """
+        Like get() for a single large array, returned as a read-only memory map
+        of an uncompressed .npy file. With the cache disabled the array is
+        computed and returned in memory.
+        Parameters:
+            inputs (tuple): Everything the array depends on, see key()
+            compute (callable): Called without arguments on a miss, returns an ndarray
+        """
+        if not self.enabled:
+            return compute()
+        path = self._path(self.key(*inputs), '.npy')
+        try:
+            table = np.load(path, mmap_mode='r', allow_pickle=False)
+            os.utime(path)  # Mark as recently used for eviction
+            instrument.count('resultcache.hits')
+            return table
+        except (OSError, ValueError):
+            instrument.count('resultcache.misses')
+        with instrument.timer('resultcache.compute'):
+            table = np.asarray(compute())
+        self._write(path, lambda f: np.save(f, table, allow_pickle=False))
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+
+    def evict(self):
+        """
+        Delete least recently used entries until the directory fits in max_bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.npz', '.npy')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Delete every cached result.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def add_cache_arguments(parser):
+    """
+    Add the --no-cache and --clear-cache flags shared by the analysis scripts.
+    """
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Recompute everything without reading or writing the result cache")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help=f"Delete the result cache ({CACHE_DIR}) before running")
+
+
+def cache_from_args(args):
+    """
+    Build the ResultCache selected by add_cache_arguments() flags.
+    """
+    cache = ResultCache(enabled=not args.no_cache)
+    if args.clear_cache:
+        cache.clear()
+    return cache
@@ -0,0 +1,274 @@
+"""
+Reaction-wheel slew trade space.
+
+Vectorised version of RWSSizing.py. RWSSizing.py evaluates one rest-to-rest
+slew with an accelerate / coast / decelerate rate profile. Here whole grids
+are evaluated at once:
+    maneuver time x slew angle x coast rate x inertia x wheel configuration x slew axis
+
+The kinematics (coast time and angular acceleration) only depend on
+(slew angle, maneuver time, coast rate). Inertia, wheel configuration and slew
+axis only scale the body torque and momentum into the load on the most loaded
+wheel. The profile is therefore computed once on the (angle, time, rate) grid.
+The limits are then checked for each scale factor, in chunks of cases.
+
+A case is infeasible when:
+    coast:    the coast time is negative or not shorter than the maneuver
+              (coast rate outside theta/t < w <= 2 theta/t)
+    torque:   the most loaded wheel needs more than its torque capacity
+    momentum: the most loaded wheel saturates during the coast
+For every (configuration, axis, inertia, angle, time) the feasible coast rates
+form one interval, returned as the feasible envelope.
+"""
+
+import argparse
+import time
+from math import *
+
+import numpy as np
+
+import RWSSizing
+
+# Wheel, SimulationModel_v3.0/CubeSat_Params.m and RWSSizing.py
+Js = 9e-6 # Reaction wheel inertia about its spin axis [kg*m^2]
+H_capacity_mNms = RWSSizing.H_capacity_mNms # Wheel momentum capacity [mNms]
+tau_capacity_mNm = 1.0 # Wheel torque capacity [mNm], assumed value (no wheel datasheet in the repo)
+
+def tetrahedral(B=radians(30)):
+    """
+    Wheel axes (3, 4) of the tetrahedral configuration in CubeSat_Params.m.
+    Parameters:
+        B (float): Angle of the wheel axes from the body z axis [rad]
+    """
+    return np.array([[sin(B), 0, -sin(B), 0],
+                     [0, sin(B), 0, -sin(B)],
+                     [cos(B), cos(B), cos(B), cos(B)]])
+
+# Wheel configurations: columns are the wheel spin axes in body frame
+WHEEL_CONFIGS = {
+    '3-axis': np.eye(3),
+    'tetrahedral': tetrahedral(),
+}
+
+AXES = {'x': (1, 0, 0), 'y': (0, 1, 0), 'z': (0, 0, 1)}
+
+def load_factor(A, axes):
+    """
+    Load on the most loaded wheel per unit body torque (or momentum) about
+    each slew axis. The body demand is split over the wheels with the
+    pseudo-inverse of A (minimum-norm distribution).
+    Parameters:
+        A (array_like): (3, n_wheels) wheel spin axes in body frame
+        axes (array_like): (n_axes, 3) slew axes, normalised here
+    Returns:
+        ndarray: (n_axes,) max |pinv(A) e|
+    """
+    axes = np.atleast_2d(np.asarray(axes, dtype=float))
+    axes = axes / np.linalg.norm(axes, axis=-1, keepdims=True)
+    return np.max(np.abs(axes @ np.linalg.pinv(A).T), axis=-1)
+
+def slew_profile(t_maneuver, theta_deg, w_maneuver, J=RWSSizing.Jy):
+    """
+    The RWSSizing.py quantities for broadcastable arrays of cases.
+    Parameters:
+        t_maneuver (array_like): Total maneuver time [s]
+        theta_deg (array_like): Slew angle [deg]
+        w_maneuver (array_like): Coast angular rate [deg/s]
+        J (array_like): Moment of inertia about the slew axis [kg*m^2]
+    Returns:
+        dict: 't_coast' [s], 'alpha_deg' [deg/s^2], 'torque' [Nm], 'H' [Nms] (body),
+            'feasible' (coast time within 0 <= t_coast < t_maneuver)
+    """
+    t = np.asarray(t_maneuver, dtype=float)
+    w = np.asarray(w_maneuver, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # A zero coast rate never finishes the slew: t_coast is inf (nan for a zero slew), infeasible
+        t_coast = 2 * np.asarray(theta_deg, dtype=float) / w - t
+        feasible = (t_coast >= 0) & (t_coast < t)
+        alpha_deg = np.where(feasible, 4 * np.asarray(theta_deg) / (t**2 - t_coast**2), np.nan)
+    return {
+        't_coast': t_coast,
+        'alpha_deg': alpha_deg,
+        'torque': J * np.radians(alpha_deg),
+        'H': J * np.radians(w),
+        'feasible': feasible,
+    }
+
+def _first_true(mask, values):
+    """
+    values at the first and last True along the last axis of mask, nan where none.
+    """
+    n = mask.shape[-1]
+    has = mask.any(axis=-1)
+    first = mask.argmax(axis=-1)
+    last = n - 1 - mask[..., ::-1].argmax(axis=-1)
+    return np.where(has, values[first], np.nan), np.where(has, values[last], np.nan), first, has
+
+def trade_space(t_maneuver, theta_deg, w_maneuver, J, configs=WHEEL_CONFIGS, axes=(AXES['y'],),
+                H_capacity_mNms=H_capacity_mNms, tau_capacity_mNm=tau_capacity_mNm, Js=Js,
+                chunk=2**24, keep_mask=False):
+    """
+    Evaluate every combination of the grid axes and return the feasible envelope.
+    Parameters:
+        t_maneuver (array_like): Maneuver times [s]
+        theta_deg (array_like): Slew angles [deg]
+        w_maneuver (array_like): Coast rates [deg/s]
+        J (array_like): Moments of inertia about the slew axis [kg*m^2]
+        configs (dict): name -> (3, n_wheels) wheel axes
+        axes (array_like): (n_axes, 3) slew axes in body frame
+        H_capacity_mNms (float): Wheel momentum capacity [mNms]
+        tau_capacity_mNm (float): Wheel torque capacity [mNm]
+        Js (float): Wheel inertia, for the wheel speed [kg*m^2]
+        chunk (int): Cases evaluated at once, bounds the temporary memory
+        keep_mask (bool): Also return the full feasibility mask (one byte per case)
+    Returns:
+        dict: Grid ('configs', 'axes', 'J', 'theta_deg', 't_maneuver', 'w_maneuver', each
+            sorted), counts 'n_cases', 'n_feasible', 'rejected' {'coast', 'torque',
+            'momentum'} (a case over both limits counts under both), and the envelope,
+            indexed [config, axis, J, theta]:
+                'min_time' shortest feasible maneuver [s],
+                'rate_at_min_time' lowest feasible coast rate at that time [deg/s],
+                'wheel_torque_mNm', 'wheel_H_mNms', 'wheel_speed_rpm' on the most
+                loaded wheel for that case,
+            and indexed [config, axis, J, theta, t_maneuver]:
+                'rate_min', 'rate_max' band of feasible coast rates [deg/s],
+            all nan where nothing is feasible, plus 'feasible'
+            [config, axis, J, theta, t_maneuver, w_maneuver] with keep_mask
+    """
+    t = np.unique(np.asarray(t_maneuver, dtype=float))
+    theta = np.unique(np.asarray(theta_deg, dtype=float))
+    w = np.unique(np.asarray(w_maneuver, dtype=float))
+    J = np.unique(np.asarray(J, dtype=float))
+    axes = np.atleast_2d(np.asarray(axes, dtype=float))
+    names = list(configs)
+
+    # Kinematics on the (theta, t, w) grid, shared by every scale factor
+    profile = slew_profile(t[None, :, None], theta[:, None, None], w[None, None, :], 1.0)
+    coast_ok = profile['feasible']
+    alpha = np.where(coast_ok, np.radians(profile['alpha_deg']), np.inf) # [rad/s^2]
+    w_rad = np.radians(w)
+
+    # Most loaded wheel per unit body demand: scale = J * load factor
+    load = np.array([load_factor(configs[name], axes) for name in names]) # (n_configs, n_axes)
+    scale = (load[:, :, None] * J).ravel()
+    tau_limit = tau_capacity_mNm * 1e-3 / scale # Largest alpha per scale [rad/s^2]
+    H_limit = H_capacity_mNms * 1e-3 / scale # Largest coast rate per scale [rad/s]
+
+    n_profile = coast_ok.size
+    n_s = len(scale)
+    min_time = np.full((n_s, len(theta)), np.nan)
+    rate_at_min = np.full((n_s, len(theta)), np.nan)
+    rate_min = np.full((n_s, len(theta), len(t)), np.nan)
+    rate_max = np.full((n_s, len(theta), len(t)), np.nan)
+    mask = np.empty((n_s,) + coast_ok.shape, dtype=bool) if keep_mask else None
+    n_feasible = 0
+    over_torque = 0
+    over_momentum = 0
+
+    step = max(chunk // n_profile, 1)
+    for lo in range(0, n_s, step):
+        s = slice(lo, min(lo + step, n_s))
+        torque_ok = alpha <= tau_limit[s, None, None, None]
+        momentum_ok = w_rad <= H_limit[s, None, None, None]
+        over_torque += int(np.count_nonzero(coast_ok & ~torque_ok))
+        over_momentum += int(np.count_nonzero(coast_ok & ~momentum_ok))
+        feasible = torque_ok
+        feasible &= momentum_ok
+        feasible &= coast_ok
+        n_feasible += int(np.count_nonzero(feasible))
+        if keep_mask:
+            mask[s] = feasible
+
+        # Feasible coast-rate band per maneuver time, then the shortest time
+        rate_min[s], rate_max[s], _, has_rate = _first_true(feasible, w)
+        min_time[s], _, first_t, _ = _first_true(has_rate, t)
+        at_min = np.take_along_axis(rate_min[s], first_t[..., None], axis=-1)[..., 0]
+        rate_at_min[s] = np.where(np.isnan(min_time[s]), np.nan, at_min)
+
+    # Wheel loads at the shortest maneuver (rate_at_min_time is nan when infeasible)
+    with np.errstate(invalid='ignore'):
+        profile = slew_profile(min_time, theta, rate_at_min, scale[:, None])
+    wheel_H = profile['H'] * 1e3
+
+    shape = (len(names), len(axes), len(J))
+    n_cases = n_s * n_profile
+    result = {
+        'configs': names,
+        'axes': axes,
+        'J': J,
+        'theta_deg': theta,
+        't_maneuver': t,
+        'w_maneuver': w,
+        'n_cases': n_cases,
+        'n_feasible': n_feasible,
+        'rejected': {
+            'coast': n_s * int(np.count_nonzero(~coast_ok)),
+            'torque': over_torque,
+            'momentum': over_momentum,
+        },
+        'min_time': min_time.reshape(shape + (len(theta),)),
+        'rate_at_min_time': rate_at_min.reshape(shape + (len(theta),)),
+        'wheel_torque_mNm': (profile['torque'] * 1e3).reshape(shape + (len(theta),)),
+        'wheel_H_mNms': wheel_H.reshape(shape + (len(theta),)),
+        'wheel_speed_rpm': (wheel_H * 1e-3 / Js * 30/pi).reshape(shape + (len(theta),)),
+        'rate_min': rate_min.reshape(shape + (len(theta), len(t))),
+        'rate_max': rate_max.reshape(shape + (len(theta), len(t))),
+    }
+    if keep_mask:
+        result['feasible'] = mask.reshape(shape + coast_ok.shape)
+    return result
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Reaction-wheel slew trade space")
+    parser.add_argument("--t-maneuver", type=float, nargs=3, default=[5, 120, 1], metavar=("START", "STOP", "STEP"),
+                        help="Maneuver time grid [s]")
+    parser.add_argument("--theta", type=float, nargs=3, default=[5, 180, 5], metavar=("START", "STOP", "STEP"),
+                        help="Slew angle grid [deg]")
+    parser.add_argument("--w-maneuver", type=float, nargs=3, default=[0.1, 12, 0.05], metavar=("START", "STOP", "STEP"),
+                        help="Coast rate grid [deg/s]")
+    parser.add_argument("--J", type=float, nargs="+", default=[0.0075, 0.015, 0.03, 0.035, 0.05],
+                        help="Inertias about the slew axis [kg*m^2]")
+    parser.add_argument("--axes", nargs="+", choices=sorted(AXES), default=["x", "y", "z"], help="Slew axes")
+    parser.add_argument("--tau-capacity", type=float, default=tau_capacity_mNm, help="Wheel torque capacity [mNm]")
+    parser.add_argument("--H-capacity", type=float, default=H_capacity_mNms, help="Wheel momentum capacity [mNms]")
+    args = parser.parse_args()
+
+    def grid(start, stop, step):
+        return np.arange(start, stop + step/2, step)
+
+    start = time.perf_counter()
+    result = trade_space(grid(*args.t_maneuver), grid(*args.theta), grid(*args.w_maneuver), args.J,
+                         axes=[AXES[a] for a in args.axes], H_capacity_mNms=args.H_capacity,
+                         tau_capacity_mNm=args.tau_capacity)
+    elapsed = time.perf_counter() - start
+
+    n = result['n_cases']
+    print("---------------REACTION WHEEL SLEW TRADE SPACE------------")
+    print(f"Wheel limits: {args.tau_capacity:g} mNm, {args.H_capacity:g} mNms")
+    print(f"{n:.3g} cases in {elapsed:.2f} s, {result['n_feasible']/n*100:.2f} % feasible")
+    for reason, count in result['rejected'].items():
+        print(f"  {reason.capitalize()} limit: {count/n*100:.2f} % of cases")
+
+    # The RWSSizing.py case on each configuration
+    for name, A in WHEEL_CONFIGS.items():
+        L = load_factor(A, AXES['y'])[0]
+        case = slew_profile(RWSSizing.t_maneuver, RWSSizing.theta_deg, RWSSizing.w_maneuver, RWSSizing.Jy * L)
+        ok = case['feasible'] and case['torque']*1e3 <= args.tau_capacity and case['H']*1e3 <= args.H_capacity
+        print(f"RWSSizing.py case, {name}: wheel torque {case['torque']*1e3:.2f} mNm, "
+              f"momentum {case['H']*1e3:.3f} mNms, {'feasible' if ok else 'infeasible'}")
+
+    # Feasible envelope: shortest slew per configuration and axis
+    theta = result['theta_deg']
+    shown = [k for k in (30, 90, 180) if k in theta]
+    for j, J in enumerate(result['J']):
+        print(f"Shortest maneuver [s] (coast rate [deg/s]), J = {J:g} kg*m^2:")
+        for c, name in enumerate(result['configs']):
+            for a, axis in enumerate(args.axes):
+                cells = []
+                for angle in shown:
+                    k = np.searchsorted(theta, angle)
+                    t_min = result['min_time'][c, a, j, k]
+                    w_min = result['rate_at_min_time'][c, a, j, k]
+                    cells.append(f"{angle:g} deg: " + ("none" if isnan(t_min) else f"{t_min:g} ({w_min:.2f})"))
+                print(f"  {name:>11} {axis}: " + ", ".join(cells))
@@ -0,0 +1,185 @@
+"""
+Multi-rate, event-driven simulation scheduler.
+
+Components run as tasks on a priority event queue (heapq) instead of all
+stepping at one global dt: periodic tasks at their own rate and one-shot events
+at any instant. Continuous dynamics are registered separately and are only
+advanced, by their own step rules, up to the events that need them. Tasks that
+only read the state (sensor sampling, say) can be scheduled with advance=False
+and query the dynamics themselves, so a fast sensor does not force the dynamics
+onto its rate. Tasks due at the same instant run in order of priority (lower
+first), then in the order they were scheduled.
+
+Times are kept as integer multiples of a resolution (1 ns by default), so
+periodic tasks of different rates land on exactly the same instants (a 100 Hz
+and a 1 Hz task meet every second) and periods do not drift.
+"""
+
+import itertools
+from heapq import heappop, heappush
+from math import *
+
+import instrument
+
+resolution = 1e-9 # Time resolution [s]
+
+class Task:
+    """
+    A scheduled callback, callback(t). Returned by Scheduler.every()/at().
+    Parameters:
+        callback (callable): Called with the event time [s]
+        period (int): Period in resolution ticks, None for a one-shot event
+        start (int): First event in resolution ticks
+        priority (int): Order among tasks due at the same instant, lower first
+        name (str): Label for the statistics
+        advance (bool): Advance the continuous dynamics to the event time first
+    """
+
+    def __init__(self, callback, period, start, priority=0, name=None, advance=True):
+        self.callback = callback
+        self.period = period
+        self.start = start
+        self.priority = priority
+        self.name = name or getattr(callback, '__name__', 'task')
+        self.advance = advance
+        self.n = 0 # Events run
+        self.active = True
+
+    def cancel(self):
+        """
+        Drop the pending and all later events of the task.
+        """
+        self.active = False
+
+    def _next(self):
+        # Ticks of the next event, no accumulated rounding for periodic tasks
+        return self.start + self.n * (self.period or 0)
+
+class Scheduler:
+    """
+    Priority event queue with lazily advanced continuous dynamics.
+    Parameters:
+        t0 (float): Start time [s]
+        resolution (float): Time resolution [s]
+    """
+
+    def __init__(self, t0=0.0, resolution=resolution):
+        self.resolution = resolution
+        self._ticks = self._to_ticks(t0) # Time the continuous dynamics are at
+        self._now = self._ticks # Time of the current event
+        self._queue = []
+        self._seq = itertools.count()
+        self._continuous = []
+        self._stopped = False
+        self._counts = {}
+
+    def _to_ticks(self, t):
+        return int(round(t / self.resolution))
+
+    @property
+    def t(self):
+        """
+        Current simulation time [s].
+        """
+        return self._now * self.resolution
+
+    def _push(self, task):
+        heappush(self._queue, (task._next(), task.priority, next(self._seq), task))
+
+    def every(self, period, callback, offset=None, priority=0, name=None, advance=True):
+        """
+        Run callback(t) every period [s], first at offset [s] (default now).
+        With advance=False the continuous dynamics are not advanced to the
+        event; the callback must not change their inputs.
+        Returns:
+            Task
+        """
+        period = self._to_ticks(period)
+        if period <= 0:
+            raise ValueError("The period must be at least the time resolution")
+        start = self._now if offset is None else self._to_ticks(offset)
+        task = Task(callback, period, start, priority, name, advance)
+        self._push(task)
+        return task
+
+    def at(self, t, callback, priority=0, name=None, advance=True):
+        """
+        Run callback(t) once at time t [s], not before the current time.
+        Returns:
+            Task
+        """
+        task = Task(callback, None, max(self._to_ticks(t), self._now), priority, name, advance)
+        self._push(task)
+        return task
+
+    def after(self, delay, callback, priority=0, name=None, advance=True):
+        """
+        Run callback(t) once, delay [s] from now.
+        """
+        return self.at(self.t + delay, callback, priority, name, advance)
+
+    def add_continuous(self, advance):
+        """
+        Register continuous dynamics, advance(t0, t1) integrates them from t0 to
+        t1 [s] with whatever steps they need. They are advanced up to each event
+        before it runs, in the order they were added.
+        """
+        self._continuous.append(advance)
+
+    def stop(self):
+        """
+        End run() after the current event.
+        """
+        self._stopped = True
+
+    def _advance(self, ticks):
+        if ticks > self._ticks:
+            t0, t1 = self._ticks * self.resolution, ticks * self.resolution
+            for advance in self._continuous:
+                advance(t0, t1)
+            self._ticks = ticks
+
+    def run(self, t_end):
+        """
+        Run the events due up to t_end [s] (inclusive), then advance the
+        continuous dynamics to t_end unless stop() was called.
+        Returns:
+            float: Time reached [s]
+        """
+        end = self._to_ticks(t_end)
+        self._stopped = False
+        recorder = instrument.active()
+        while self._queue and not self._stopped:
+            ticks, _, _, task = self._queue[0]
+            if ticks > end:
+                break
+            heappop(self._queue)
+            if not task.active:
+                continue
+            self._now = ticks
+            if task.advance:
+                if recorder is None:
+                    self._advance(ticks)
+                else:
+                    with recorder.timer('scheduler.advance'):
+                        self._advance(ticks)
+            task.n += 1
+            self._counts[task.name] = self._counts.get(task.name, 0) + 1
+            if recorder is None:
+                task.callback(self.t)
+            else:
+                with recorder.timer(f'task.{task.name}'):
+                    task.callback(self.t)
+            if task.period is not None and task.active:
+                self._push(task)
+        if not self._stopped:
+            self._now = max(self._now, end)
+            self._advance(end)
+        return self.t
+
+    def stats(self):
+        """
+        Returns:
+            dict: Events run per task name
+        """
+        return dict(self._counts)
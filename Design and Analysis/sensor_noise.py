@@ -0,0 +1,202 @@
+"""
+Chunked synthetic gyro and magnetometer streams.
+
+Python counterpart of the gyro_model.slx noise model (Sensors/gyro_params.m),
+extended to the magnetometer. Each sample is
+    truth + static bias + bias random walk + bias instability + white noise
+then saturated and quantised to sensor counts.
+
+Samples are produced in fixed-size chunks. White noise and the path of the
+bias processes inside a chunk come from an RNG stream of their own, seeded by
+(seed, chunk index); the bias values at the chunk boundaries come from a
+separate stream that costs one draw per chunk. Each chunk then fills in its
+bias path as a bridge between its two boundary values, which is exact in
+distribution. Any chunk can therefore be generated on its own, in any order
+or in parallel, and the stream does not depend on how it is consumed.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from math import *
+
+import numpy as np
+
+chunk = 2**16 # Samples per chunk
+
+class SensorModel:
+    """
+    Noise and output stage of a 3-axis sensor.
+    Parameters:
+        full_scale (float): Measurement range +-full_scale [unit]
+        sensitivity (float): [LSB/unit]
+        noise_density (float): White noise density [unit/sqrt(Hz)], sample sigma is noise_density*sqrt(rate)
+        static_bias (float): Constant bias, drawn per axis in +-static_bias [unit]
+        bias_random_walk (float): Bias random walk density [unit/sqrt(s)]
+        bias_instability (float): Std of the correlated (Gauss-Markov) bias [unit]
+        correlation_time (float): Correlation time of that bias [s]
+        update_rate (float): Output data rate [Hz]
+    """
+
+    def __init__(self, full_scale, sensitivity, noise_density, static_bias=0.0, bias_random_walk=0.0,
+                 bias_instability=0.0, correlation_time=100.0, update_rate=100):
+        self.full_scale = full_scale
+        self.sensitivity = sensitivity
+        self.noise_density = noise_density
+        self.static_bias = static_bias
+        self.bias_random_walk = bias_random_walk
+        self.bias_instability = bias_instability
+        self.correlation_time = correlation_time
+        self.update_rate = update_rate
+        self.sat_limit = full_scale * sensitivity # [LSB]
+
+# Sensors/gyro_params.m (BMI270) [deg/s]; the bias processes are not in the
+# datasheet parameters and are assumed values
+GYRO = SensorModel(full_scale=250, sensitivity=2**15/250, noise_density=0.005, static_bias=0.1,
+                   bias_random_walk=1e-5, bias_instability=2/3600, correlation_time=100, update_rate=100)
+
+# IIS2MDC typical figures [uT]: +-49.152 gauss, 1.5 mgauss/LSB, 3 mgauss RMS
+# noise at 100 Hz; the residual hard-iron bias and its drift are assumed values
+MAGNETOMETER = SensorModel(full_scale=4915.2, sensitivity=1/0.15, noise_density=0.3/sqrt(100),
+                           static_bias=1.0, bias_random_walk=1e-4, bias_instability=0.05,
+                           correlation_time=1000, update_rate=100)
+
+SENSORS = {'gyro': GYRO, 'mag': MAGNETOMETER}
+
+def _rng(seed, *key):
+    # Independent, reproducible stream for (seed, key)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+_BOUNDARY, _CHUNK, _STATIC = 0, 1, 2 # Stream keys
+
+class _Boundaries:
+    """
+    Bias random walk and Gauss-Markov values at the chunk starts, drawn
+    sequentially (one draw per chunk) and extended as needed.
+    """
+
+    def __init__(self, model, seed, chunk):
+        self.model = model
+        T = chunk / model.update_rate
+        self.walk_sigma = model.bias_random_walk * sqrt(T)
+        self.phi = exp(-T / model.correlation_time)
+        self.markov_sigma = model.bias_instability * sqrt(1 - self.phi**2)
+        self._rng = _rng(seed, _BOUNDARY)
+        # Stationary start for the Gauss-Markov bias, zero for the random walk
+        self.walk = [np.zeros(3)]
+        self.markov = [self._rng.normal(0, model.bias_instability, 3)]
+
+    def __call__(self, c):
+        while len(self.walk) <= c + 1:
+            step = self._rng.normal(size=(2, 3))
+            self.walk.append(self.walk[-1] + self.walk_sigma*step[0])
+            self.markov.append(self.phi*self.markov[-1] + self.markov_sigma*step[1])
+        return self.walk[c], self.walk[c + 1], self.markov[c], self.markov[c + 1]
+
+def static_bias(model, seed):
+    """
+    Per-axis constant bias of the sensor instance [unit].
+    """
+    return _rng(seed, _STATIC).uniform(-model.static_bias, model.static_bias, 3)
+
+def _bias_paths(model, rng, chunk, w0, w1, x0, x1):
+    """
+    Random walk and Gauss-Markov bias over one chunk, bridged between the
+    boundary values: (chunk, 3) each, at samples 0..chunk-1 (chunk is the next start).
+    """
+    dt = 1 / model.update_rate
+    j = np.arange(1, chunk + 1)[:, None]
+
+    # Brownian bridge: free path from w0, corrected linearly to end at w1
+    walk = w0 + np.cumsum(rng.normal(0, model.bias_random_walk*sqrt(dt), (chunk, 3)), axis=0)
+    walk += (w1 - walk[-1]) * j / chunk
+
+    # Gauss-Markov (AR(1)) bridge: free path from x0, corrected by the
+    # regression of each sample on the end value, Cov(x_j, x_K)/Var(x_K)
+    phi = exp(-dt / model.correlation_time)
+    noise = rng.normal(0, model.bias_instability*sqrt(1 - phi**2), (chunk, 3))
+    from scipy.signal import lfilter # Deferred, scipy is slow to import
+    markov = lfilter([1], [1, -phi], noise, axis=0, zi=phi*x0[None, :])[0]
+    K = chunk
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gain = phi**(K - j) * (1 - phi**(2*j)) / (1 - phi**(2*K))
+    markov += (x1 - markov[-1]) * np.nan_to_num(gain)
+
+    # Shift to samples 0..K-1: the boundary value, then the bridge up to K-1
+    walk = np.concatenate([w0[None, :], walk[:-1]])
+    markov = np.concatenate([x0[None, :], markov[:-1]])
+    return walk, markov
+
+def generate_chunk(model, c, truth=None, seed=0, chunk=chunk, bounds=None, raw=False):
+    """
+    Chunk c of the stream, independently of the other chunks.
+    Parameters:
+        model (SensorModel): Sensor
+        c (int): Chunk index, samples c*chunk .. (c+1)*chunk - 1
+        truth (callable): truth(t) giving the (k, 3) true value at times t [s], None for zero
+        seed (int): Seed of the sensor instance
+        chunk (int): Samples per chunk
+        bounds (tuple): Bias values at the start of chunks c and c+1, computed when None
+        raw (bool): Return int32 counts instead of [unit]
+    Returns:
+        ndarray: (chunk, 3) samples
+    """
+    bounds = bounds or _Boundaries(model, seed, chunk)(c)
+    rng = _rng(seed, _CHUNK, c)
+    walk, markov = _bias_paths(model, rng, chunk, *bounds)
+
+    t = (c*chunk + np.arange(chunk)) / model.update_rate
+    value = walk + markov + static_bias(model, seed)
+    value += rng.normal(0, model.noise_density*sqrt(model.update_rate), (chunk, 3))
+    if truth is not None:
+        value += truth(t)
+
+    # Output stage: quantise to counts and saturate
+    counts = np.clip(np.rint(value * model.sensitivity), -model.sat_limit, model.sat_limit).astype(np.int32)
+    return counts if raw else counts / model.sensitivity
+
+def _generate(args):
+    return generate_chunk(*args)
+
+def sensor_stream(model, n_samples, truth=None, seed=0, chunk=chunk, raw=False, workers=1):
+    """
+    Lazily yield the first n_samples of a sensor stream in (chunk, 3) pieces
+    (the last one shorter). Chunks are generated workers at a time in parallel
+    when workers > 1; the output is the same either way.
+    """
+    n_chunks = -(-n_samples // chunk)
+    boundaries = _Boundaries(model, seed, chunk)
+
+    def jobs(start, stop):
+        return [(model, c, truth, seed, chunk, boundaries(c), raw) for c in range(start, stop)]
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        step = max(workers, 1)
+        for start in range(0, n_chunks, step):
+            batch = jobs(start, min(start + step, n_chunks))
+            for c, samples in zip(range(start, n_chunks), pool.map(_generate, batch) if pool else map(_generate, batch)):
+                yield samples[:n_samples - c*chunk]
+    finally:
+        if pool:
+            pool.shutdown()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Write a synthetic gyro or magnetometer log")
+    parser.add_argument("sensor", choices=sorted(SENSORS))
+    parser.add_argument("path", help="Output .npy file, (n, 3) in deg/s or uT (int32 counts with --raw)")
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--raw", action="store_true", help="Write sensor counts")
+    parser.add_argument("--workers", type=int, default=1, help="Chunks generated in parallel")
+    args = parser.parse_args()
+
+    model = SENSORS[args.sensor]
+    n = int(args.hours * 3600 * model.update_rate)
+    log = np.lib.format.open_memmap(args.path, mode='w+', dtype=np.int32 if args.raw else np.float64, shape=(n, 3))
+    row = 0
+    for samples in sensor_stream(model, n, seed=args.seed, raw=args.raw, workers=args.workers):
+        log[row:row + len(samples)] = samples
+        row += len(samples)
+    log.flush()
+    print(f"{n} {args.sensor} samples ({args.hours:g} h at {model.update_rate:g} Hz) written to {args.path}")